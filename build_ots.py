@@ -14,6 +14,10 @@ from pathlib import Path
 ROOT = Path(__file__).parent.resolve()
 BUILD_ROOT = ROOT / "src" / "ots" / "build"
 BUILD_DIR = BUILD_ROOT / "meson"
+# where the profiles of a PGO training run are written to, and read from
+PGO_DIR = BUILD_ROOT / "pgo"
+# the options the static libs in BUILD_DIR were configured with
+STAMP_FILE = BUILD_DIR / "pyots-build-options.txt"
 SRC_DIR = ROOT / "src"
 OTS_SRC_DIR = SRC_DIR / "ots"
 SUB_DIR = OTS_SRC_DIR / "subprojects"
@@ -56,6 +60,17 @@ MESON_CMD = [
 
 MESON_COMPILE_CMD = [TOOLS["meson"], "compile", "-C", str(BUILD_DIR)]
 
+# compiler and linker flags for the two passes of profile-guided
+# optimization: instrument the code, then optimize it with the profiles that
+# training the instrumented build wrote. Clang writes raw profiles, which
+# have to be merged (to PGO_DIR/default.profdata) before they can be used;
+# -fprofile-correction (ignored by clang) makes GCC put up with the counts of
+# code run from several threads.
+PGO_FLAGS = {
+    "generate": [f"-fprofile-generate={PGO_DIR}"],
+    "use": [f"-fprofile-use={PGO_DIR}", "-fprofile-correction", "-Wno-missing-profile"],
+}
+
 
 class ExecutableNotFound(FileNotFoundError):
     def __init__(self, name, path):
@@ -69,12 +84,50 @@ def check_tools():
             raise ExecutableNotFound(name, path)
 
 
-def configure(reconfigure=False):
-    print(f"build_ots.py: Running {' '.join(MESON_CMD)}")
+def build_options(lto=False, pgo=None):
+    """
+    Return the extra meson options, and the environment to run meson with,
+    for building the static libs with link-time optimization ('lto') and/or
+    for a pass of profile-guided optimization ('pgo': "generate" or "use").
+    """
+    options = []
+    env = dict(os.environ)
+    if lto:
+        options.append("-Db_lto=true")
+    if pgo:
+        if sys.platform == "win32":
+            raise ValueError("profile-guided optimization is not supported with MSVC")
+        # meson only reads the flags from the environment when the build dir
+        # is set up (see configure())
+        flags = " ".join(PGO_FLAGS[pgo])
+        for var in ("CFLAGS", "CXXFLAGS", "LDFLAGS"):
+            env[var] = f"{env.get(var, '')} {flags}".strip()
+    return options, env
+
+
+def configure(reconfigure=False, lto=False, pgo=None):
+    options, env = build_options(lto=lto, pgo=pgo)
+    cmd = MESON_CMD[:-2] + options + MESON_CMD[-2:]
+
+    # start over if the libs were built with other options: meson doesn't
+    # pick up changes to the flags from the environment on its own. A build
+    # dir without a stamp (set up before there were stamps, or by hand) was
+    # set up with options we can't know, so it is started over too.
+    stamp = " ".join(cmd + [env.get(var, "") for var in ("CFLAGS", "CXXFLAGS", "LDFLAGS")])
+    if STAMP_FILE.exists():
+        changed = STAMP_FILE.read_text() != stamp
+    else:
+        changed = (BUILD_DIR / "build.ninja").exists()
+    if changed:
+        print(f"build_ots.py: Build options changed, removing {BUILD_DIR}")
+        shutil.rmtree(BUILD_DIR)
+
+    print(f"build_ots.py: Running {' '.join(cmd)}")
     if not (BUILD_DIR / "build.ninja").exists():
-        subprocess.run(MESON_CMD, check=True, env=os.environ)
+        subprocess.run(cmd, check=True, env=env)
     elif reconfigure:
-        subprocess.run(MESON_CMD + ["--reconfigure"], check=True, env=os.environ)
+        subprocess.run(cmd + ["--reconfigure"], check=True, env=env)
+    STAMP_FILE.write_text(stamp)
 
 
 def make(*targets, clean=False):
@@ -92,13 +145,19 @@ def make(*targets, clean=False):
 def main(args=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--force", action="store_true")
+    parser.add_argument("--lto", action="store_true", help="enable link-time optimization")
+    parser.add_argument(
+        "--pgo",
+        choices=sorted(PGO_FLAGS),
+        help="build for the given pass of profile-guided optimization",
+    )
     parser.add_argument("targets", nargs="*")
     options = parser.parse_args(args)
 
     check_tools()
 
     try:
-        configure(reconfigure=options.force)
+        configure(reconfigure=options.force, lto=options.lto, pgo=options.pgo)
 
         make(*options.targets, clean=options.force)
     except subprocess.CalledProcessError as e:
@@ -31,6 +31,7 @@ SRC_DIR = ROOT / "src"
 OTS_SRC_DIR = SRC_DIR / "ots"
 
 BUILD_DIR = OTS_SRC_DIR / "build" / "meson"
+PGO_DIR = OTS_SRC_DIR / "build" / "pgo"
 BUILD_SUB_DIR = BUILD_DIR / "subprojects"
 SRC_SUB_DIR = OTS_SRC_DIR / "subprojects"
 
@@ -45,6 +46,33 @@ WOFF2_TAG = "1.0.2"
 
 IS_WINDOWS = sys.platform == "win32"
 
+# Opt-in optimized builds, chosen with the PYOTS_BUILD_PROFILE environment
+# variable (so it works through pip and cibuildwheel too):
+#   default  the flags of meson's release build type and of setuptools
+#   lto      link-time optimization across the ots, brotli and lz4 static
+#            libs, the woff2 sources and the bindings
+#   pgo      lto, plus profile-guided optimization: everything is built
+#            instrumented first, trained by sanitizing the OTS test fonts,
+#            and built again with the resulting profiles (GCC or clang only)
+BUILD_PROFILES = ("default", "lto", "pgo")
+BUILD_PROFILE = os.environ.get("PYOTS_BUILD_PROFILE", "default") or "default"
+
+# sanitizes the OTS test fonts with the instrumented extension, for PGO
+TRAINING_SCRIPT = """
+import sys
+from pathlib import Path
+import pyots
+
+fonts = [f for f in sorted(Path(sys.argv[1]).rglob("*")) if f.is_file()]
+if not fonts:
+    sys.exit(f"no fonts to train with in {sys.argv[1]}")
+for _ in range(3):
+    for f in fonts:
+        pyots.sanitize(f, quiet=True)
+        pyots.sanitize_bytes(f.read_bytes(), quiet=True, mode="validate")
+    pyots.sanitize_many(fonts, quiet=True)
+"""
+
 
 def _find_static_lib(search_dir, base):
     """
@@ -105,6 +133,19 @@ def _get_extra_objects():
     return [str(p.relative_to(ROOT)) for p in xo]
 
 
+def _get_brotli_encoder_sources():
+    """
+    The sources of the brotli encoder, which the woff2 encoder needs. ots only
+    builds the decoder, so they are compiled as part of the Extension (as C,
+    see BuildExt), along with the common sources (the brotli_common lib ots
+    builds only has what the decoder needs). They are only there once meson
+    has downloaded brotli.
+    """
+    brotli_dir = SRC_SUB_DIR / f"brotli-{BROTLI_TAG}" / "c"
+    sp = sorted((brotli_dir / "common").glob("*.c")) + sorted((brotli_dir / "enc").glob("*.c"))
+    return [str(p.relative_to(ROOT)) for p in sp]
+
+
 def _get_include_dirs():
     """
     Create the list of 'include_dirs' for building the Extension.
@@ -127,6 +168,57 @@ def _get_include_dirs():
     return [str(p.relative_to(ROOT)) for p in ip]
 
 
+def _get_zlib_include_dirs():
+    """
+    The 'include_dirs' for zlib, which the bindings use to decompress WOFF
+    tables to compare them with the sanitized ones. On Windows the headers
+    come with the subproject meson fetches (zconf.h may be generated in its
+    build dir), so, like the static libs, they are only found once
+    build_ots.py has run; elsewhere the system's are used.
+    """
+    if not IS_WINDOWS:
+        return []
+    src_dirs = sorted(SRC_SUB_DIR.glob("zlib-*"))
+    if not src_dirs or not (src_dirs[-1] / "zlib.h").exists():
+        raise FileNotFoundError(f"could not find the zlib headers under {SRC_SUB_DIR}")
+    ip = src_dirs[-1:] + sorted(BUILD_SUB_DIR.glob("zlib-*"))[-1:]
+    return [str(p.relative_to(ROOT)) for p in ip]
+
+
+def _get_build_flags(pgo=None):
+    """
+    Return the (compile, link) flags to build the Extension with, for the
+    BUILD_PROFILE and the pass of profile-guided optimization 'pgo'
+    ("generate" or "use"). The flags for PGO are the same as build_ots.py's.
+    """
+    compile_args = []
+    link_args = []
+    if BUILD_PROFILE in ("lto", "pgo"):
+        if IS_WINDOWS:
+            compile_args.append("/GL")
+            link_args.append("/LTCG")
+        else:
+            compile_args.append("-flto")
+            link_args.append("-flto")
+    if pgo == "generate":
+        compile_args.append(f"-fprofile-generate={PGO_DIR}")
+        link_args.append(f"-fprofile-generate={PGO_DIR}")
+    elif pgo == "use":
+        flags = [f"-fprofile-use={PGO_DIR}", "-fprofile-correction", "-Wno-missing-profile"]
+        compile_args.extend(flags)
+        link_args.extend(flags)
+    return compile_args, link_args
+
+
+def _build_static_libs(pgo=None):
+    cmd = [PY, "build_ots.py"]
+    if BUILD_PROFILE in ("lto", "pgo"):
+        cmd.append("--lto")
+    if pgo:
+        cmd.append(f"--pgo={pgo}")
+    subprocess.check_call(cmd)
+
+
 def _get_sources():
     """
     Create the list of 'sources' for building the Extension.
@@ -142,6 +234,13 @@ def _get_sources():
     sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "woff2_dec.cc")
     sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "woff2_out.cc")
 
+    # woff2 encoder sources, for output_format="woff2"
+    sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "font.cc")
+    sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "glyph.cc")
+    sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "normalize.cc")
+    sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "transform.cc")
+    sp.append(SRC_SUB_DIR / f"woff2-{WOFF2_TAG}" / "src" / "woff2_enc.cc")
+
     return [str(p.relative_to(ROOT)) for p in sp]
 
 
@@ -154,8 +253,8 @@ class BuildStaticLibs(Command):
     user_options: ClassVar[list] = []
 
     def run(self):
-        cmd = [PY, "build_ots.py"]
-        subprocess.check_call(cmd)
+        # the first pass of a PGO build is the instrumented one
+        _build_static_libs(pgo="generate" if BUILD_PROFILE == "pgo" else None)
 
     def initialize_options(self):
         pass
@@ -176,17 +275,72 @@ class BuildPy(build_py.build_py):
 
 class BuildExt(build_ext):
     """
-    Custom build_ext that resolves the static libs to link against at build
-    time. This must be deferred until here (rather than when the Extension is
-    constructed at module load) because the libs don't exist on disk until
-    build_ots.py has compiled them.
+    Custom build_ext that resolves the static libs to link against (and, on
+    Windows, the zlib headers) at build time. This must be deferred until here
+    (rather than when the Extension is constructed at module load) because
+    they don't exist on disk until build_ots.py has fetched and compiled them.
+    For a PGO build, it also runs the training and builds everything again
+    with the profiles.
     """
 
     def run(self):
+        if BUILD_PROFILE != "pgo":
+            self._build(_get_build_flags())
+            return
+
+        log.info("building instrumented extension for profile-guided optimization")
+        if PGO_DIR.exists():
+            shutil.rmtree(PGO_DIR)
+        _build_static_libs(pgo="generate")
+        self._build(_get_build_flags(pgo="generate"))
+        self._train()
+
+        log.info("building extension with the training profiles")
+        _build_static_libs(pgo="use")
+        self.force = True
+        self._build(_get_build_flags(pgo="use"))
+
+    def build_extension(self, ext):
+        # the brotli encoder is C, so it is compiled on its own, without the
+        # C++ flags. Its objects come before the static libs, so the brotli
+        # decoder links against the same common code, which the linker then
+        # doesn't take from brotli_common again.
+        objects = self.compiler.compile(
+            _get_brotli_encoder_sources(),
+            output_dir=self.build_temp,
+            include_dirs=[str((SRC_SUB_DIR / f"brotli-{BROTLI_TAG}" / "c" / "include").relative_to(ROOT))],
+            extra_postargs=[arg for arg in ext.extra_compile_args if arg not in extra_compile_args],
+            debug=self.debug,
+            depends=ext.depends,
+        )
+        ext.extra_objects = objects + _get_extra_objects()
+        ext.include_dirs = _get_include_dirs() + _get_zlib_include_dirs()
+        build_ext.build_extension(self, ext)
+
+    def _build(self, flags):
+        compile_args, link_args = flags
         for ext in self.extensions:
-            ext.extra_objects = _get_extra_objects()
+            ext.extra_compile_args = extra_compile_args + compile_args
+            ext.extra_link_args = link_args
         build_ext.run(self)
 
+    def _train(self):
+        fonts_dir = OTS_SRC_DIR / "tests" / "fonts"
+        if not fonts_dir.is_dir():
+            raise SetupError(f"can't train for profile-guided optimization: {fonts_dir} is missing")
+        ext_dir = Path(self.get_ext_fullpath(self.extensions[0].name)).parent
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(ext_dir), str(SRC_DIR)]))
+        log.info(f"training with the fonts in {fonts_dir}")
+        subprocess.check_call([PY, "-c", TRAINING_SCRIPT, str(fonts_dir)], env=env)
+
+        # clang writes raw profiles, to merge into the one it reads
+        raw = sorted(PGO_DIR.glob("*.profraw"))
+        if raw:
+            llvm_profdata = os.environ.get("LLVM_PROFDATA", "llvm-profdata")
+            subprocess.check_call(
+                [llvm_profdata, "merge", f"-output={PGO_DIR / 'default.profdata'}", *map(str, raw)]
+            )
+
 
 class CustomEggInfo(egg_info):
     def run(self):
@@ -324,10 +478,17 @@ else:
     extra_compile_args = ["-fPIC", "-std=c++11"]
     libraries = ["z"]
 
+if BUILD_PROFILE not in BUILD_PROFILES:
+    raise SetupError(f"PYOTS_BUILD_PROFILE must be one of {', '.join(BUILD_PROFILES)}, not '{BUILD_PROFILE}'")
+if BUILD_PROFILE == "pgo" and IS_WINDOWS:
+    raise SetupError("PYOTS_BUILD_PROFILE=pgo is not supported with MSVC")
+
 pyots_mod = Extension(
     name="_pyots",
     libraries=libraries,
     extra_compile_args=extra_compile_args,
+    # tell the module which profile it was built with (_pyots.build_profile)
+    define_macros=[("PYOTS_BUILD_PROFILE_" + BUILD_PROFILE.upper(), None)],
     # extra_objects is populated at build time by BuildExt, once build_ots.py has
     # compiled the static libs
     include_dirs=_get_include_dirs(),
@@ -3,137 +3,1192 @@
 // found in the LICENSE file.
 
 #include <algorithm>
-#include <fstream>
-#include <iostream>
+#include <climits>
+#include <cstdio>
+#include <cstring>
+#include <memory>
+#include <mutex>  // NOLINT(build/c++11)
+#include <new>
 #include <string>
 #include <vector>
-#include <memory>
 
 #include "Python.h"
 
 #include "config.h"
-#include "ots-memory-stream.h"
-#include "pyots-context.h"
+#include "pyots-inspect.h"
+#include "pyots-job.h"
+
+
+/* The optimizations the module was built with (see PYOTS_BUILD_PROFILE in
+   setup.py) */
+#if defined(PYOTS_BUILD_PROFILE_PGO)
+#define BUILD_PROFILE "pgo"
+#elif defined(PYOTS_BUILD_PROFILE_LTO)
+#define BUILD_PROFILE "lto"
+#else
+#define BUILD_PROFILE "default"
+#endif
+
+
+/* The module's state: the types and exceptions it defines. Each
+   (sub)interpreter that imports the module gets its own. */
+typedef struct {
+  PyTypeObject* output_buffer_type;
+  PyTypeObject* sanitizer_type;
+  PyObject* memory_limit_error;
+} ModuleState;
+
+
+static ModuleState* get_module_state(PyObject* module) {
+  return static_cast<ModuleState*>(PyModule_GetState(module));
+}
+
+
+/* Build the messages of |job| as a tuple of (level, tag, text, count) tuples;
+   tag is None for messages that aren't about a particular table, count the
+   number of times OTS emitted the message. */
+static PyObject* build_messages(const ots::PyOTSJob &job) {
+  PyObject* messages = PyTuple_New(job.messages.size());
+  if (!messages) {
+    return NULL;
+  }
+  for (size_t i = 0; i < job.messages.size(); i++) {
+    const ots::PyOTSMessage &message = job.messages[i];
+    PyObject* tag;
+    if (message.tag) {
+      char chars[4] = {OTS_UNTAG(message.tag)};
+      tag = PyUnicode_FromStringAndSize(chars, 4);
+    } else {
+      tag = Py_NewRef(Py_None);
+    }
+    PyObject* text = PyUnicode_DecodeASCII(message.text.data(),
+                                           message.text.size(),
+                                           "backslashreplace");
+    PyObject* item = (tag && text)
+                     ? Py_BuildValue("iOOn", message.level, tag, text,
+                                     static_cast<Py_ssize_t>(message.count))
+                     : NULL;
+    Py_XDECREF(tag);
+    Py_XDECREF(text);
+    if (!item) {
+      Py_DECREF(messages);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(messages, i, item);
+  }
+  return messages;
+}
+
+
+static PyObject* build_result(const ots::PyOTSJob &job);
+
+
+/* Build the results of the fonts of a collection that were sanitized
+   separately, as a tuple with a result tuple for each. */
+static PyObject* build_members(const ots::PyOTSJob &job) {
+  PyObject* members = PyTuple_New(job.members->size());
+  if (!members) {
+    return NULL;
+  }
+  for (size_t i = 0; i < job.members->size(); i++) {
+    PyObject* member = build_result((*job.members)[i]);
+    if (!member) {
+      Py_DECREF(members);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(members, i, member);
+  }
+  return members;
+}
+
+
+/* Build the timings of a profiled job as a tuple of (tag, parse, serialize,
+   bytes_in, bytes_out) tuples; tag is None for the font as a whole. */
+static PyObject* build_timings(const ots::PyOTSJob &job) {
+  PyObject* timings = PyTuple_New(job.timings.size());
+  if (!timings) {
+    return NULL;
+  }
+  for (size_t i = 0; i < job.timings.size(); i++) {
+    const ots::PyOTSTableTiming &timing = job.timings[i];
+    PyObject* tag;
+    if (timing.tag) {
+      char chars[4] = {OTS_UNTAG(timing.tag)};
+      tag = PyUnicode_DecodeASCII(chars, 4, "backslashreplace");
+    } else {
+      tag = Py_NewRef(Py_None);
+    }
+    PyObject* item = tag ? Py_BuildValue(
+                             "Nddnn", tag, timing.parse, timing.serialize,
+                             static_cast<Py_ssize_t>(timing.bytes_in),
+                             static_cast<Py_ssize_t>(timing.bytes_out))
+                         : NULL;
+    if (!item) {
+      Py_DECREF(timings);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(timings, i, item);
+  }
+  return timings;
+}
+
+
+/* Build what inspecting a font found as a tuple of (format, length,
+   sfnt_length, faces); each face is a tuple of (flavor, tables), each table
+   a tuple of (tag, offset, length, stored_length), offset being None for
+   WOFF2. */
+static PyObject* build_font_info(const ots::PyOTSFontInfo &info,
+                                 size_t length) {
+  PyObject* faces = PyTuple_New(info.faces.size());
+  if (!faces) {
+    return NULL;
+  }
+  for (size_t i = 0; i < info.faces.size(); i++) {
+    const ots::PyOTSFaceInfo &face = info.faces[i];
+    PyObject* tables = PyTuple_New(face.tables.size());
+    if (!tables) {
+      Py_DECREF(faces);
+      return NULL;
+    }
+    for (size_t j = 0; j < face.tables.size(); j++) {
+      const ots::PyOTSTableInfo &table = face.tables[j];
+      char chars[4] = {OTS_UNTAG(table.tag)};
+      PyObject* tag = PyUnicode_DecodeASCII(chars, 4, "backslashreplace");
+      PyObject* offset = info.format == ots::FORMAT_WOFF2
+                         ? Py_NewRef(Py_None)
+                         : PyLong_FromUnsignedLong(table.offset);
+      PyObject* item = (tag && offset)
+                       ? Py_BuildValue("OOII", tag, offset, table.length,
+                                       table.stored_length)
+                       : NULL;
+      Py_XDECREF(tag);
+      Py_XDECREF(offset);
+      if (!item) {
+        Py_DECREF(tables);
+        Py_DECREF(faces);
+        return NULL;
+      }
+      PyTuple_SET_ITEM(tables, j, item);
+    }
+    PyObject* item = Py_BuildValue("IN", face.flavor, tables);
+    if (!item) {
+      Py_DECREF(faces);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(faces, i, item);
+  }
+  return Py_BuildValue("inKN", static_cast<int>(info.format),
+                       static_cast<Py_ssize_t>(length),
+                       static_cast<unsigned long long>(  // NOLINT
+                         info.sfnt_length),
+                       faces);
+}
+
+
+/* Build the tags of the tables sanitizing changed as a tuple of strings. */
+static PyObject* build_changed_tables(const ots::PyOTSJob &job) {
+  PyObject* tags = PyTuple_New(job.changed_tables.size());
+  if (!tags) {
+    return NULL;
+  }
+  for (size_t i = 0; i < job.changed_tables.size(); i++) {
+    char chars[4] = {OTS_UNTAG(job.changed_tables[i])};
+    PyObject* tag = PyUnicode_DecodeASCII(chars, 4, "backslashreplace");
+    if (!tag) {
+      Py_DECREF(tags);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(tags, i, tag);
+  }
+  return tags;
+}
+
+
+/* Build the tuple handed back to the Python layer: (sanitized, modified,
+   messages), with the sanitized font data appended if the job kept it. If
+   the fonts of a collection were sanitized separately, their results are
+   appended too, then the timings if the job was profiled, the tables
+   sanitizing changed if the sanitized font was compared with the input, and
+   the number of messages left out if there were any; fields that come
+   before one that is there are None if they aren't. */
+static PyObject* build_result(const ots::PyOTSJob &job) {
+  Py_ssize_t size = 3;
+  if (job.omitted_messages) {
+    size = 8;
+  } else if (job.compared && job.sanitized) {
+    size = 7;
+  } else if (job.profile) {
+    size = 6;
+  } else if (job.members) {
+    size = 5;
+  } else if (job.keep_output) {
+    size = 4;
+  }
+
+  PyObject* retTuple = PyTuple_New(size);
+  if (!retTuple) {
+    return NULL;
+  }
+  PyTuple_SET_ITEM(retTuple, 0, PyBool_FromLong(job.sanitized));
+  PyTuple_SET_ITEM(retTuple, 1,
+                   PyBool_FromLong(job.modified && job.sanitized));
+
+  PyObject* item = build_messages(job);
+  if (!item) {
+    Py_DECREF(retTuple);
+    return NULL;
+  }
+  PyTuple_SET_ITEM(retTuple, 2, item);
+
+  if (size > 3) {
+    /* only hand back output for fonts that were successfully sanitized; OTS
+       may have written partial output before failing */
+    if (job.keep_output && job.sanitized && job.output) {
+      item = PyBytes_FromStringAndSize(
+        static_cast<const char *>(job.output->get()), job.output->Tell());
+    } else {
+      item = Py_NewRef(Py_None);
+    }
+    if (!item) {
+      Py_DECREF(retTuple);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(retTuple, 3, item);
+  }
+
+  if (size > 4) {
+    item = job.members ? build_members(job) : Py_NewRef(Py_None);
+    if (!item) {
+      Py_DECREF(retTuple);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(retTuple, 4, item);
+  }
+
+  if (size > 5) {
+    item = job.profile ? build_timings(job) : Py_NewRef(Py_None);
+    if (!item) {
+      Py_DECREF(retTuple);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(retTuple, 5, item);
+  }
+
+  if (size > 6) {
+    item = job.compared && job.sanitized ? build_changed_tables(job)
+                                         : Py_NewRef(Py_None);
+    if (!item) {
+      Py_DECREF(retTuple);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(retTuple, 6, item);
+  }
+
+  if (size > 7) {
+    item = PyLong_FromSize_t(job.omitted_messages);
+    if (!item) {
+      Py_DECREF(retTuple);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(retTuple, 7, item);
+  }
+
+  return retTuple;
+}
+
+
+/* Converter (for "O&") from the table actions handed over by the Python
+   layer, a sequence of (tag, action) pairs (or None for the defaults), to
+   |*actions|, a ots::PyOTSTableActions. */
+static int convert_table_actions(PyObject* obj, void* address) {
+  ots::PyOTSTableActions* actions =
+    static_cast<ots::PyOTSTableActions*>(address);
+  if (obj == Py_None) {
+    return 1;
+  }
+
+  PyObject* items = PySequence_Fast(obj, "table_actions must be a sequence");
+  if (!items) {
+    return 0;
+  }
+  for (Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(items); i++) {
+    const char* tag;
+    const char* name;
+    if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(items, i), "ss", &tag,
+                          &name)) {
+      Py_DECREF(items);
+      return 0;
+    }
+
+    ots::TableAction action;
+    if (!std::strcmp(name, "sanitize")) {
+      action = ots::TABLE_ACTION_DEFAULT;
+    } else if (!std::strcmp(name, "passthrough")) {
+      action = ots::TABLE_ACTION_PASSTHRU;
+    } else if (!std::strcmp(name, "drop")) {
+      action = ots::TABLE_ACTION_DROP;
+    } else {
+      PyErr_Format(PyExc_ValueError, "invalid table action: '%s'", name);
+      Py_DECREF(items);
+      return 0;
+    }
+    if (std::strlen(tag) != 4) {
+      PyErr_Format(PyExc_ValueError, "invalid table tag: '%s'", tag);
+      Py_DECREF(items);
+      return 0;
+    }
+    const uint32_t table = OTS_TAG(tag[0], tag[1], tag[2], tag[3]);
+    if (action != ots::TABLE_ACTION_DEFAULT &&
+        ots::PyOTSTableActions::Required(table)) {
+      PyErr_Format(PyExc_ValueError, "table '%s' is required, it can only "
+                   "be sanitized", tag);
+      Py_DECREF(items);
+      return 0;
+    }
+    actions->Set(table, action);
+  }
+
+  Py_DECREF(items);
+  return 1;
+}
+
+
+/* Create (but don't raise) the exception describing a failed job. */
+static PyObject* build_error(ModuleState* state, const ots::PyOTSJob &job,
+                             PyObject* pyInFilenameObj,
+                             PyObject* pyOutFilenameObj) {
+  if (job.error == ots::JOB_NO_MEMORY) {
+    return PyObject_CallNoArgs(PyExc_MemoryError);
+  }
+  if (job.error == ots::JOB_TIMEOUT) {
+    char message[64];
+    snprintf(message, sizeof(message),
+             "sanitizing took longer than %g seconds", job.timeout);
+    return PyObject_CallFunction(PyExc_TimeoutError, "s", message);
+  }
+  if (job.error == ots::JOB_MEMORY_LIMIT) {
+    return PyObject_CallFunction(
+      state->memory_limit_error, "N",
+      PyUnicode_FromFormat("sanitizing needs more than %zd bytes",
+                           static_cast<Py_ssize_t>(job.max_memory)));
+  }
+
+  PyObject* filename = job.error == ots::JOB_READ_ERROR ? pyInFilenameObj
+                                                        : pyOutFilenameObj;
+  return PyObject_CallFunction(PyExc_OSError, "isO", job.error_number,
+                               strerror(job.error_number), filename);
+}
+
+
+/* Raise the exception describing a failed job. Always returns NULL. */
+static PyObject* raise_error(ModuleState* state, const ots::PyOTSJob &job,
+                             PyObject* pyInFilenameObj,
+                             PyObject* pyOutFilenameObj) {
+  PyObject* exc = build_error(state, job, pyInFilenameObj, pyOutFilenameObj);
+  if (exc) {
+    PyErr_SetObject(PyExceptionInstance_Class(exc), exc);
+    Py_DECREF(exc);
+  }
+  return NULL;
+}
+
+
+/* A read-only bytes-like object owning a sanitized font taken over from a
+   job's output stream. It lets file objects be handed the font as a
+   memoryview without copying it; the font is freed with the last view of
+   it, however long the file object holds on to it. */
+typedef struct {
+  PyObject_HEAD
+  uint8_t* data;
+  Py_ssize_t length;
+} OutputBufferObject;
+
+static int output_buffer_getbuffer(PyObject* self, Py_buffer* view,
+                                   int flags) {
+  OutputBufferObject* buffer = reinterpret_cast<OutputBufferObject*>(self);
+  return PyBuffer_FillInfo(view, self, buffer->data, buffer->length, 1,
+                           flags);
+}
+
+
+static void output_buffer_dealloc(PyObject* self) {
+  PyTypeObject* type = Py_TYPE(self);
+  delete[] reinterpret_cast<OutputBufferObject*>(self)->data;
+  type->tp_free(self);
+  Py_DECREF(type);
+}
+
+
+static PyType_Slot output_buffer_slots[] = {
+    {Py_bf_getbuffer, reinterpret_cast<void*>(output_buffer_getbuffer)},
+    {Py_tp_dealloc, reinterpret_cast<void*>(output_buffer_dealloc)},
+    {0, NULL},
+};
+
+
+static PyType_Spec output_buffer_spec = {
+    "_pyots._OutputBuffer",
+    sizeof(OutputBufferObject),
+    0,
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_IMMUTABLETYPE |
+    Py_TPFLAGS_DISALLOW_INSTANTIATION,
+    output_buffer_slots,
+};
+
+
+/* Write the sanitized font kept by |job| to the Python file object |file|,
+   handing it to file.write() as a memoryview rather than as a copy. Returns
+   0 on success, or -1 with an exception set. */
+static int write_file_object(ModuleState* state, PyObject* file,
+                             ots::PyOTSJob* job) {
+  Py_ssize_t length = static_cast<Py_ssize_t>(job->output->Tell());
+
+  OutputBufferObject* buffer = PyObject_New(OutputBufferObject,
+                                            state->output_buffer_type);
+  if (!buffer) {
+    return -1;
+  }
+  buffer->data = job->output->Release();
+  buffer->length = length;
+  job->output.reset();
+
+  PyObject* view = PyMemoryView_FromObject(
+    reinterpret_cast<PyObject*>(buffer));
+  Py_DECREF(buffer);
+  if (!view) {
+    return -1;
+  }
+
+  Py_ssize_t offset = 0;
+  while (offset < length) {
+    PyObject* chunk = offset ? PySequence_GetSlice(view, offset, length)
+                             : Py_NewRef(view);
+    if (!chunk) {
+      break;
+    }
+    PyObject* written = PyObject_CallMethod(file, "write", "O", chunk);
+    Py_DECREF(chunk);
+    if (!written) {
+      break;
+    }
+
+    /* raw (unbuffered) files may write less than asked for; writers that
+       return None are taken to have written everything */
+    Py_ssize_t count = length - offset;
+    if (written != Py_None) {
+      count = PyNumber_AsSsize_t(written, PyExc_OverflowError);
+    }
+    Py_DECREF(written);
+    if (count == -1 && PyErr_Occurred()) {
+      break;
+    }
+    if (count <= 0 || count > length - offset) {
+      PyErr_Format(PyExc_OSError,
+                   "write() returned %zd, expected up to %zd bytes written",
+                   count, length - offset);
+      break;
+    }
+    offset += count;
+  }
+
+  Py_DECREF(view);
+  return offset == length ? 0 : -1;
+}
+
+
+/* Run |job| on the font file |pyInFilenameObj| (a bytes path, whose reference
+   is taken over), writing the sanitized font to |pyOutput|: None, a path, an
+   open file descriptor, or an object with a write() method. Returns the
+   result tuple, or NULL with an exception set. */
+static PyObject* run_file_job(ModuleState* state, ots::PyOTSJob* job,
+                              PyObject* pyInFilenameObj, PyObject* pyOutput) {
+  PyObject* pyOutFilenameObj = NULL;
+  PyObject* pyOutFile = NULL;
+
+  job->in_filename.assign(PyBytes_AS_STRING(pyInFilenameObj),
+                          PyBytes_GET_SIZE(pyInFilenameObj));
+
+  /* the output can be a path, an open file descriptor, or an object with a
+     write() method */
+  if (pyOutput == Py_None || pyOutput == Py_False) {
+    pyOutFilenameObj = Py_NewRef(Py_None);
+  } else if (job->validate) {
+    PyErr_SetString(PyExc_ValueError, "validating doesn't write any output");
+    Py_DECREF(pyInFilenameObj);
+    return NULL;
+  } else if (PyLong_Check(pyOutput) && !PyBool_Check(pyOutput)) {
+    long fd = PyLong_AsLong(pyOutput);  // NOLINT(runtime/int)
+    if (fd < 0 || fd > INT_MAX) {
+      if (!PyErr_Occurred()) {
+        PyErr_SetString(PyExc_ValueError, "invalid output file descriptor");
+      }
+      Py_DECREF(pyInFilenameObj);
+      return NULL;
+    }
+    job->out_fd = static_cast<int>(fd);
+    pyOutFilenameObj = Py_NewRef(pyOutput);
+  } else if (!PyUnicode_Check(pyOutput) && !PyBytes_Check(pyOutput) &&
+             PyObject_HasAttrString(pyOutput, "write")) {
+    pyOutFile = pyOutput;
+    pyOutFilenameObj = Py_NewRef(pyOutput);
+    job->keep_output = true;
+  } else {
+    if (!PyUnicode_FSConverter(pyOutput, &pyOutFilenameObj)) {
+      Py_DECREF(pyInFilenameObj);
+      return NULL;
+    }
+    job->out_filename.assign(PyBytes_AS_STRING(pyOutFilenameObj),
+                             PyBytes_GET_SIZE(pyOutFilenameObj));
+  }
+
+  /* Reading the input, sanitizing and writing the output is all plain C++
+     (OTS reports back through our context), so let other Python threads
+     run while we work. */
+  Py_BEGIN_ALLOW_THREADS
+  ots::RunJob(job);
+  Py_END_ALLOW_THREADS
+
+  PyObject* retTuple = NULL;
+  if (job->error != ots::JOB_OK) {
+    retTuple = raise_error(state, *job, pyInFilenameObj, pyOutFilenameObj);
+  } else if (pyOutFile && job->output &&
+             write_file_object(state, pyOutFile, job) < 0) {
+    retTuple = NULL;
+  } else {
+    /* the font went to the file object; it isn't returned */
+    job->keep_output = false;
+    retTuple = build_result(*job);
+    ots::RecycleOutput(job);
+  }
+
+  Py_DECREF(pyInFilenameObj);
+  Py_DECREF(pyOutFilenameObj);
+
+  return retTuple;
+}
+
+
+/* Run |job| on the font data |in|, releasing it once done. Returns the result
+   tuple, or NULL with an exception set. */
+static PyObject* run_data_job(ModuleState* state, ots::PyOTSJob* job,
+                              Py_buffer* in) {
+  job->in_data = static_cast<const uint8_t *>(in->buf);
+  job->in_length = static_cast<size_t>(in->len);
+  job->keep_output = true;
+
+  /* The exported buffer stays valid (and can't be resized) until it is
+     released, so it can be read with the GIL released. */
+  Py_BEGIN_ALLOW_THREADS
+  ots::RunJob(job);
+  Py_END_ALLOW_THREADS
+
+  PyBuffer_Release(in);
+
+  if (job->error != ots::JOB_OK) {
+    return raise_error(state, *job, Py_None, Py_None);
+  }
+  PyObject* retTuple = build_result(*job);
+  ots::RecycleOutput(job);
+  return retTuple;
+}
 
 
 static PyObject* method_sanitize(PyObject* self, PyObject* args) {
   PyObject* pyInFilenameObj;
-  PyObject* pyOutFilenameObj;
+  PyObject* pyOutput;
   int quiet = 0;
   int kwFontIndex = -1;
+  int validate = 0;
+  Py_ssize_t workers = 0;
+  int profile = 0;
+  ots::PyOTSTableActions tableActions;
+  Py_ssize_t maxMessages = 0;
+  Py_ssize_t maxMessageBytes = 0;
+  double timeout = 0;
+  Py_ssize_t maxMemory = 0;
+  int outputFormat = ots::OUTPUT_SFNT;
 
   /* parse the Python args */
-  if (!PyArg_ParseTuple(args, "O&O&ii",
+  if (!PyArg_ParseTuple(args, "O&OiiiniO&nndni",
                         PyUnicode_FSConverter, &pyInFilenameObj,
-                        PyUnicode_FSConverter, &pyOutFilenameObj,
+                        &pyOutput,
                         &quiet,
-                        &kwFontIndex)) {
+                        &kwFontIndex,
+                        &validate,
+                        &workers,
+                        &profile,
+                        convert_table_actions, &tableActions,
+                        &maxMessages,
+                        &maxMessageBytes,
+                        &timeout,
+                        &maxMemory,
+                        &outputFormat)) {
+    return NULL;
+  }
+
+  ots::PyOTSJob job;
+  job.quiet = quiet;
+  job.font_index = kwFontIndex;
+  job.validate = validate;
+  job.workers = static_cast<size_t>(std::max<Py_ssize_t>(workers, 0));
+  job.profile = profile;
+  job.table_actions = tableActions;
+  job.max_messages = static_cast<size_t>(std::max<Py_ssize_t>(maxMessages, 0));
+  job.max_message_bytes =
+    static_cast<size_t>(std::max<Py_ssize_t>(maxMessageBytes, 0));
+  job.timeout = timeout;
+  job.max_memory = static_cast<size_t>(std::max<Py_ssize_t>(maxMemory, 0));
+  job.output_format = static_cast<ots::PyOTSOutputFormat>(outputFormat);
+
+  return run_file_job(get_module_state(self), &job, pyInFilenameObj,
+                      pyOutput);
+}
+
+
+static PyObject* method_sanitize_bytes(PyObject* self, PyObject* args) {
+  Py_buffer in;
+  int quiet = 0;
+  int kwFontIndex = -1;
+  int validate = 0;
+  Py_ssize_t workers = 0;
+  int profile = 0;
+  ots::PyOTSTableActions tableActions;
+  Py_ssize_t maxMessages = 0;
+  Py_ssize_t maxMessageBytes = 0;
+  double timeout = 0;
+  Py_ssize_t maxMemory = 0;
+  int outputFormat = ots::OUTPUT_SFNT;
+
+  /* parse the Python args; "y*" accepts any bytes-like object (bytes,
+     bytearray, memoryview, mmap, ...) and exposes it without copying */
+  if (!PyArg_ParseTuple(args, "y*iiiniO&nndni", &in, &quiet, &kwFontIndex,
+                        &validate, &workers, &profile,
+                        convert_table_actions, &tableActions,
+                        &maxMessages, &maxMessageBytes, &timeout,
+                        &maxMemory, &outputFormat)) {
+    return NULL;
+  }
+
+  ots::PyOTSJob job;
+  job.quiet = quiet;
+  job.font_index = kwFontIndex;
+  job.validate = validate;
+  job.workers = static_cast<size_t>(std::max<Py_ssize_t>(workers, 0));
+  job.profile = profile;
+  job.table_actions = tableActions;
+  job.max_messages = static_cast<size_t>(std::max<Py_ssize_t>(maxMessages, 0));
+  job.max_message_bytes =
+    static_cast<size_t>(std::max<Py_ssize_t>(maxMessageBytes, 0));
+  job.timeout = timeout;
+  job.max_memory = static_cast<size_t>(std::max<Py_ssize_t>(maxMemory, 0));
+  job.output_format = static_cast<ots::PyOTSOutputFormat>(outputFormat);
+
+  return run_data_job(get_module_state(self), &job, &in);
+}
+
+
+static PyObject* method_sanitize_many(PyObject* self, PyObject* args) {
+  PyObject* pyInputs;
+  PyObject* pyOutputs;
+  int quiet = 0;
+  int kwFontIndex = -1;
+  int validate = 0;
+  Py_ssize_t workers = 1;
+  ots::PyOTSTableActions tableActions;
+  Py_ssize_t maxMessages = 0;
+  Py_ssize_t maxMessageBytes = 0;
+  double timeout = 0;
+  Py_ssize_t maxMemory = 0;
+  int outputFormat = ots::OUTPUT_SFNT;
+
+  /* parse the Python args */
+  if (!PyArg_ParseTuple(args, "OOiiinO&nndni", &pyInputs, &pyOutputs, &quiet,
+                        &kwFontIndex, &validate, &workers,
+                        convert_table_actions, &tableActions,
+                        &maxMessages, &maxMessageBytes, &timeout,
+                        &maxMemory, &outputFormat)) {
     return NULL;
   }
 
-  /* Parse the Python input filename obj into a C string */
-  Py_ssize_t lenIn;
-  char *infilename;
-  if (PyBytes_AsStringAndSize(pyInFilenameObj, &infilename, &lenIn)) {
-    Py_XDECREF(pyInFilenameObj);
+  PyObject* inputs = PySequence_Fast(pyInputs, "inputs must be a sequence");
+  if (!inputs) {
+    return NULL;
+  }
+  PyObject* outputs = PySequence_Fast(pyOutputs, "outputs must be a sequence");
+  if (!outputs) {
+    Py_DECREF(inputs);
     return NULL;
   }
 
-  /* Open the input filestream */
-  std::ifstream ifs(infilename, std::ifstream::binary);
-  if (!ifs.good()) {
-    return PyErr_SetFromErrnoWithFilenameObject(PyExc_OSError, pyInFilenameObj);
+  Py_ssize_t count = PySequence_Fast_GET_SIZE(inputs);
+  if (PySequence_Fast_GET_SIZE(outputs) != count) {
+    PyErr_SetString(PyExc_ValueError,
+                    "inputs and outputs must have the same length");
+    Py_DECREF(inputs);
+    Py_DECREF(outputs);
+    return NULL;
   }
-  /* Read the input file */
-  std::vector<uint8_t> in((std::istreambuf_iterator<char>(ifs)),
-                          (std::istreambuf_iterator<char>()));
-  ifs.close();
 
-  /* Define our OTS context */
-  ots::PyOTSContext context(quiet ? -1: 4);
+  /* Set up all the jobs while we hold the GIL. Paths are converted to
+     filenames; anything supporting the buffer protocol is read in place, so
+     its buffer stays exported until all the jobs are done. */
+  std::vector<ots::PyOTSJob> jobs(count);
+  std::vector<Py_buffer> buffers;
+  buffers.reserve(count);
+  PyObject* retList = NULL;
+  Py_ssize_t i;
 
-  /* set up output stream */
-  ots::ExpandingMemoryStream output(in.size() * 2, in.size() * 8);
+  for (i = 0; i < count; i++) {
+    PyObject* item = PySequence_Fast_GET_ITEM(inputs, i);
+    PyObject* out = PySequence_Fast_GET_ITEM(outputs, i);
+    ots::PyOTSJob &job = jobs[i];
 
-  /* process (sanitize) */
-  bool sanitized;
-  sanitized = context.Process(&output, in.data(), in.size(), kwFontIndex);
+    job.quiet = quiet;
+    job.font_index = kwFontIndex;
+    job.validate = validate;
+    job.table_actions = tableActions;
+    job.max_messages =
+      static_cast<size_t>(std::max<Py_ssize_t>(maxMessages, 0));
+    job.max_message_bytes =
+      static_cast<size_t>(std::max<Py_ssize_t>(maxMessageBytes, 0));
+    job.timeout = timeout;
+    job.max_memory = static_cast<size_t>(std::max<Py_ssize_t>(maxMemory, 0));
+    job.output_format = static_cast<ots::PyOTSOutputFormat>(outputFormat);
 
-  /* check for file modifications */
-  // TODO(josh-hadley): figure out the right way to do this...ots seems to
-  // modify *everything*. Currently using very naive approach: basically if
-  // any WARNINGs were generated, but file was successfully sanitized, we
-  // count it as a modification. Probably need to analyze ots and look for
-  // specific messages that indicate modification and trap for those.
-  bool modified = sanitized && context.modified;
+    if (PyObject_CheckBuffer(item)) {
+      Py_buffer view;
+      if (PyObject_GetBuffer(item, &view, PyBUF_SIMPLE)) {
+        goto done;
+      }
+      buffers.push_back(view);
+      job.in_data = static_cast<const uint8_t *>(view.buf);
+      job.in_length = static_cast<size_t>(view.len);
+      job.keep_output = true;
+    } else {
+      PyObject* pyFilename;
+      if (!PyUnicode_FSConverter(item, &pyFilename)) {
+        goto done;
+      }
+      job.in_filename.assign(PyBytes_AS_STRING(pyFilename),
+                             PyBytes_GET_SIZE(pyFilename));
+      Py_DECREF(pyFilename);
+    }
 
-  /* write output, if specified */
-  if (PyObject_IsTrue(pyOutFilenameObj)) {
-    char *outfilename;
-    Py_ssize_t ofl;
-    if (PyBytes_AsStringAndSize(pyOutFilenameObj, &outfilename, &ofl)) {
-      Py_XDECREF(pyOutFilenameObj);
-      return NULL;
+    if (out != Py_None && validate) {
+      PyErr_SetString(PyExc_ValueError, "validating doesn't write any output");
+      goto done;
+    } else if (out != Py_None) {
+      PyObject* pyFilename;
+      if (!PyUnicode_FSConverter(out, &pyFilename)) {
+        goto done;
+      }
+      job.out_filename.assign(PyBytes_AS_STRING(pyFilename),
+                              PyBytes_GET_SIZE(pyFilename));
+      Py_DECREF(pyFilename);
     }
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  ots::RunJobs(&jobs, static_cast<size_t>(std::max<Py_ssize_t>(workers, 1)));
+  Py_END_ALLOW_THREADS
 
-    std::ofstream outs(outfilename, std::ofstream::out | std::ofstream::binary);
-    if (!outs.good()) {
-      return PyErr_SetFromErrnoWithFilenameObject(
-        PyExc_OSError, pyOutFilenameObj);
+  /* Hand back the results in input order; a font that could not be read or
+     written gets the exception describing the failure instead, so one bad
+     entry doesn't abort the whole batch. */
+  retList = PyList_New(count);
+  if (!retList) {
+    goto done;
+  }
+  for (i = 0; i < count; i++) {
+    PyObject* result;
+    if (jobs[i].error != ots::JOB_OK) {
+      result = build_error(get_module_state(self), jobs[i],
+                           PySequence_Fast_GET_ITEM(inputs, i),
+                           PySequence_Fast_GET_ITEM(outputs, i));
+    } else {
+      result = build_result(jobs[i]);
     }
-    outs.write(reinterpret_cast<const char*>(output.get()), output.Tell());
-    outs.close();
+    if (!result) {
+      Py_CLEAR(retList);
+      goto done;
+    }
+    PyList_SET_ITEM(retList, i, result);
   }
 
-  // Set up returns
-  PyObject* pymsgstr;
-  PyObject* pysanitized = PyBool_FromLong(sanitized);
-  PyObject* pymodified = PyBool_FromLong(modified & sanitized);
-  if (quiet) {
-    pymsgstr = Py_BuildValue("y", NULL);
+done:
+  for (auto &view : buffers) {
+    PyBuffer_Release(&view);
+  }
+  Py_DECREF(inputs);
+  Py_DECREF(outputs);
+
+  return retList;
+}
+
+
+static PyObject* method_inspect(PyObject* self, PyObject* args) {
+  PyObject* pyInput;
+  if (!PyArg_ParseTuple(args, "O", &pyInput)) {
+    return NULL;
+  }
+
+  ots::PyOTSFontInfo info;
+  std::string error;
+  bool inspected = false;
+  size_t length = 0;
+
+  if (PyObject_CheckBuffer(pyInput)) {
+    Py_buffer in;
+    if (PyObject_GetBuffer(pyInput, &in, PyBUF_SIMPLE)) {
+      return NULL;
+    }
+    length = static_cast<size_t>(in.len);
+    inspected = ots::PyOTSInspect(static_cast<const uint8_t *>(in.buf),
+                                  length, &info, &error);
+    PyBuffer_Release(&in);
   } else {
-    pymsgstr = PyBytes_FromStringAndSize(context.buff, context.offset);
+    PyObject* pyFilename;
+    if (!PyUnicode_FSConverter(pyInput, &pyFilename)) {
+      return NULL;
+    }
+    std::string filename(PyBytes_AS_STRING(pyFilename),
+                         PyBytes_GET_SIZE(pyFilename));
+    Py_DECREF(pyFilename);
+
+    /* the file is mapped, so only the pages holding the headers are read */
+    int error_number = 0;
+    Py_BEGIN_ALLOW_THREADS
+    ots::PyOTSInputFile file;
+    if (file.Open(filename, &error_number)) {
+      length = file.size();
+      inspected = ots::PyOTSInspect(file.data(), length, &info, &error);
+    }
+    Py_END_ALLOW_THREADS
+
+    if (error_number) {
+      PyObject* exc = PyObject_CallFunction(PyExc_OSError, "isO",
+                                            error_number,
+                                            strerror(error_number), pyInput);
+      if (exc) {
+        PyErr_SetObject(PyExceptionInstance_Class(exc), exc);
+        Py_DECREF(exc);
+      }
+      return NULL;
+    }
   }
-  PyObject* retTuple = Py_BuildValue("OOO",
-                                     pysanitized,
-                                     pymodified,
-                                     pymsgstr);
 
-  // decref PyObjects
-  Py_XDECREF(pyInFilenameObj);
-  Py_XDECREF(pyOutFilenameObj);
-  Py_XDECREF(pymsgstr);
-  Py_XDECREF(pysanitized);
-  Py_XDECREF(pymodified);
+  if (!inspected) {
+    PyErr_SetString(PyExc_ValueError, error.c_str());
+    return NULL;
+  }
+  return build_font_info(info, length);
+}
 
-  return retTuple;
+
+/* A reusable sanitizer: the options of a job, converted once, and the
+   scratch space its jobs reuse (see ots::PyOTSScratch). Jobs can run on
+   several threads at once; only one at a time gets the scratch space, the
+   others allocate their own. */
+struct SanitizerState {
+  ots::PyOTSJob options;
+  std::mutex mutex;  // held by the job using |scratch|
+  ots::PyOTSScratch scratch;
+  std::unique_ptr<ots::PyOTSTableMemo> memo;  // if tables are memoized
+};
+
+typedef struct {
+  PyObject_HEAD
+  SanitizerState* state;
+} SanitizerObject;
+
+
+static PyObject* sanitizer_new(PyTypeObject* type, PyObject* args,
+                               PyObject* kwargs) {
+  int quiet = 0;
+  int kwFontIndex = -1;
+  int validate = 0;
+  Py_ssize_t workers = 0;
+  int profile = 0;
+  ots::PyOTSTableActions tableActions;
+  Py_ssize_t maxMessages = 0;
+  Py_ssize_t maxMessageBytes = 0;
+  double timeout = 0;
+  Py_ssize_t maxMemory = 0;
+  int outputFormat = ots::OUTPUT_SFNT;
+  Py_ssize_t tableCacheSize = 0;
+
+  if (kwargs && PyDict_GET_SIZE(kwargs)) {
+    PyErr_SetString(PyExc_TypeError, "Sanitizer() takes no keyword arguments");
+    return NULL;
+  }
+  if (!PyArg_ParseTuple(args, "iiiniO&nndnin", &quiet, &kwFontIndex,
+                        &validate, &workers, &profile,
+                        convert_table_actions, &tableActions,
+                        &maxMessages, &maxMessageBytes, &timeout,
+                        &maxMemory, &outputFormat, &tableCacheSize)) {
+    return NULL;
+  }
+
+  SanitizerObject* self = reinterpret_cast<SanitizerObject*>(
+    type->tp_alloc(type, 0));
+  if (!self) {
+    return NULL;
+  }
+  self->state = new (std::nothrow) SanitizerState();
+  if (!self->state) {
+    Py_DECREF(self);
+    return PyErr_NoMemory();
+  }
+
+  ots::PyOTSJob &job = self->state->options;
+  job.quiet = quiet;
+  job.font_index = kwFontIndex;
+  job.validate = validate;
+  job.workers = static_cast<size_t>(std::max<Py_ssize_t>(workers, 0));
+  job.profile = profile;
+  job.table_actions = tableActions;
+  job.max_messages = static_cast<size_t>(std::max<Py_ssize_t>(maxMessages, 0));
+  job.max_message_bytes =
+    static_cast<size_t>(std::max<Py_ssize_t>(maxMessageBytes, 0));
+  job.timeout = timeout;
+  job.max_memory = static_cast<size_t>(std::max<Py_ssize_t>(maxMemory, 0));
+  job.output_format = static_cast<ots::PyOTSOutputFormat>(outputFormat);
+
+  if (tableCacheSize > 0) {
+    self->state->memo.reset(new (std::nothrow) ots::PyOTSTableMemo(
+      static_cast<size_t>(tableCacheSize)));
+    if (!self->state->memo) {
+      Py_DECREF(self);
+      return PyErr_NoMemory();
+    }
+  }
+
+  return reinterpret_cast<PyObject*>(self);
+}
+
+
+static void sanitizer_dealloc(PyObject* self) {
+  PyTypeObject* type = Py_TYPE(self);
+  delete reinterpret_cast<SanitizerObject*>(self)->state;
+  type->tp_free(self);
+  Py_DECREF(type);
+}
+
+
+/* Sanitizer.sanitize(input, output): sanitize |input|, a path or a
+   bytes-like object holding font data, with the sanitizer's options, like
+   _sanitize() (writing to |output|) or _sanitize_bytes() (for font data, in
+   which case |output| must be None). */
+static PyObject* sanitizer_sanitize(PyObject* self, PyObject* args) {
+  ModuleState* module_state =
+    static_cast<ModuleState*>(PyType_GetModuleState(Py_TYPE(self)));
+  SanitizerState* state = reinterpret_cast<SanitizerObject*>(self)->state;
+  PyObject* pyInput;
+  PyObject* pyOutput;
+
+  if (!PyArg_ParseTuple(args, "OO", &pyInput, &pyOutput)) {
+    return NULL;
+  }
+
+  ots::PyOTSJob job;
+  job.quiet = state->options.quiet;
+  job.font_index = state->options.font_index;
+  job.validate = state->options.validate;
+  job.workers = state->options.workers;
+  job.profile = state->options.profile;
+  job.table_actions = state->options.table_actions;
+  job.max_messages = state->options.max_messages;
+  job.max_message_bytes = state->options.max_message_bytes;
+  job.timeout = state->options.timeout;
+  job.max_memory = state->options.max_memory;
+  job.output_format = state->options.output_format;
+  job.memo = state->memo.get();
+
+  /* never blocks: if another thread is using the scratch space, this job
+     does without */
+  std::unique_lock<std::mutex> lock(state->mutex, std::try_to_lock);
+  if (lock.owns_lock()) {
+    job.scratch = &state->scratch;
+  }
+
+  if (PyObject_CheckBuffer(pyInput)) {
+    if (pyOutput != Py_None) {
+      PyErr_SetString(PyExc_ValueError,
+                      "output can only be given for fonts read from a file");
+      return NULL;
+    }
+    Py_buffer in;
+    if (PyObject_GetBuffer(pyInput, &in, PyBUF_SIMPLE)) {
+      return NULL;
+    }
+    return run_data_job(module_state, &job, &in);
+  }
+
+  PyObject* pyInFilenameObj;
+  if (!PyUnicode_FSConverter(pyInput, &pyInFilenameObj)) {
+    return NULL;
+  }
+  return run_file_job(module_state, &job, pyInFilenameObj, pyOutput);
 }
 
 
+/* Sanitizer.table_cache_info(): (hits, misses, entries, bytes) of the
+   sanitizer's memoized tables, or None if it doesn't memoize tables. */
+static PyObject* sanitizer_table_cache_info(PyObject* self,
+                                            PyObject* Py_UNUSED(args)) {
+  SanitizerState* state = reinterpret_cast<SanitizerObject*>(self)->state;
+  if (!state->memo) {
+    Py_RETURN_NONE;
+  }
+  size_t hits, misses, entries, bytes;
+  state->memo->Stats(&hits, &misses, &entries, &bytes);
+  return Py_BuildValue("nnnn", static_cast<Py_ssize_t>(hits),
+                       static_cast<Py_ssize_t>(misses),
+                       static_cast<Py_ssize_t>(entries),
+                       static_cast<Py_ssize_t>(bytes));
+}
+
+
+static PyMethodDef sanitizer_methods[] = {
+    {"sanitize", sanitizer_sanitize, METH_VARARGS,
+     "Sanitize a font file or font data with the sanitizer's options."},
+    {"table_cache_info", sanitizer_table_cache_info, METH_NOARGS,
+     "How the sanitizer's memoized tables are used."},
+    {NULL, NULL, 0, NULL},
+};
+
+
+static PyType_Slot sanitizer_slots[] = {
+    {Py_tp_doc, const_cast<char*>(
+      "Sanitizer(quiet, font_index, validate, workers, profile, "
+      "table_actions, max_messages, max_message_bytes, timeout, max_memory, "
+      "output_format, table_cache_size)"
+      "\n\nBack-end reusable sanitizer. Generally, you won't use this "
+      "directly. Use pyots.Sanitizer instead.")},
+    {Py_tp_new, reinterpret_cast<void*>(sanitizer_new)},
+    {Py_tp_dealloc, reinterpret_cast<void*>(sanitizer_dealloc)},
+    {Py_tp_methods, sanitizer_methods},
+    {0, NULL},
+};
+
+
+static PyType_Spec sanitizer_spec = {
+    "_pyots.Sanitizer",
+    sizeof(SanitizerObject),
+    0,
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_IMMUTABLETYPE,
+    sanitizer_slots,
+};
+
+
 /* Module method list */
 static PyMethodDef py_ot_sanitizer_methods[] = {
     {"_sanitize", method_sanitize, METH_VARARGS,
      "Back-end sanitize function. Generally, you won't call this directly. "
      "Use pyots.sanitize() instead."},
+    {"_sanitize_bytes", method_sanitize_bytes, METH_VARARGS,
+     "Back-end in-memory sanitize function. Generally, you won't call this "
+     "directly. Use pyots.sanitize_bytes() instead."},
+    {"_sanitize_many", method_sanitize_many, METH_VARARGS,
+     "Back-end batch sanitize function. Generally, you won't call this "
+     "directly. Use pyots.sanitize_many() instead."},
+    {"_inspect", method_inspect, METH_VARARGS,
+     "Back-end inspect function. Generally, you won't call this directly. "
+     "Use pyots.inspect() instead."},
     {NULL, NULL, 0, NULL}, /* sentinel to indicate no more methods */
 };
 
 
+static int module_traverse(PyObject* module, visitproc visit, void* arg) {
+  ModuleState* state = get_module_state(module);
+  Py_VISIT(state->output_buffer_type);
+  Py_VISIT(state->sanitizer_type);
+  Py_VISIT(state->memory_limit_error);
+  return 0;
+}
+
+
+static int module_clear(PyObject* module) {
+  ModuleState* state = get_module_state(module);
+  Py_CLEAR(state->output_buffer_type);
+  Py_CLEAR(state->sanitizer_type);
+  Py_CLEAR(state->memory_limit_error);
+  return 0;
+}
+
+
+static void module_free(void* module) {
+  module_clear(static_cast<PyObject*>(module));
+}
+
+
+/* Module execution: set up the module's state and attributes. */
+static int module_exec(PyObject* module) {
+  ModuleState* state = get_module_state(module);
+
+  state->output_buffer_type = reinterpret_cast<PyTypeObject*>(
+    PyType_FromModuleAndSpec(module, &output_buffer_spec, NULL));
+  if (!state->output_buffer_type) {
+    return -1;
+  }
+
+  state->sanitizer_type = reinterpret_cast<PyTypeObject*>(
+    PyType_FromModuleAndSpec(module, &sanitizer_spec, NULL));
+  if (!state->sanitizer_type ||
+      PyModule_AddType(module, state->sanitizer_type)) {
+    return -1;
+  }
+
+  state->memory_limit_error = PyErr_NewExceptionWithDoc(
+    "_pyots.MemoryLimitError",
+    "Sanitizing a font would need more memory than allowed (max_memory).",
+    PyExc_MemoryError, NULL);
+  if (!state->memory_limit_error ||
+      PyModule_AddObjectRef(module, "MemoryLimitError",
+                            state->memory_limit_error)) {
+    return -1;
+  }
+
+  if (PyModule_AddStringConstant(module, "build_profile", BUILD_PROFILE)) {
+    return -1;
+  }
+
+  return PyModule_AddStringConstant(module, "version", PACKAGE " " VERSION);
+}
+
+
+/* Multi-phase initialization, so the module can be imported into several
+   interpreters. Sanitizing only touches Python objects while attached to
+   the interpreter (jobs run on plain C++ state, see ots::PyOTSJob, and the
+   scratch space of a Sanitizer is guarded by its mutex), so the module
+   doesn't need the GIL, and supports interpreters with their own. */
+static PyModuleDef_Slot py_ot_sanitizer_slots[] = {
+    {Py_mod_exec, reinterpret_cast<void*>(module_exec)},
+#if PY_VERSION_HEX >= 0x030C0000
+    {Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED},
+#endif
+#if PY_VERSION_HEX >= 0x030D0000
+    {Py_mod_gil, Py_MOD_GIL_NOT_USED},
+#endif
+    {0, NULL},
+};
+
+
 /* Module definition */
 static struct PyModuleDef py_ot_sanitizer_module = {
     PyModuleDef_HEAD_INIT,
     "_pyots",
     "pyots backend module",
-    -1,
+    sizeof(ModuleState),
     py_ot_sanitizer_methods,
+    py_ot_sanitizer_slots,
+    module_traverse,
+    module_clear,
+    module_free,
 };
 
 
 /* Module initialization */
 PyMODINIT_FUNC PyInit__pyots(void) {
-  PyObject *_pyots = PyModule_Create(&py_ot_sanitizer_module);
-
-  PyModule_AddStringConstant(_pyots, "version", PACKAGE " " VERSION);
-
-  return _pyots;
+  return PyModuleDef_Init(&py_ot_sanitizer_module);
 }
@@ -0,0 +1,254 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_COLLECTION_H_
+#define SRC__PYOTS_PYOTS_COLLECTION_H_
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <map>
+#include <tuple>
+#include <utility>
+#include <vector>
+
+#include "opentype-sanitiser.h"
+
+namespace ots {
+
+inline uint16_t PyOTSReadU16(const uint8_t *p) {
+  return static_cast<uint16_t>((p[0] << 8) | p[1]);
+}
+
+inline uint32_t PyOTSReadU32(const uint8_t *p) {
+  return (static_cast<uint32_t>(p[0]) << 24) |
+         (static_cast<uint32_t>(p[1]) << 16) |
+         (static_cast<uint32_t>(p[2]) << 8) | static_cast<uint32_t>(p[3]);
+}
+
+// Read the header of a TTC/OTC, whatever its size: the offsets of the
+// offset tables of its member fonts. Returns false if the header is invalid.
+inline bool PyOTSReadCollectionHeader(const uint8_t *data, size_t length,
+                                      std::vector<uint32_t> *offsets) {
+  if (length < 12 || std::memcmp(data, "ttcf", 4) != 0) {
+    return false;
+  }
+  const uint32_t version = PyOTSReadU32(data + 4);
+  if (version != 0x00010000 && version != 0x00020000) {
+    return false;
+  }
+  const uint32_t num_fonts = PyOTSReadU32(data + 8);
+  if (num_fonts == 0 || num_fonts > 0x10000 ||
+      (length - 12) / 4 < num_fonts) {
+    return false;
+  }
+
+  offsets->resize(num_fonts);
+  for (uint32_t i = 0; i < num_fonts; i++) {
+    (*offsets)[i] = PyOTSReadU32(data + 12 + 4 * i);
+  }
+  return true;
+}
+
+// Read the header of a TTC/OTC, like PyOTSReadCollectionHeader(). Returns
+// false if |data| isn't a collection OTS would accept the header of (OTS
+// doesn't sanitize collections larger than 1 GiB); OTS itself reports what
+// is wrong with it.
+inline bool PyOTSReadCollection(const uint8_t *data, size_t length,
+                                std::vector<uint32_t> *offsets) {
+  return length <= 1024 * 1024 * 1024 &&
+         PyOTSReadCollectionHeader(data, length, offsets);
+}
+
+// The offset and length of each table in the input font whose offset table
+// is at |offset|, by tag. Like OTS, the last of several entries for a tag
+// wins.
+inline std::map<uint32_t, std::pair<uint32_t, uint32_t> > PyOTSInputTables(
+    const uint8_t *data, size_t length, uint32_t offset) {
+  std::map<uint32_t, std::pair<uint32_t, uint32_t> > tables;
+  if (offset > length || length - offset < 12) {
+    return tables;
+  }
+  const size_t num_tables = PyOTSReadU16(data + offset + 4);
+  if ((length - offset - 12) / 16 < num_tables) {
+    return tables;
+  }
+  for (size_t i = 0; i < num_tables; i++) {
+    const uint8_t *record = data + offset + 12 + 16 * i;
+    tables[PyOTSReadU32(record)] = std::make_pair(PyOTSReadU32(record + 8),
+                                                  PyOTSReadU32(record + 12));
+  }
+  return tables;
+}
+
+// Put the collection |data| back together from its member fonts, sanitized
+// separately (|fonts| holds each one's sanitized sfnt, in collection order).
+// The output is laid out the way OTS lays out a collection it sanitizes
+// in one go: the fonts one after the other, each with its offset table,
+// table directory and the tables it doesn't share with a font before it.
+// Tables are shared when they were shared in the input, i.e. when a table
+// with the same tag is at the same offset in |data|, with the same length,
+// and the fonts sanitized it the same way (what OTS makes of a table can
+// depend on the other tables of the font, e.g. glyf on loca); tables that
+// aren't in the input (that OTS added) aren't shared.
+inline bool PyOTSAssembleCollection(
+    const uint8_t *data, size_t length, const std::vector<uint32_t> &offsets,
+    const std::vector<std::pair<const uint8_t *, size_t> > &fonts,
+    OTSStream *output) {
+  struct Entry {
+    uint32_t tag;
+    uint32_t chksum;
+    uint32_t offset;
+    uint32_t length;
+    const uint8_t *data;  // the sanitized table, in the font it came from
+
+    bool operator<(const Entry &other) const {
+      return tag < other.tag;
+    }
+  };
+
+  // whether two fonts sanitized a table the same way; the checkSumAdjustment
+  // of 'head' is filled in below, for the font it ends up in
+  auto same = [](const Entry &a, const Entry &b) {
+    if (a.length != b.length) {
+      return false;
+    }
+    if (a.tag != OTS_TAG('h', 'e', 'a', 'd') || a.length < 12) {
+      return std::memcmp(a.data, b.data, a.length) == 0;
+    }
+    return std::memcmp(a.data, b.data, 8) == 0 &&
+           std::memcmp(a.data + 12, b.data + 12, a.length - 12) == 0;
+  };
+
+  const uint32_t num_fonts = static_cast<uint32_t>(fonts.size());
+  if (!output->WriteU32(OTS_TAG('t', 't', 'c', 'f')) ||
+      !output->WriteU32(0x00010000) ||
+      !output->WriteU32(num_fonts) ||
+      !output->Seek((3 + num_fonts) * 4)) {
+    return false;
+  }
+
+  // the tables written so far, by their tag, offset and length in the input
+  // (the fonts may have sanitized the same table differently)
+  std::map<std::tuple<uint32_t, uint32_t, uint32_t>, std::vector<Entry> >
+    written;
+
+  for (uint32_t i = 0; i < num_fonts; i++) {
+    const uint8_t *font = fonts[i].first;
+    const size_t font_length = fonts[i].second;
+    if (font_length < 12) {
+      return false;
+    }
+    const size_t num_tables = PyOTSReadU16(font + 4);
+    if ((font_length - 12) / 16 < num_tables) {
+      return false;
+    }
+
+    const uint32_t out_offset = static_cast<uint32_t>(output->Tell());
+    if (!output->Seek((3 + i) * 4) ||
+        !output->WriteU32(out_offset) ||
+        !output->Seek(out_offset)) {
+      return false;
+    }
+
+    output->ResetChecksum();
+    if (!output->Write(font, 12)) {
+      return false;
+    }
+    const uint32_t offset_table_chksum = output->chksum();
+
+    const off_t table_record_offset = output->Tell();
+    if (!output->Pad(16 * num_tables)) {
+      return false;
+    }
+
+    // the directory of the sanitized font is sorted by tag, which is also
+    // the order OTS wrote its tables in
+    const std::map<uint32_t, std::pair<uint32_t, uint32_t> > input_tables =
+      PyOTSInputTables(data, length, offsets[i]);
+    std::vector<Entry> out_tables;
+    uint32_t head_table_offset = 0;
+    for (size_t j = 0; j < num_tables; j++) {
+      const uint8_t *record = font + 12 + 16 * j;
+      const uint32_t tag = PyOTSReadU32(record);
+      Entry out = {tag, PyOTSReadU32(record + 4), 0, PyOTSReadU32(record + 12),
+                   NULL};
+      const size_t offset = PyOTSReadU32(record + 8);
+      if (out.length == 0 || offset > font_length ||
+          out.length > font_length - offset) {
+        return false;
+      }
+      out.data = font + offset;
+
+      // a table is only shared if this font sanitized it the same way
+      const auto &input = input_tables.find(tag);
+      std::vector<Entry> *same_input = NULL;
+      const Entry *shared = NULL;
+      if (input != input_tables.end()) {
+        same_input = &written[std::make_tuple(tag, input->second.first,
+                                              input->second.second)];
+        for (const auto &entry : *same_input) {
+          if (same(entry, out)) {
+            shared = &entry;
+            break;
+          }
+        }
+      }
+
+      if (shared) {
+        out = *shared;
+      } else {
+        out.offset = static_cast<uint32_t>(output->Tell());
+        if (!output->Write(out.data, out.length) ||
+            !output->Pad((4 - (out.length & 3)) % 4)) {
+          return false;
+        }
+        if (same_input) {
+          same_input->push_back(out);
+        }
+      }
+      if (tag == OTS_TAG('h', 'e', 'a', 'd')) {
+        head_table_offset = out.offset;
+      }
+      out_tables.push_back(out);
+    }
+
+    const off_t end_of_file = output->Tell();
+
+    std::sort(out_tables.begin(), out_tables.end());
+    if (!output->Seek(table_record_offset)) {
+      return false;
+    }
+
+    output->ResetChecksum();
+    uint32_t tables_chksum = 0;
+    for (const auto &table : out_tables) {
+      if (!output->WriteU32(table.tag) ||
+          !output->WriteU32(table.chksum) ||
+          !output->WriteU32(table.offset) ||
+          !output->WriteU32(table.length)) {
+        return false;
+      }
+      tables_chksum += table.chksum;
+    }
+    const uint32_t table_record_chksum = output->chksum();
+
+    // as in OTS, a 'head' shared by several fonts ends up with the checksum
+    // adjustment of the last of them
+    const uint32_t chksum_magic = static_cast<uint32_t>(0xb1b0afba) -
+      (offset_table_chksum + tables_chksum + table_record_chksum);
+    if (!head_table_offset ||
+        !output->Seek(head_table_offset + 8) ||
+        !output->WriteU32(chksum_magic) ||
+        !output->Seek(end_of_file)) {
+      return false;
+    }
+  }
+
+  return true;
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_COLLECTION_H_
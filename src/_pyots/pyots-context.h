@@ -5,77 +5,282 @@
 #ifndef SRC__PYOTS_PYOTS_CONTEXT_H_
 #define SRC__PYOTS_PYOTS_CONTEXT_H_
 
+#include <algorithm>
+#include <chrono>  // NOLINT(build/c++11)
 #include <cstdarg>
-#include <fstream>
-#include <sstream>
+#include <cstdint>
+#include <cstdio>
+#include <new>
+#include <string>
+#include <unordered_map>
+#include <utility>
+#include <vector>
 
 #include "opentype-sanitiser.h"
+#include "pyots-memo.h"
+#include "pyots-profile.h"
 
 namespace ots {
 
+// A message generated by OTS, split into its parts.
+struct PyOTSMessage {
+  int level;         // 0 for errors, 1 for warnings
+  uint32_t tag;      // the table the message is about, 0 if none
+  std::string text;  // the message, without level and table tag
+  size_t count;      // how many times OTS emitted it
+};
+
+// What tells a message from another: repeats of a message have the same key.
+inline std::string PyOTSMessageKey(const PyOTSMessage &message) {
+  std::string key(message.text);
+  key.push_back(static_cast<char>(message.level));
+  key.append(reinterpret_cast<const char *>(&message.tag),
+             sizeof(message.tag));
+  return key;
+}
+
+// What to do with each table, by tag. Tables that aren't listed get OTS's
+// default action (sanitize the tables it knows, drop the others). The
+// actions are kept sorted by tag, so looking one up is a binary search over
+// a handful of entries.
+class PyOTSTableActions {
+ public:
+  PyOTSTableActions() {
+    // OTS doesn't sanitize color bitmap tables, but dropping them would
+    // leave the fonts that have them without glyphs
+    Set(OTS_TAG('C', 'B', 'D', 'T'), TABLE_ACTION_PASSTHRU);
+    Set(OTS_TAG('C', 'B', 'L', 'C'), TABLE_ACTION_PASSTHRU);
+    Set(OTS_TAG('s', 'b', 'i', 'x'), TABLE_ACTION_PASSTHRU);
+  }
+
+  void Set(uint32_t tag, TableAction action) {
+    auto it = Find(tag);
+    if (it != actions_.end() && it->first == tag) {
+      it->second = action;
+    } else {
+      actions_.insert(it, std::make_pair(tag, action));
+    }
+  }
+
+  // Whether |tag| is a table every font must have. OTS's parsers rely on
+  // having parsed these, so they can only be sanitized.
+  static bool Required(uint32_t tag) {
+    switch (tag) {
+      case OTS_TAG('m', 'a', 'x', 'p'):
+      case OTS_TAG('h', 'e', 'a', 'd'):
+      case OTS_TAG('O', 'S', '/', '2'):
+      case OTS_TAG('c', 'm', 'a', 'p'):
+      case OTS_TAG('h', 'h', 'e', 'a'):
+      case OTS_TAG('h', 'm', 't', 'x'):
+      case OTS_TAG('n', 'a', 'm', 'e'):
+      case OTS_TAG('p', 'o', 's', 't'):
+        return true;
+
+      default:
+        return false;
+    }
+  }
+
+  TableAction Get(uint32_t tag) const {
+    auto it = std::lower_bound(actions_.begin(), actions_.end(),
+                               std::make_pair(tag, TABLE_ACTION_DEFAULT));
+    if (it != actions_.end() && it->first == tag) {
+      return it->second;
+    }
+    return TABLE_ACTION_DEFAULT;
+  }
+
+ private:
+  std::vector<std::pair<uint32_t, TableAction> >::iterator Find(
+      uint32_t tag) {
+    return std::lower_bound(actions_.begin(), actions_.end(),
+                            std::make_pair(tag, TABLE_ACTION_DEFAULT));
+  }
+
+  std::vector<std::pair<uint32_t, TableAction> > actions_;
+};
+
 class PyOTSContext: public OTSContext {
  public:
   explicit PyOTSContext(int level): level_(level) { }
-  int buffsize = 2048;
-  char *buff = (char *)malloc(buffsize * sizeof(char));
-  int offset = 0;
-  bool modified = false;
+  std::vector<PyOTSMessage> messages;
+
+  // Caps on the number of messages kept and on the size of their text (0
+  // for no cap). Once one is reached, further messages are only counted in
+  // |omitted|; repeats of a message that was kept add to its count, however
+  // many there are.
+  size_t max_messages = 0;
+  size_t max_message_bytes = 0;
+  size_t omitted = 0;
+
+  // set if a message couldn't be kept for lack of memory; OTS can't be told
+  // (Message() returns nothing, and OTS isn't meant to be unwound by
+  // exceptions), so the caller has to check
+  bool out_of_memory = false;
+
+  // In fail-fast mode the first error decides the verdict: later messages
+  // are ignored and the remaining tables are dropped unparsed.
+  bool fail_fast = false;
+  bool failed = false;
+
+  // If |has_deadline|, sanitizing is given up once |deadline| has passed.
+  // OTS can't be interrupted, so the deadline is checked whenever it calls
+  // back (as it starts on each table, and with each message); once it has
+  // passed, the tables OTS hasn't parsed yet are dropped, except those every
+  // font must have (the others rely on them), and |timed_out| is set.
+  bool has_deadline = false;
+  std::chrono::steady_clock::time_point deadline;
+  bool timed_out = false;
+
+  // set once OTS is to give up (in fail-fast mode, or past the deadline):
+  // writes to the output should fail from then on
+  bool stop = false;
+
+  // if set, told about each table OTS starts on
+  PyOTSProfile *profile = NULL;
+
+  // what to do with each table; the defaults if not set
+  const PyOTSTableActions *table_actions = NULL;
+
+  // If set, the tables of the font whose tables are |memo_tables| that
+  // |memo| has are passed through rather than sanitized. The keys of those
+  // it doesn't have are kept in |memo_misses|, by tag, for the caller to
+  // memoize the ones that come out of sanitizing unchanged.
+  PyOTSTableMemo *memo = NULL;
+  const PyOTSTables *memo_tables = NULL;
+  std::vector<std::pair<uint32_t, std::string> > memo_misses;
 
   void Message(int level, const char *format, ...) {
     va_list va;
 
-    if (level >= 0) {
-      // assume any Warning or Error means a modification was needed.
-      modified = true;
+    if (fail_fast && failed)
+      return;
+    if (level == 0) {
+      failed = true;
+      stop = stop || fail_fast;
     }
+    CheckDeadline();
 
-    if (level > level_)
+    if (level > level_ || out_of_memory)
       return;
 
-    if (offset > buffsize - 256) {
-      buffsize *= 1.5;
-      char *tmp_buff = (char *)realloc(buff, buffsize * sizeof(char));
-      if (tmp_buff == NULL) {
-        printf("Memory error; aborting.\n");
-        free(buff);
-        exit(-2);
+    try {
+      PyOTSMessage message;
+      message.level = level;
+      message.tag = 0;
+      message.count = 1;
+
+      char buffer[256];
+      va_start(va, format);
+      int length = vsnprintf(buffer, sizeof(buffer), format, va);
+      va_end(va);
+      if (length < 0) {
+        return;
+      }
+      if (static_cast<size_t>(length) < sizeof(buffer)) {
+        message.text.assign(buffer, length);
       } else {
-        buff = tmp_buff;
+        message.text.resize(length + 1);
+        va_start(va, format);
+        vsnprintf(&message.text[0], length + 1, format, va);
+        va_end(va);
+        message.text.resize(length);
+      }
+
+      // messages about a table are "TAG: text" (see Table::Message() and
+      // OTS_FAILURE_MSG_TAG); split the tag off, so nobody has to parse it
+      const std::string &text = message.text;
+      if (text.size() >= 6 && text[4] == ':' && text[5] == ' ' &&
+          IsTagChar(text[0]) && IsTagChar(text[1]) && IsTagChar(text[2]) &&
+          IsTagChar(text[3])) {
+        message.tag = OTS_TAG(text[0], text[1], text[2], text[3]);
+        message.text.erase(0, 6);
       }
+
+      Add(std::move(message));
+    } catch (const std::bad_alloc &) {
+      out_of_memory = true;
     }
+  }
 
-    if (level == 0) {
-      offset += snprintf(buff + offset, buffsize - offset, "ERROR: ");
-    } else {
-      offset += snprintf(buff + offset, buffsize - offset, "WARNING: ");
+  TableAction GetTableAction(uint32_t tag) {
+    if (profile)
+      profile->TableStarted(tag);
+
+    if (fail_fast && failed)
+      return TABLE_ACTION_DROP;
+    if (CheckDeadline() && !PyOTSTableActions::Required(tag))
+      return TABLE_ACTION_DROP;
+
+    static const PyOTSTableActions default_actions;
+    const TableAction action =
+      (table_actions ? table_actions : &default_actions)->Get(tag);
+    if (memo && (action == TABLE_ACTION_DEFAULT ||
+                 action == TABLE_ACTION_SANITIZE) && Memoized(tag)) {
+      return TABLE_ACTION_PASSTHRU;
     }
+    return action;
+  }
 
-    va_start(va, format);
-    offset += vsnprintf(buff + offset, buffsize - offset, format, va);
-    va_end(va);
-    offset += snprintf(buff + offset, buffsize - offset, "\n");
+ private:
+  // Whether the deadline has passed.
+  bool CheckDeadline() {
+    if (has_deadline && !timed_out &&
+        std::chrono::steady_clock::now() >= deadline) {
+      timed_out = true;
+      stop = true;
     }
+    return timed_out;
+  }
 
-  TableAction GetTableAction(uint32_t tag) {
-    switch (tag) {
-      case OTS_TAG('C', 'B', 'D', 'T'):
-      case OTS_TAG('C', 'B', 'L', 'C'):
-      case OTS_TAG('s', 'b', 'i', 'x'):
+  // Whether the table |tag| is in |memo|.
+  bool Memoized(uint32_t tag) {
+    if (out_of_memory) {
+      return false;
+    }
+    try {
+      std::string key;
+      if (!PyOTSTableMemo::Key(tag, *memo_tables, &key)) {
+        return false;
+      }
+      if (memo->Find(key)) {
+        return true;
+      }
+      memo_misses.push_back(std::make_pair(tag, std::move(key)));
+    } catch (const std::bad_alloc &) {
+      out_of_memory = true;
+    }
+    return false;
+  }
 
-        return TABLE_ACTION_PASSTHRU;
+  // Keep |message|, or count it as a repeat of one that was kept, within
+  // the caps.
+  void Add(PyOTSMessage &&message) {
+    std::string key = PyOTSMessageKey(message);
+    const auto &it = index_.find(key);
+    if (it != index_.end()) {
+      messages[it->second].count++;
+      return;
+    }
 
-      default:
-        return TABLE_ACTION_DEFAULT;
+    if ((max_messages && messages.size() >= max_messages) ||
+        (max_message_bytes &&
+         message.text.size() > max_message_bytes - message_bytes_)) {
+      omitted++;
+      return;
     }
+    message_bytes_ += message.text.size();
+    index_.insert(std::make_pair(std::move(key), messages.size()));
+    messages.push_back(std::move(message));
   }
 
-  ~PyOTSContext() {
-    if (buff)
-      free(buff);
+  static bool IsTagChar(char c) {
+    return c >= 0x20 && c <= 0x7e;
   }
 
- private:
   int level_;
+  std::unordered_map<std::string, size_t> index_;  // message -> position
+  size_t message_bytes_ = 0;
 };
 
 }  // namespace ots
@@ -0,0 +1,376 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_DIFF_H_
+#define SRC__PYOTS_PYOTS_DIFF_H_
+
+#include <zlib.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <iterator>
+#include <map>
+#include <memory>
+#include <utility>
+#include <vector>
+
+#include "opentype-sanitiser.h"
+#include "pyots-collection.h"
+#include "pyots-stream.h"
+#include "woff2/decode.h"
+
+namespace ots {
+
+// The tables of one font, by tag: where their (uncompressed) data is, and
+// how long it is.
+typedef std::map<uint32_t, std::pair<const uint8_t *, size_t> > PyOTSTables;
+
+// Read the tables of the sfnt font whose offset table is at |offset| in
+// |data|. Returns false if they don't all fit in |data|.
+inline bool PyOTSReadTables(const uint8_t *data, size_t length,
+                            uint32_t offset, PyOTSTables *tables) {
+  if (offset > length || length - offset < 12) {
+    return false;
+  }
+  const size_t num_tables = PyOTSReadU16(data + offset + 4);
+  if ((length - offset - 12) / 16 < num_tables) {
+    return false;
+  }
+  for (size_t i = 0; i < num_tables; i++) {
+    const uint8_t *record = data + offset + 12 + 16 * i;
+    const uint32_t table_offset = PyOTSReadU32(record + 8);
+    const uint32_t table_length = PyOTSReadU32(record + 12);
+    if (table_offset > length || length - table_offset < table_length) {
+      return false;
+    }
+    (*tables)[PyOTSReadU32(record)] =
+      std::make_pair(data + table_offset, static_cast<size_t>(table_length));
+  }
+  return true;
+}
+
+// Read the tables of each font of the sfnt or TTC/OTC |data| (of the font
+// |font_index| only, if it isn't -1).
+inline bool PyOTSReadFonts(const uint8_t *data, size_t length, int font_index,
+                           std::vector<PyOTSTables> *fonts) {
+  std::vector<uint32_t> offsets;
+  if (!PyOTSReadCollection(data, length, &offsets)) {
+    offsets.assign(1, 0);
+  } else if (font_index >= 0) {
+    if (static_cast<size_t>(font_index) >= offsets.size()) {
+      return false;
+    }
+    offsets.assign(1, offsets[font_index]);
+  }
+  fonts->resize(offsets.size());
+  for (size_t i = 0; i < offsets.size(); i++) {
+    if (!PyOTSReadTables(data, length, offsets[i], &(*fonts)[i])) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// Read the tables of the WOFF font |data|, decompressing them into
+// |buffers|.
+inline bool PyOTSReadWoffTables(
+    const uint8_t *data, size_t length, PyOTSTables *tables,
+    std::vector<std::unique_ptr<uint8_t[]> > *buffers) {
+  if (length < 44) {
+    return false;
+  }
+  const size_t num_tables = PyOTSReadU16(data + 12);
+  if ((length - 44) / 20 < num_tables) {
+    return false;
+  }
+  for (size_t i = 0; i < num_tables; i++) {
+    const uint8_t *entry = data + 44 + 20 * i;
+    const uint32_t offset = PyOTSReadU32(entry + 4);
+    const uint32_t comp_length = PyOTSReadU32(entry + 8);
+    const uint32_t orig_length = PyOTSReadU32(entry + 12);
+    if (offset > length || length - offset < comp_length ||
+        comp_length > orig_length) {
+      return false;
+    }
+    const uint8_t *table = data + offset;
+    if (comp_length < orig_length) {
+      std::unique_ptr<uint8_t[]> buffer(new uint8_t[orig_length]);
+      uLongf buffer_length = orig_length;
+      if (uncompress(buffer.get(), &buffer_length, table, comp_length) !=
+          Z_OK || buffer_length != orig_length) {
+        return false;
+      }
+      table = buffer.get();
+      buffers->push_back(std::move(buffer));
+    }
+    (*tables)[PyOTSReadU32(entry)] =
+      std::make_pair(table, static_cast<size_t>(orig_length));
+  }
+  return true;
+}
+
+// Whether a table differs between the input and the sanitized font. The
+// fields of 'head' that say when the font was last modified and what its
+// checksum is (checkSumAdjustment) don't count: they change whenever a font
+// is written out.
+inline bool PyOTSTableChanged(uint32_t tag,
+                              const std::pair<const uint8_t *, size_t> &in,
+                              const std::pair<const uint8_t *, size_t> &out) {
+  if (in.second != out.second) {
+    return true;
+  }
+  if (tag != OTS_TAG('h', 'e', 'a', 'd') || in.second < 36) {
+    return std::memcmp(in.first, out.first, in.second) != 0;
+  }
+  return std::memcmp(in.first, out.first, 8) != 0 ||
+         std::memcmp(in.first + 12, out.first + 12, 16) != 0 ||
+         std::memcmp(in.first + 36, out.first + 36, in.second - 36) != 0;
+}
+
+// Read the tables of each font of the input |data|, sanitized with
+// |font_index|, uncompressed (into |buffers|, for WOFF and WOFF2). Whether
+// OTS puts the fonts out as a collection is put in |collection|.
+inline bool PyOTSReadInputFonts(
+    const uint8_t *data, size_t length, int font_index,
+    std::vector<PyOTSTables> *fonts,
+    std::vector<std::unique_ptr<uint8_t[]> > *buffers, bool *collection) {
+  *collection = false;
+  if (length >= 4 && std::memcmp(data, "wOFF", 4) == 0) {
+    fonts->resize(1);
+    return PyOTSReadWoffTables(data, length, &(*fonts)[0], buffers);
+  }
+  if (length >= 4 && std::memcmp(data, "wOF2", 4) == 0) {
+    const size_t decompressed_length =
+      woff2::ComputeWOFF2FinalSize(data, length);
+    if (decompressed_length == 0) {
+      return false;
+    }
+    buffers->emplace_back(new uint8_t[decompressed_length]);
+    if (!woff2::ConvertWOFF2ToTTF(buffers->back().get(), decompressed_length,
+                                  data, length)) {
+      return false;
+    }
+    data = buffers->back().get();
+    length = decompressed_length;
+  }
+  std::vector<uint32_t> offsets;
+  *collection = font_index == -1 &&
+                PyOTSReadCollection(data, length, &offsets);
+  return PyOTSReadFonts(data, length, font_index, fonts);
+}
+
+// Sort the tags of the changed tables, |changed|, and drop repeats.
+inline void PyOTSSortTags(std::vector<uint32_t> *changed) {
+  std::sort(changed->begin(), changed->end());
+  changed->erase(std::unique(changed->begin(), changed->end()),
+                 changed->end());
+}
+
+// Find the tables that sanitizing changed, by comparing the input font
+// |data| (sanitized with |font_index|) with the sanitized font |output|,
+// table by table: tables that were dropped, added, or whose data differs.
+// Where the tables are in the font, and the order they are in, doesn't
+// count. The tags of the changed tables are put in |changed|, sorted.
+// Returns false if the fonts can't be compared (e.g. the input is WOFF2,
+// and it can't be decompressed).
+inline bool PyOTSChangedTables(const uint8_t *data, size_t length,
+                               int font_index, const uint8_t *output,
+                               size_t output_length,
+                               std::vector<uint32_t> *changed) {
+  std::vector<PyOTSTables> in_fonts;
+  std::vector<std::unique_ptr<uint8_t[]> > buffers;
+  bool collection;
+  if (!PyOTSReadInputFonts(data, length, font_index, &in_fonts, &buffers,
+                           &collection)) {
+    return false;
+  }
+
+  std::vector<PyOTSTables> out_fonts;
+  if (!PyOTSReadFonts(output, output_length, -1, &out_fonts) ||
+      out_fonts.size() != in_fonts.size()) {
+    return false;
+  }
+
+  for (size_t i = 0; i < in_fonts.size(); i++) {
+    const PyOTSTables &in = in_fonts[i];
+    const PyOTSTables &out = out_fonts[i];
+    for (const auto &table : in) {
+      const auto &it = out.find(table.first);
+      if (it == out.end() ||
+          PyOTSTableChanged(table.first, table.second, it->second)) {
+        changed->push_back(table.first);
+      }
+    }
+    for (const auto &table : out) {
+      if (in.find(table.first) == in.end()) {
+        changed->push_back(table.first);
+      }
+    }
+  }
+
+  PyOTSSortTags(changed);
+  return true;
+}
+
+// Where a table is in a font, how long it is, and its checksum, as the table
+// directory says.
+struct PyOTSTableRecord {
+  uint32_t offset;
+  uint32_t length;
+  uint32_t checksum;
+};
+
+// The checksum of the table |tag|, as OTS computes it when it puts the table
+// out unchanged: the sum of its data as uint32s (the last one padded with
+// zeros), with checkSumAdjustment taken as 0 for 'head'.
+inline uint32_t PyOTSTableChecksum(uint32_t tag, const uint8_t *data,
+                                   size_t length) {
+  uint32_t sum = 0;
+  size_t i = 0;
+  for (; i + 4 <= length; i += 4) {
+    sum += PyOTSReadU32(data + i);
+  }
+  if (i < length) {
+    uint8_t last[4] = {0, 0, 0, 0};
+    std::memcpy(last, data + i, length - i);
+    sum += PyOTSReadU32(last);
+  }
+  if (tag == OTS_TAG('h', 'e', 'a', 'd') && length >= 12) {
+    sum -= PyOTSReadU32(data + 8);
+  }
+  return sum;
+}
+
+// The |length| bytes at |offset| of the output among |rewrites|, or NULL if
+// they weren't all written over again.
+inline const uint8_t *PyOTSFindRewrite(
+    const PyOTSCountingStream::Rewrites &rewrites, size_t offset,
+    size_t length) {
+  auto it = rewrites.upper_bound(offset);
+  if (it == rewrites.begin()) {
+    return NULL;
+  }
+  --it;
+  const size_t skip = offset - it->first;
+  if (skip > it->second.size() || it->second.size() - skip < length) {
+    return NULL;
+  }
+  return it->second.data() + skip;
+}
+
+// Read the table directory of the font whose offset table is at |offset| of
+// the output, from what OTS wrote over again, |rewrites|, into |directory|:
+// the offset, length and checksum of each table, by tag. Returns false if it
+// isn't there.
+inline bool PyOTSReadRewrittenDirectory(
+    const PyOTSCountingStream::Rewrites &rewrites, size_t offset,
+    std::map<uint32_t, PyOTSTableRecord> *directory) {
+  const auto &records = rewrites.find(offset + 12);
+  if (records == rewrites.end() || records->second.size() % 16) {
+    return false;
+  }
+  for (size_t i = 0; i < records->second.size(); i += 16) {
+    const uint8_t *record = records->second.data() + i;
+    (*directory)[PyOTSReadU32(record)] = {PyOTSReadU32(record + 8),
+                                          PyOTSReadU32(record + 12),
+                                          PyOTSReadU32(record + 4)};
+  }
+  return true;
+}
+
+// Like PyOTSChangedTables(), for when the sanitized font wasn't kept, only
+// what OTS wrote over again while putting it out, |rewrites| (see
+// PyOTSCountingStream): that has the table directories, so the tables are
+// compared through their checksums and lengths. A change that leaves both
+// as they were goes unnoticed, which is unlikely, but not impossible.
+inline bool PyOTSChangedTableChecksums(
+    const uint8_t *data, size_t length, int font_index,
+    const PyOTSCountingStream::Rewrites &rewrites,
+    std::vector<uint32_t> *changed) {
+  std::vector<PyOTSTables> in_fonts;
+  std::vector<std::unique_ptr<uint8_t[]> > buffers;
+  bool collection;
+  if (!PyOTSReadInputFonts(data, length, font_index, &in_fonts, &buffers,
+                           &collection)) {
+    return false;
+  }
+
+  for (size_t i = 0; i < in_fonts.size(); i++) {
+    /* the offset table of the font: at the start of the output, or where
+       the collection header says */
+    size_t offset = 0;
+    if (collection) {
+      const uint8_t *p = PyOTSFindRewrite(rewrites, 12 + 4 * i, 4);
+      if (!p) {
+        return false;
+      }
+      offset = PyOTSReadU32(p);
+    }
+    std::map<uint32_t, PyOTSTableRecord> out;
+    if (!PyOTSReadRewrittenDirectory(rewrites, offset, &out)) {
+      return false;
+    }
+
+    const PyOTSTables &in = in_fonts[i];
+    for (const auto &table : in) {
+      const auto &it = out.find(table.first);
+      if (it == out.end() || it->second.length != table.second.second ||
+          it->second.checksum != PyOTSTableChecksum(table.first,
+                                                    table.second.first,
+                                                    table.second.second)) {
+        changed->push_back(table.first);
+      }
+    }
+    for (const auto &table : out) {
+      if (in.find(table.first) == in.end()) {
+        changed->push_back(table.first);
+      }
+    }
+  }
+
+  PyOTSSortTags(changed);
+  return true;
+}
+
+// Whether the table |tag| of the sfnt font OTS put out through |counter| is
+// |table| of the input, byte for byte: whether OTS wrote it in one piece
+// straight from |table|, and didn't write over any of it afterwards. That is
+// how it puts out the tables it passes through, or keeps as they are (CFF,
+// GSUB, ...), but not those it writes out field by field, even unchanged.
+inline bool PyOTSTableCopied(const PyOTSCountingStream &counter, uint32_t tag,
+                             const std::pair<const uint8_t *, size_t> &table) {
+  std::map<uint32_t, PyOTSTableRecord> directory;
+  if (!PyOTSReadRewrittenDirectory(counter.rewrites(), 0, &directory)) {
+    return false;
+  }
+  const auto &record = directory.find(tag);
+  if (record == directory.end() || record->second.length != table.second) {
+    return false;
+  }
+  const size_t offset = record->second.offset;
+  const auto &source = counter.sources().find(offset);
+  if (source == counter.sources().end() ||
+      source->second.first != table.first ||
+      source->second.second != table.second) {
+    return false;
+  }
+  /* the first rewrite at or after |offset|, and the one before it */
+  const auto &after = counter.rewrites().lower_bound(offset);
+  if (after != counter.rewrites().end() &&
+      after->first - offset < table.second) {
+    return false;
+  }
+  if (after != counter.rewrites().begin()) {
+    const auto &before = std::prev(after);
+    if (before->first + before->second.size() > offset) {
+      return false;
+    }
+  }
+  return true;
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_DIFF_H_
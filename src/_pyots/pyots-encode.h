@@ -0,0 +1,134 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_ENCODE_H_
+#define SRC__PYOTS_PYOTS_ENCODE_H_
+
+#include <zlib.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <memory>
+#include <vector>
+
+#include "opentype-sanitiser.h"
+#include "pyots-collection.h"
+#include "woff2/encode.h"
+
+namespace ots {
+
+// The format the sanitized font is output in.
+enum PyOTSOutputFormat {
+  OUTPUT_SFNT,   // as OTS writes it: a TrueType/OpenType font or collection
+  OUTPUT_WOFF,   // WOFF 1.0 (zlib); it can't hold a collection
+  OUTPUT_WOFF2,  // WOFF 2.0 (brotli, with glyf and loca transformed)
+};
+
+// Encode the sfnt font |data| (not a collection) as WOFF 1.0 into |output|.
+// Each table is compressed with zlib, unless that doesn't make it smaller;
+// the font has no metadata or private data.
+inline bool PyOTSEncodeWoff(const uint8_t *data, size_t length,
+                            OTSStream *output) {
+  struct Table {
+    uint32_t tag;
+    uint32_t chksum;
+    uint32_t offset;
+    uint32_t length;
+    uint32_t woff_offset;
+    uint32_t woff_length;
+
+    bool operator<(const Table &other) const {
+      return tag < other.tag;
+    }
+  };
+
+  if (length < 12 || std::memcmp(data, "ttcf", 4) == 0) {
+    return false;
+  }
+  const size_t num_tables = PyOTSReadU16(data + 4);
+  if ((length - 12) / 16 < num_tables) {
+    return false;
+  }
+
+  std::vector<Table> tables(num_tables);
+  uint32_t total_sfnt_size = 12 + 16 * num_tables;
+  for (size_t i = 0; i < num_tables; i++) {
+    const uint8_t *record = data + 12 + 16 * i;
+    Table &table = tables[i];
+    table.tag = PyOTSReadU32(record);
+    table.chksum = PyOTSReadU32(record + 4);
+    table.offset = PyOTSReadU32(record + 8);
+    table.length = PyOTSReadU32(record + 12);
+    if (table.offset > length || length - table.offset < table.length) {
+      return false;
+    }
+    total_sfnt_size += (table.length + 3) & ~3u;
+  }
+  // the directory of a WOFF font must be sorted by tag
+  std::sort(tables.begin(), tables.end());
+
+  /* the tables, after room for the header and the table directory */
+  const size_t header_length = 44 + 20 * num_tables;
+  if (!output->Pad(header_length)) {
+    return false;
+  }
+  for (auto &table : tables) {
+    const uint8_t *table_data = data + table.offset;
+    uLongf compressed_length = compressBound(table.length);
+    std::unique_ptr<uint8_t[]> compressed(new uint8_t[compressed_length]);
+    table.woff_offset = static_cast<uint32_t>(output->Tell());
+    if (compress2(compressed.get(), &compressed_length, table_data,
+                  table.length, Z_BEST_COMPRESSION) == Z_OK &&
+        compressed_length < table.length) {
+      table_data = compressed.get();
+      table.woff_length = static_cast<uint32_t>(compressed_length);
+    } else {
+      table.woff_length = table.length;
+    }
+    if (!output->Write(table_data, table.woff_length) ||
+        !output->Pad((4 - (table.woff_length & 3)) % 4)) {
+      return false;
+    }
+  }
+  const off_t end_of_file = output->Tell();
+
+  /* then the header and the table directory */
+  if (!output->Seek(0) ||
+      !output->WriteU32(OTS_TAG('w', 'O', 'F', 'F')) ||
+      !output->WriteU32(PyOTSReadU32(data)) ||
+      !output->WriteU32(static_cast<uint32_t>(end_of_file)) ||
+      !output->WriteU16(static_cast<uint16_t>(num_tables)) ||
+      !output->WriteU16(0) ||                // reserved
+      !output->WriteU32(total_sfnt_size) ||
+      !output->WriteU16(1) ||                // majorVersion
+      !output->WriteU16(0) ||                // minorVersion
+      !output->Pad(20)) {                    // no metadata nor private data
+    return false;
+  }
+  for (const auto &table : tables) {
+    if (!output->WriteU32(table.tag) ||
+        !output->WriteU32(table.woff_offset) ||
+        !output->WriteU32(table.woff_length) ||
+        !output->WriteU32(table.length) ||
+        !output->WriteU32(table.chksum)) {
+      return false;
+    }
+  }
+  return output->Seek(end_of_file);
+}
+
+// Encode the sfnt font or collection |data| as WOFF 2.0 into |output|.
+inline bool PyOTSEncodeWoff2(const uint8_t *data, size_t length,
+                             OTSStream *output) {
+  size_t woff2_length = woff2::MaxWOFF2CompressedSize(data, length);
+  std::unique_ptr<uint8_t[]> woff2(new uint8_t[woff2_length]);
+  return woff2::ConvertTTFToWOFF2(data, length, woff2.get(), &woff2_length,
+                                  woff2::WOFF2Params()) &&
+         output->Write(woff2.get(), woff2_length);
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_ENCODE_H_
@@ -0,0 +1,348 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_INSPECT_H_
+#define SRC__PYOTS_PYOTS_INSPECT_H_
+
+#include <cstdint>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "opentype-sanitiser.h"
+#include "pyots-collection.h"
+
+namespace ots {
+
+// The container format of a font, as told by its header.
+enum PyOTSFontFormat {
+  FORMAT_SFNT,        // a TrueType/OpenType font
+  FORMAT_COLLECTION,  // a TTC/OTC
+  FORMAT_WOFF,        // WOFF 1.0
+  FORMAT_WOFF2,       // WOFF 2.0 (which can hold a collection too)
+};
+
+// A table, as listed in the table directory of a font.
+struct PyOTSTableInfo {
+  uint32_t tag;
+  uint32_t offset;         // where it is in the font (not known for WOFF2)
+  uint32_t length;         // its uncompressed length
+  uint32_t stored_length;  // its length in the font (compressed for WOFF,
+                           // transformed for some WOFF2 tables)
+};
+
+// A font, or a font of a collection.
+struct PyOTSFaceInfo {
+  uint32_t flavor;  // the sfnt version: 0x00010000, 'OTTO', 'true', ...
+  std::vector<PyOTSTableInfo> tables;
+};
+
+// What the header and table directory of a font say about it.
+struct PyOTSFontInfo {
+  PyOTSFontFormat format;
+  uint64_t sfnt_length;  // the size of the font once decompressed
+  std::vector<PyOTSFaceInfo> faces;
+};
+
+// Read a UIntBase128 of WOFF2 at |*pos|, advancing it.
+inline bool PyOTSReadBase128(const uint8_t *data, size_t length, size_t *pos,
+                             uint32_t *value) {
+  uint32_t result = 0;
+  for (int i = 0; i < 5; i++) {
+    if (*pos >= length) {
+      return false;
+    }
+    const uint8_t byte = data[(*pos)++];
+    if ((i == 0 && byte == 0x80) || (result & 0xfe000000)) {
+      return false;
+    }
+    result = (result << 7) | (byte & 0x7f);
+    if (!(byte & 0x80)) {
+      *value = result;
+      return true;
+    }
+  }
+  return false;
+}
+
+// Read a 255UInt16 of WOFF2 at |*pos|, advancing it.
+inline bool PyOTSRead255UInt16(const uint8_t *data, size_t length,
+                               size_t *pos, uint16_t *value) {
+  if (*pos >= length) {
+    return false;
+  }
+  const uint8_t code = data[(*pos)++];
+  if (code < 253) {
+    *value = code;
+    return true;
+  }
+  if (code == 253) {
+    if (length - *pos < 2) {
+      return false;
+    }
+    *value = PyOTSReadU16(data + *pos);
+    *pos += 2;
+    return true;
+  }
+  if (*pos >= length) {
+    return false;
+  }
+  *value = static_cast<uint16_t>(data[(*pos)++] + (code == 255 ? 253 : 506));
+  return true;
+}
+
+// Read the tag of an entry of a WOFF2 table directory at |*pos|, advancing
+// it: the flags byte of the entry, and the tag itself, unless the flags give
+// one of the known tags.
+inline bool PyOTSReadWoff2Tag(const uint8_t *data, size_t length, size_t *pos,
+                              uint8_t *flags, uint32_t *tag) {
+  static const char kKnownTags[63][5] = {
+    "cmap", "head", "hhea", "hmtx", "maxp", "name", "OS/2", "post", "cvt ",
+    "fpgm", "glyf", "loca", "prep", "CFF ", "VORG", "EBDT", "EBLC", "gasp",
+    "hdmx", "kern", "LTSH", "PCLT", "VDMX", "vhea", "vmtx", "BASE", "GDEF",
+    "GPOS", "GSUB", "EBSC", "JSTF", "MATH", "CBDT", "CBLC", "COLR", "CPAL",
+    "SVG ", "sbix", "acnt", "avar", "bdat", "bloc", "bsln", "cvar", "fdsc",
+    "feat", "fmtx", "fvar", "gvar", "hsty", "just", "lcar", "mort", "morx",
+    "opbd", "prop", "trak", "Zapf", "Silf", "Glat", "Gloc", "Feat", "Sill",
+  };
+
+  if (*pos >= length) {
+    return false;
+  }
+  *flags = data[(*pos)++];
+  if ((*flags & 0x3f) == 0x3f) {
+    if (length - *pos < 4) {
+      return false;
+    }
+    *tag = PyOTSReadU32(data + *pos);
+    *pos += 4;
+  } else {
+    const char *known = kKnownTags[*flags & 0x3f];
+    *tag = OTS_TAG(known[0], known[1], known[2], known[3]);
+  }
+  return true;
+}
+
+// Whether a WOFF2 table directory entry with |flags| for |tag| has a
+// transformLength: glyf and loca are transformed with version 0, other
+// tables with any other version.
+inline bool PyOTSWoff2Transformed(uint8_t flags, uint32_t tag) {
+  const uint8_t version = flags >> 6;
+  const bool glyf_or_loca = tag == OTS_TAG('g', 'l', 'y', 'f') ||
+                            tag == OTS_TAG('l', 'o', 'c', 'a');
+  return glyf_or_loca ? version == 0 : version != 0;
+}
+
+inline bool PyOTSKnownFlavor(uint32_t flavor) {
+  return flavor == 0x00010000 || flavor == OTS_TAG('O', 'T', 'T', 'O') ||
+         flavor == OTS_TAG('t', 'r', 'u', 'e');
+}
+
+// Read the offset table and table directory of the sfnt font at |offset| in
+// |data| into |face|.
+inline bool PyOTSInspectSfnt(const uint8_t *data, size_t length,
+                             uint32_t offset, PyOTSFaceInfo *face,
+                             std::string *error) {
+  if (offset > length || length - offset < 12) {
+    *error = "the offset table is out of bounds";
+    return false;
+  }
+  face->flavor = PyOTSReadU32(data + offset);
+  if (!PyOTSKnownFlavor(face->flavor)) {
+    *error = "unknown sfnt version";
+    return false;
+  }
+  const size_t num_tables = PyOTSReadU16(data + offset + 4);
+  if ((length - offset - 12) / 16 < num_tables) {
+    *error = "the table directory is out of bounds";
+    return false;
+  }
+  face->tables.resize(num_tables);
+  for (size_t i = 0; i < num_tables; i++) {
+    const uint8_t *record = data + offset + 12 + 16 * i;
+    PyOTSTableInfo &table = face->tables[i];
+    table.tag = PyOTSReadU32(record);
+    table.offset = PyOTSReadU32(record + 8);
+    table.length = table.stored_length = PyOTSReadU32(record + 12);
+    if (table.offset > length || length - table.offset < table.length) {
+      char chars[5] = {OTS_UNTAG(table.tag), 0};
+      *error = std::string("table '") + chars + "' is out of bounds";
+      return false;
+    }
+  }
+  return true;
+}
+
+inline bool PyOTSInspectWoff(const uint8_t *data, size_t length,
+                             PyOTSFontInfo *info, std::string *error) {
+  if (length < 44) {
+    *error = "the WOFF header is truncated";
+    return false;
+  }
+  info->faces.resize(1);
+  PyOTSFaceInfo &face = info->faces[0];
+  face.flavor = PyOTSReadU32(data + 4);
+  info->sfnt_length = PyOTSReadU32(data + 16);
+  const size_t num_tables = PyOTSReadU16(data + 12);
+  if ((length - 44) / 20 < num_tables) {
+    *error = "the table directory is out of bounds";
+    return false;
+  }
+  face.tables.resize(num_tables);
+  for (size_t i = 0; i < num_tables; i++) {
+    const uint8_t *entry = data + 44 + 20 * i;
+    PyOTSTableInfo &table = face.tables[i];
+    table.tag = PyOTSReadU32(entry);
+    table.offset = PyOTSReadU32(entry + 4);
+    table.stored_length = PyOTSReadU32(entry + 8);
+    table.length = PyOTSReadU32(entry + 12);
+    if (table.offset > length ||
+        length - table.offset < table.stored_length ||
+        table.stored_length > table.length) {
+      char chars[5] = {OTS_UNTAG(table.tag), 0};
+      *error = std::string("table '") + chars + "' is out of bounds";
+      return false;
+    }
+  }
+  return true;
+}
+
+inline bool PyOTSInspectWoff2(const uint8_t *data, size_t length,
+                              PyOTSFontInfo *info, std::string *error) {
+  if (length < 48) {
+    *error = "the WOFF2 header is truncated";
+    return false;
+  }
+  const uint32_t flavor = PyOTSReadU32(data + 4);
+  info->sfnt_length = PyOTSReadU32(data + 16);
+  const size_t num_tables = PyOTSReadU16(data + 12);
+  const uint32_t compressed_length = PyOTSReadU32(data + 20);
+
+  std::vector<PyOTSTableInfo> tables(num_tables);
+  size_t pos = 48;
+  for (size_t i = 0; i < num_tables; i++) {
+    PyOTSTableInfo &table = tables[i];
+    uint8_t flags;
+    table.offset = 0;
+    if (!PyOTSReadWoff2Tag(data, length, &pos, &flags, &table.tag) ||
+        !PyOTSReadBase128(data, length, &pos, &table.length)) {
+      *error = "the table directory is out of bounds";
+      return false;
+    }
+    table.stored_length = table.length;
+    if (PyOTSWoff2Transformed(flags, table.tag) &&
+        !PyOTSReadBase128(data, length, &pos, &table.stored_length)) {
+      *error = "the table directory is out of bounds";
+      return false;
+    }
+  }
+
+  if (flavor != OTS_TAG('t', 't', 'c', 'f')) {
+    info->faces.resize(1);
+    info->faces[0].flavor = flavor;
+    info->faces[0].tables.swap(tables);
+  } else {
+    /* the collection directory lists the tables of each font by index */
+    uint16_t num_fonts;
+    if (length - pos < 4) {
+      *error = "the collection directory is out of bounds";
+      return false;
+    }
+    pos += 4;  // version
+    if (!PyOTSRead255UInt16(data, length, &pos, &num_fonts) ||
+        num_fonts == 0) {
+      *error = "the collection directory is out of bounds";
+      return false;
+    }
+    info->faces.resize(num_fonts);
+    for (PyOTSFaceInfo &face : info->faces) {
+      uint16_t face_tables;
+      if (!PyOTSRead255UInt16(data, length, &pos, &face_tables) ||
+          length - pos < 4) {
+        *error = "the collection directory is out of bounds";
+        return false;
+      }
+      face.flavor = PyOTSReadU32(data + pos);
+      pos += 4;
+      face.tables.resize(face_tables);
+      for (PyOTSTableInfo &table : face.tables) {
+        uint16_t index;
+        if (!PyOTSRead255UInt16(data, length, &pos, &index)) {
+          *error = "the collection directory is out of bounds";
+          return false;
+        }
+        if (index >= num_tables) {
+          *error = "the collection directory refers to a missing table";
+          return false;
+        }
+        table = tables[index];
+      }
+    }
+  }
+
+  if (length - pos < compressed_length) {
+    *error = "the compressed tables are out of bounds";
+    return false;
+  }
+  return true;
+}
+
+// Read what the header and table directory of the font |data| say about it,
+// checking that what they point to is within |data|, but without looking
+// at (or decompressing) any table. Returns false, with the reason in
+// |*error|, if that can't be done.
+inline bool PyOTSInspect(const uint8_t *data, size_t length,
+                         PyOTSFontInfo *info, std::string *error) {
+  if (length < 4) {
+    *error = "the font is truncated";
+    return false;
+  }
+  info->sfnt_length = length;
+  info->faces.clear();
+
+  if (std::memcmp(data, "wOFF", 4) == 0) {
+    info->format = FORMAT_WOFF;
+    if (!PyOTSInspectWoff(data, length, info, error)) {
+      return false;
+    }
+  } else if (std::memcmp(data, "wOF2", 4) == 0) {
+    info->format = FORMAT_WOFF2;
+    if (!PyOTSInspectWoff2(data, length, info, error)) {
+      return false;
+    }
+  } else if (std::memcmp(data, "ttcf", 4) == 0) {
+    info->format = FORMAT_COLLECTION;
+    std::vector<uint32_t> offsets;
+    if (!PyOTSReadCollectionHeader(data, length, &offsets)) {
+      *error = "the collection header is invalid";
+      return false;
+    }
+    info->faces.resize(offsets.size());
+    for (size_t i = 0; i < offsets.size(); i++) {
+      if (!PyOTSInspectSfnt(data, length, offsets[i], &info->faces[i],
+                            error)) {
+        return false;
+      }
+    }
+    return true;
+  } else if (PyOTSKnownFlavor(PyOTSReadU32(data))) {
+    info->format = FORMAT_SFNT;
+    info->faces.resize(1);
+    return PyOTSInspectSfnt(data, length, 0, &info->faces[0], error);
+  } else {
+    *error = "unknown font format";
+    return false;
+  }
+
+  /* the length in the header of a WOFF or WOFF2 font is that of the font */
+  if (PyOTSReadU32(data + 8) != length) {
+    *error = "the length in the header isn't that of the font";
+    return false;
+  }
+  return true;
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_INSPECT_H_
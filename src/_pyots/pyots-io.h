@@ -0,0 +1,401 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_IO_H_
+#define SRC__PYOTS_PYOTS_IO_H_
+
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <cstdint>
+#include <cstdio>
+#include <string>
+#include <vector>
+
+#if defined(_WIN32)
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#include <io.h>
+#include <process.h>
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+namespace ots {
+
+#if defined(_WIN32)
+inline int PyOTSErrnoFromWin32(DWORD code) {
+  switch (code) {
+    case ERROR_FILE_NOT_FOUND:
+    case ERROR_PATH_NOT_FOUND:
+    case ERROR_INVALID_NAME:
+      return ENOENT;
+    case ERROR_FILE_EXISTS:
+    case ERROR_ALREADY_EXISTS:
+      return EEXIST;
+    case ERROR_ACCESS_DENIED:
+    case ERROR_SHARING_VIOLATION:
+      return EACCES;
+    case ERROR_NOT_ENOUGH_MEMORY:
+    case ERROR_OUTOFMEMORY:
+      return ENOMEM;
+    case ERROR_DISK_FULL:
+    case ERROR_HANDLE_DISK_FULL:
+      return ENOSPC;
+    default:
+      return EIO;
+  }
+}
+
+// Convert a UTF-8 |filename| to the UTF-16 the Win32 API wants.
+inline bool PyOTSWidenFilename(const std::string &filename,
+                               std::wstring *wfilename) {
+  int wlen = MultiByteToWideChar(CP_UTF8, 0, filename.c_str(), -1, NULL, 0);
+  if (wlen <= 0) {
+    return false;
+  }
+  std::vector<wchar_t> buffer(wlen);
+  MultiByteToWideChar(CP_UTF8, 0, filename.c_str(), -1, buffer.data(), wlen);
+  wfilename->assign(buffer.data());
+  return true;
+}
+#endif
+
+// Read-only view of an input font file. Regular files are memory-mapped so
+// OTS reads the pages straight from the page cache, without a heap copy of
+// the whole font; anything that can't be mapped (pipes, empty files, or a
+// failed mapping) is read with sized bulk reads instead.
+//
+// NOTE: like any mmap-based reader, truncating the file while it is being
+// sanitized makes accesses past the new end fault (SIGBUS on POSIX).
+class PyOTSInputFile {
+ public:
+  PyOTSInputFile() { }
+
+  ~PyOTSInputFile() {
+    Close();
+  }
+
+  // Open and map (or read) |filename|, which is encoded in the filesystem
+  // encoding (UTF-8 on Windows). On failure returns false and sets |*error|
+  // to the errno value describing the problem.
+  bool Open(const std::string &filename, int *error) {
+    Close();
+#if defined(_WIN32)
+    return OpenWin32(filename, error);
+#else
+    return OpenPosix(filename, error);
+#endif
+  }
+
+  const uint8_t *data() const {
+    return mapped_ ? mapped_ : buffer_.data();
+  }
+
+  size_t size() const {
+    return mapped_ ? mapped_size_ : buffer_.size();
+  }
+
+  bool mapped() const {
+    return mapped_ != NULL;
+  }
+
+  void Close() {
+    if (mapped_) {
+#if defined(_WIN32)
+      UnmapViewOfFile(mapped_);
+#else
+      munmap(mapped_, mapped_size_);
+#endif
+      mapped_ = NULL;
+      mapped_size_ = 0;
+    }
+    std::vector<uint8_t>().swap(buffer_);
+  }
+
+ private:
+  PyOTSInputFile(const PyOTSInputFile &);
+  PyOTSInputFile &operator=(const PyOTSInputFile &);
+
+#if defined(_WIN32)
+  bool OpenWin32(const std::string &filename, int *error) {
+    std::wstring wfilename;
+    if (!PyOTSWidenFilename(filename, &wfilename)) {
+      *error = EINVAL;
+      return false;
+    }
+
+    HANDLE file = CreateFileW(wfilename.c_str(), GENERIC_READ, FILE_SHARE_READ,
+                              NULL, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL,
+                              NULL);
+    if (file == INVALID_HANDLE_VALUE) {
+      *error = PyOTSErrnoFromWin32(GetLastError());
+      return false;
+    }
+
+    bool ok = true;
+    LARGE_INTEGER size;
+    if (GetFileSizeEx(file, &size) && size.QuadPart > 0 &&
+        static_cast<uint64_t>(size.QuadPart) <= SIZE_MAX) {
+      HANDLE mapping = CreateFileMappingW(file, NULL, PAGE_READONLY, 0, 0,
+                                          NULL);
+      if (mapping) {
+        mapped_ = static_cast<uint8_t *>(
+          MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0));
+        mapped_size_ = static_cast<size_t>(size.QuadPart);
+        CloseHandle(mapping);  // the view keeps the mapping alive
+      }
+      if (!mapped_) {
+        mapped_size_ = 0;
+        ok = ReadAll(file, static_cast<size_t>(size.QuadPart), error);
+      }
+    } else {
+      ok = ReadAll(file, 0, error);
+    }
+
+    CloseHandle(file);
+    return ok;
+  }
+
+  bool ReadAll(HANDLE file, size_t size_hint, int *error) {
+    // Read with the file size as the first (and normally only) chunk; keep
+    // going until EOF in case the file grew or the size was unknown.
+    buffer_.resize(size_hint);
+    size_t offset = 0;
+    for (;;) {
+      uint8_t probe[kProbeSize];
+      bool probing = offset == buffer_.size();
+      uint8_t *dest = probing ? probe : buffer_.data() + offset;
+      DWORD want = static_cast<DWORD>(
+        probing ? static_cast<size_t>(kProbeSize)
+                : std::min<size_t>(buffer_.size() - offset, 1 << 30));
+      DWORD got = 0;
+      if (!ReadFile(file, dest, want, &got, NULL)) {
+        *error = PyOTSErrnoFromWin32(GetLastError());
+        return false;
+      }
+      if (got == 0) {
+        break;
+      }
+      if (probing) {
+        buffer_.insert(buffer_.end(), probe, probe + got);
+      }
+      offset += got;
+    }
+    buffer_.resize(offset);
+    return true;
+  }
+
+#else
+  bool OpenPosix(const std::string &filename, int *error) {
+    int fd;
+    do {
+      fd = open(filename.c_str(), O_RDONLY | O_CLOEXEC);
+    } while (fd < 0 && errno == EINTR);
+    if (fd < 0) {
+      *error = errno;
+      return false;
+    }
+
+    bool ok = true;
+    struct stat st;
+    if (fstat(fd, &st) == 0 && S_ISREG(st.st_mode) && st.st_size > 0 &&
+        static_cast<uint64_t>(st.st_size) <= SIZE_MAX) {
+      size_t size = static_cast<size_t>(st.st_size);
+      void *p = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+      if (p != MAP_FAILED) {
+        mapped_ = static_cast<uint8_t *>(p);
+        mapped_size_ = size;
+      } else {
+        ok = ReadAll(fd, size, error);
+      }
+    } else {
+      ok = ReadAll(fd, 0, error);
+    }
+
+    close(fd);
+    return ok;
+  }
+
+  bool ReadAll(int fd, size_t size_hint, int *error) {
+    // Read with the file size as the first (and normally only) chunk; keep
+    // going until EOF in case the file grew or the size was unknown.
+    buffer_.resize(size_hint);
+    size_t offset = 0;
+    for (;;) {
+      uint8_t probe[kProbeSize];
+      bool probing = offset == buffer_.size();
+      uint8_t *dest = probing ? probe : buffer_.data() + offset;
+      size_t want = probing ? static_cast<size_t>(kProbeSize)
+                          : buffer_.size() - offset;
+      ssize_t got = read(fd, dest, want);
+      if (got < 0) {
+        if (errno == EINTR) {
+          continue;
+        }
+        *error = errno;
+        return false;
+      }
+      if (got == 0) {
+        break;
+      }
+      if (probing) {
+        buffer_.insert(buffer_.end(), probe, probe + got);
+      }
+      offset += static_cast<size_t>(got);
+    }
+    buffer_.resize(offset);
+    return true;
+  }
+#endif
+
+  // size of the reads used once the expected size has been read
+  enum { kProbeSize = 4096 };
+
+  uint8_t *mapped_ = NULL;
+  size_t mapped_size_ = 0;
+  std::vector<uint8_t> buffer_;
+};
+
+// Write |length| bytes of |data| to the open file descriptor |fd|. On failure
+// returns false and sets |*error| to the errno value describing the problem.
+inline bool PyOTSWriteFd(int fd, const void *data, size_t length,
+                         int *error) {
+  const char *p = static_cast<const char *>(data);
+  while (length) {
+#if defined(_WIN32)
+    int got = _write(fd, p, static_cast<unsigned>(
+      std::min<size_t>(length, 1 << 30)));
+#else
+    ssize_t got = write(fd, p, length);
+#endif
+    if (got < 0) {
+      if (errno == EINTR) {
+        continue;
+      }
+      *error = errno;
+      return false;
+    }
+    p += got;
+    length -= static_cast<size_t>(got);
+  }
+  return true;
+}
+
+// Write |length| bytes of |data| to |filename| (in the filesystem encoding,
+// UTF-8 on Windows), replacing the file if it exists. The data is written to
+// a temporary file next to |filename| that is then renamed over it, so
+// |filename| never holds a partially written font, even if the process dies
+// while writing. On failure returns false and sets |*error| to the errno
+// value describing the problem.
+inline bool PyOTSWriteFileAtomic(const std::string &filename,
+                                 const void *data, size_t length,
+                                 int *error) {
+  static std::atomic<unsigned> counter(0);
+
+#if defined(_WIN32)
+  std::wstring wfilename;
+  if (!PyOTSWidenFilename(filename, &wfilename)) {
+    *error = EINVAL;
+    return false;
+  }
+
+  std::wstring wtemp;
+  HANDLE file = INVALID_HANDLE_VALUE;
+  for (int attempt = 0; attempt < 100; attempt++) {
+    wchar_t suffix[48];
+    swprintf(suffix, sizeof(suffix) / sizeof(suffix[0]), L".%d.%u.tmp",
+             _getpid(), counter++);
+    wtemp = wfilename + suffix;
+    file = CreateFileW(wtemp.c_str(), GENERIC_WRITE, 0, NULL, CREATE_NEW,
+                       FILE_ATTRIBUTE_NORMAL, NULL);
+    if (file != INVALID_HANDLE_VALUE || GetLastError() != ERROR_FILE_EXISTS) {
+      break;
+    }
+  }
+  if (file == INVALID_HANDLE_VALUE) {
+    *error = PyOTSErrnoFromWin32(GetLastError());
+    return false;
+  }
+
+  const char *p = static_cast<const char *>(data);
+  bool ok = true;
+  while (ok && length) {
+    DWORD want = static_cast<DWORD>(std::min<size_t>(length, 1 << 30));
+    DWORD wrote = 0;
+    ok = WriteFile(file, p, want, &wrote, NULL) != 0;
+    p += wrote;
+    length -= wrote;
+  }
+  if (!ok) {
+    *error = PyOTSErrnoFromWin32(GetLastError());
+  }
+  CloseHandle(file);
+  if (ok && !MoveFileExW(wtemp.c_str(), wfilename.c_str(),
+                         MOVEFILE_REPLACE_EXISTING)) {
+    *error = PyOTSErrnoFromWin32(GetLastError());
+    ok = false;
+  }
+  if (!ok) {
+    DeleteFileW(wtemp.c_str());
+  }
+  return ok;
+#else
+  // devices and pipes (e.g. /dev/null or /dev/stdout) can't be replaced by
+  // renaming; write to them directly
+  struct stat st;
+  if (stat(filename.c_str(), &st) == 0 && !S_ISREG(st.st_mode) &&
+      !S_ISDIR(st.st_mode)) {
+    int fd = open(filename.c_str(), O_WRONLY | O_TRUNC | O_CLOEXEC);
+    if (fd < 0) {
+      *error = errno;
+      return false;
+    }
+    bool ok = PyOTSWriteFd(fd, data, length, error);
+    close(fd);
+    return ok;
+  }
+
+  std::string temp;
+  int fd = -1;
+  for (int attempt = 0; attempt < 100; attempt++) {
+    char suffix[48];
+    snprintf(suffix, sizeof(suffix), ".%ld.%u.tmp",
+             static_cast<long>(getpid()), counter++);  // NOLINT(runtime/int)
+    temp = filename + suffix;
+    // the same mode std::ofstream used, so the umask applies as before
+    fd = open(temp.c_str(), O_WRONLY | O_CREAT | O_EXCL | O_CLOEXEC, 0666);
+    if (fd >= 0 || (errno != EEXIST && errno != EINTR)) {
+      break;
+    }
+  }
+  if (fd < 0) {
+    *error = errno;
+    return false;
+  }
+
+  bool ok = PyOTSWriteFd(fd, data, length, error);
+  if (close(fd) != 0 && ok) {
+    *error = errno;
+    ok = false;
+  }
+  if (ok && rename(temp.c_str(), filename.c_str()) != 0) {
+    *error = errno;
+    ok = false;
+  }
+  if (!ok) {
+    unlink(temp.c_str());
+  }
+  return ok;
+#endif
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_IO_H_
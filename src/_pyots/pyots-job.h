@@ -0,0 +1,537 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_JOB_H_
+#define SRC__PYOTS_PYOTS_JOB_H_
+
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <chrono>  // NOLINT(build/c++11)
+#include <exception>
+#include <limits>
+#include <memory>
+#include <new>
+#include <string>
+#include <thread>  // NOLINT(build/c++11)
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "pyots-collection.h"
+#include "pyots-context.h"
+#include "pyots-diff.h"
+#include "pyots-encode.h"
+#include "pyots-io.h"
+#include "pyots-profile.h"
+#include "pyots-stream.h"
+
+namespace ots {
+
+enum PyOTSJobError {
+  JOB_OK,
+  JOB_READ_ERROR,   // the input file could not be opened or read
+  JOB_WRITE_ERROR,  // the output could not be written
+  JOB_NO_MEMORY,    // an allocation failed while sanitizing
+  JOB_TIMEOUT,      // sanitizing took longer than |timeout|
+  JOB_MEMORY_LIMIT,  // sanitizing would have needed more than |max_memory|
+};
+
+// Scratch space a reusable sanitizer keeps from one job to the next: the
+// buffer of the last output stream, for the next job to write its output
+// into rather than allocating one. Buffers larger than |kMaxLength| aren't
+// kept, so one large font doesn't pin its memory for good.
+struct PyOTSScratch {
+  static const size_t kMaxLength = 16 << 20;
+
+  std::unique_ptr<uint8_t[]> buffer;
+  size_t length = 0;
+};
+
+// A single sanitization request. The inputs are filled in while holding the
+// GIL; RunJob() only touches plain C++ state, so it can run without the GIL
+// and on any thread.
+struct PyOTSJob {
+  // input: either a file to read, or a caller-owned buffer that must stay
+  // valid until the job has run.
+  std::string in_filename;
+  const uint8_t *in_data = NULL;
+  size_t in_length = 0;
+
+  // output: a file to write (empty for none), an open file descriptor to
+  // write to (-1 for none) and/or keeping the sanitized font in memory for
+  // the caller.
+  std::string out_filename;
+  int out_fd = -1;
+  bool keep_output = false;
+
+  int quiet = 0;
+  int font_index = -1;
+  bool validate = false;  // only the verdict is wanted; stop at the first error
+  // if not 0, the fonts of a collection (with font_index -1) are sanitized
+  // separately, on up to this many threads
+  size_t workers = 0;
+  bool profile = false;  // time the sanitization of each table
+  PyOTSTableActions table_actions;  // what to do with each table
+  // the format to output the sanitized font in (the tables are compared,
+  // and profiled, on the sfnt OTS writes)
+  PyOTSOutputFormat output_format = OUTPUT_SFNT;
+  // caps on the number of messages kept and on their total size (0 for no
+  // cap; see PyOTSContext)
+  size_t max_messages = 0;
+  size_t max_message_bytes = 0;
+  // Limits (0 for none): give up on the font once sanitizing has taken
+  // |timeout| seconds, counted from when the job starts running (see
+  // PyOTSContext for how the deadline is enforced), or if the input, the
+  // font it decompresses to, or the output, is larger than |max_memory|
+  // bytes. The fonts of a collection share the deadline of their job.
+  double timeout = 0;
+  size_t max_memory = 0;
+  bool has_deadline = false;
+  std::chrono::steady_clock::time_point deadline;
+  PyOTSScratch *scratch = NULL;  // buffers to reuse, if any
+  // tables to pass through rather than sanitize again, if any (see
+  // PyOTSTableMemo); only sfnt fonts, not collections, use it
+  PyOTSTableMemo *memo = NULL;
+
+  // results
+  bool sanitized = false;
+  bool modified = false;
+  // whether the sanitized font could be compared with the input; if so, the
+  // tags of the tables sanitizing changed, sorted
+  bool compared = false;
+  std::vector<uint32_t> changed_tables;
+  std::vector<PyOTSMessage> messages;
+  size_t omitted_messages = 0;  // messages left out because of the caps
+  std::unique_ptr<PyOTSMemoryStream> output;  // only if it is wanted
+  PyOTSJobError error = JOB_OK;
+  int error_number = 0;
+  // the results for each font of a collection, if they were sanitized
+  // separately; their messages are also in |messages|
+  std::unique_ptr<std::vector<PyOTSJob> > members;
+  std::vector<PyOTSTableTiming> timings;  // only when profiling
+};
+
+inline void RunJobs(std::vector<PyOTSJob> *jobs, size_t workers);
+
+// Sanitize the font |data| in one go, as |job| asks.
+inline void SanitizeFont(PyOTSJob *job, const uint8_t *data, size_t length) {
+  /* Define our OTS context */
+  PyOTSContext context(job->quiet ? -1: 4);
+  context.fail_fast = job->validate;
+  context.table_actions = &job->table_actions;
+  context.max_messages = job->max_messages;
+  context.max_message_bytes = job->max_message_bytes;
+  context.has_deadline = job->has_deadline;
+  context.deadline = job->deadline;
+
+  /* fonts that would decompress to more than the memory limit aren't even
+     started on */
+  if (job->max_memory &&
+      PyOTSDecompressedSize(data, length) > job->max_memory) {
+    job->error = JOB_MEMORY_LIMIT;
+    return;
+  }
+
+  /* profiling needs the sanitized font to find the tables in it */
+  const bool want_output = !job->validate &&
+    (job->keep_output || !job->out_filename.empty() || job->out_fd >= 0);
+  std::unique_ptr<PyOTSProfile> profile;
+  if (job->profile) {
+    profile.reset(new PyOTSProfile());
+    context.profile = profile.get();
+  }
+  PyOTSTables tables;
+  if (job->memo && length >= 4 && PyOTSKnownFlavor(PyOTSReadU32(data)) &&
+      PyOTSReadTables(data, length, 0, &tables)) {
+    context.memo = job->memo;
+    context.memo_tables = &tables;
+  }
+
+  /* set up output stream: if the sanitized font isn't wanted, it is thrown
+     away as it is written, otherwise the buffer is sized for the font we
+     expect back */
+  const bool memory_limited = job->max_memory && job->max_memory < length * 8;
+  const size_t limit = memory_limited ? job->max_memory : length * 8;
+  PyOTSCountingStream counter(limit, &context.stop);
+  bool exceeded;
+  if (want_output || profile) {
+    const size_t expected = PyOTSExpectedOutputSize(data, length);
+    if (job->scratch && job->scratch->buffer &&
+        job->scratch->length >= std::min(expected, limit)) {
+      job->output.reset(new PyOTSMemoryStream(
+        std::move(job->scratch->buffer), job->scratch->length, limit,
+        profile.get(), &context.stop));
+    } else {
+      job->output.reset(new PyOTSMemoryStream(expected, limit, profile.get(),
+                                              &context.stop));
+    }
+    job->sanitized = context.Process(job->output.get(), data, length,
+                                     job->font_index);
+    exceeded = job->output->exceeded();
+  } else {
+    job->sanitized = context.Process(&counter, data, length,
+                                     job->font_index);
+    exceeded = counter.exceeded();
+  }
+  if (context.out_of_memory) {
+    throw std::bad_alloc();
+  }
+  if (context.timed_out || (memory_limited && exceeded)) {
+    job->error = context.timed_out ? JOB_TIMEOUT : JOB_MEMORY_LIMIT;
+    job->output.reset();
+    return;
+  }
+  if (job->validate && context.failed) {
+    job->sanitized = false;
+  }
+
+  const uint8_t *output = job->sanitized && job->output
+    ? static_cast<const uint8_t *>(job->output->get()) : NULL;
+  const size_t output_length = output ? job->output->Tell() : 0;
+
+  if (profile) {
+    job->timings = profile->Timings(data, length, job->font_index, output,
+                                    output_length);
+  }
+
+  /* check for file modifications: OTS writes out every font anew (at the
+     least, its checksums change), so compare the tables themselves, or, if
+     the sanitized font was thrown away, their checksums and lengths. If they
+     can't be compared, the font is taken to be modified. */
+  if (job->sanitized && !job->validate) {
+    job->compared = output
+      ? PyOTSChangedTables(data, length, job->font_index, output,
+                           output_length, &job->changed_tables)
+      : PyOTSChangedTableChecksums(data, length, job->font_index,
+                                   counter.rewrites(), &job->changed_tables);
+    job->modified = !job->compared || !job->changed_tables.empty();
+  }
+
+  /* memoize the tables that came out unchanged, and that no message is
+     about (that's all of them when messages are neither kept nor left out:
+     when quiet). Checksums aren't proof that a table is unchanged, so if
+     the sanitized font was thrown away, only the tables OTS copied from the
+     input are. */
+  if (context.memo && job->compared && !context.omitted) {
+    for (auto &miss : context.memo_misses) {
+      if (!std::binary_search(job->changed_tables.begin(),
+                              job->changed_tables.end(), miss.first) &&
+          (output ||
+           PyOTSTableCopied(counter, miss.first, tables[miss.first])) &&
+          std::none_of(context.messages.begin(), context.messages.end(),
+                       [&miss](const PyOTSMessage &message) {
+                         return message.tag == miss.first;
+                       })) {
+        job->memo->Add(std::move(miss.second));
+      }
+    }
+  }
+
+  if (!want_output) {
+    job->output.reset();
+  }
+
+  if (!job->quiet) {
+    job->messages.swap(context.messages);
+    job->omitted_messages = context.omitted;
+  }
+}
+
+// Add the messages of |member|, a font of the collection |job| is about, to
+// those of |job|, within the caps of |job|; messages |job| already has add
+// to their count.
+inline void AddMessages(const PyOTSJob &member, PyOTSJob *job) {
+  std::unordered_map<std::string, size_t> index;
+  size_t bytes = 0;
+  for (size_t i = 0; i < job->messages.size(); i++) {
+    index.insert(std::make_pair(PyOTSMessageKey(job->messages[i]), i));
+    bytes += job->messages[i].text.size();
+  }
+  for (const auto &message : member.messages) {
+    std::string key = PyOTSMessageKey(message);
+    const auto &it = index.find(key);
+    if (it != index.end()) {
+      job->messages[it->second].count += message.count;
+      continue;
+    }
+    if ((job->max_messages && job->messages.size() >= job->max_messages) ||
+        (job->max_message_bytes &&
+         message.text.size() > job->max_message_bytes - bytes)) {
+      job->omitted_messages += message.count;
+      continue;
+    }
+    bytes += message.text.size();
+    index.insert(std::make_pair(std::move(key), job->messages.size()));
+    job->messages.push_back(message);
+  }
+  job->omitted_messages += member.omitted_messages;
+}
+
+// Add up |timings| into |total|, table by table.
+inline void AddTimings(const std::vector<PyOTSTableTiming> &timings,
+                       std::vector<PyOTSTableTiming> *total) {
+  for (const auto &timing : timings) {
+    auto it = total->begin();
+    while (it != total->end() && it->tag != timing.tag) {
+      ++it;
+    }
+    if (it == total->end()) {
+      total->push_back(timing);
+    } else {
+      it->parse += timing.parse;
+      it->serialize += timing.serialize;
+      it->bytes_in += timing.bytes_in;
+      it->bytes_out += timing.bytes_out;
+    }
+  }
+}
+
+// Sanitize each font of the collection |data| (whose offset tables are at
+// |offsets|) as a job of its own, on |job->workers| threads, and put the
+// sanitized collection back together from them. The collection is sanitized
+// if all its fonts are; it is only output if they all are.
+inline void SanitizeCollection(PyOTSJob *job, const uint8_t *data,
+                               size_t length,
+                               const std::vector<uint32_t> &offsets) {
+  const bool want_output = !job->validate &&
+    (job->keep_output || !job->out_filename.empty() || job->out_fd >= 0);
+
+  job->members.reset(new std::vector<PyOTSJob>(offsets.size()));
+  std::vector<PyOTSJob> &members = *job->members;
+  for (size_t i = 0; i < members.size(); i++) {
+    members[i].in_data = data;
+    members[i].in_length = length;
+    members[i].keep_output = want_output;
+    members[i].quiet = job->quiet;
+    members[i].font_index = static_cast<int>(i);
+    members[i].validate = job->validate;
+    members[i].profile = job->profile;
+    members[i].table_actions = job->table_actions;
+    members[i].max_messages = job->max_messages;
+    members[i].max_message_bytes = job->max_message_bytes;
+    members[i].max_memory = job->max_memory;
+    members[i].has_deadline = job->has_deadline;
+    members[i].deadline = job->deadline;
+  }
+
+  RunJobs(&members, job->workers);
+
+  job->sanitized = true;
+  job->modified = false;
+  job->compared = true;
+  for (auto &member : members) {
+    if (member.error == JOB_NO_MEMORY) {
+      throw std::bad_alloc();
+    }
+    if (member.error != JOB_OK) {
+      /* a limit was hit: the collection as a whole is given up on */
+      job->error = member.error;
+      job->members.reset();
+      job->messages.clear();
+      return;
+    }
+    job->sanitized = job->sanitized && member.sanitized;
+    job->modified = job->modified || member.modified;
+    job->compared = job->compared && member.compared;
+    job->changed_tables.insert(job->changed_tables.end(),
+                               member.changed_tables.begin(),
+                               member.changed_tables.end());
+    AddMessages(member, job);
+    AddTimings(member.timings, &job->timings);
+  }
+  std::sort(job->changed_tables.begin(), job->changed_tables.end());
+  job->changed_tables.erase(
+    std::unique(job->changed_tables.begin(), job->changed_tables.end()),
+    job->changed_tables.end());
+
+  if (job->sanitized && want_output) {
+    std::vector<std::pair<const uint8_t *, size_t> > fonts;
+    for (const auto &member : members) {
+      fonts.push_back(std::make_pair(
+        static_cast<const uint8_t *>(member.output->get()),
+        static_cast<size_t>(member.output->Tell())));
+    }
+    const bool memory_limited =
+      job->max_memory && job->max_memory < length * 8;
+    job->output.reset(new PyOTSMemoryStream(
+      PyOTSExpectedOutputSize(data, length),
+      memory_limited ? job->max_memory : length * 8));
+    if (!PyOTSAssembleCollection(data, length, offsets, fonts,
+                                 job->output.get())) {
+      if (memory_limited && job->output->exceeded()) {
+        job->error = JOB_MEMORY_LIMIT;
+        job->output.reset();
+        return;
+      }
+      job->sanitized = false;
+      if (!job->quiet) {
+        job->messages.push_back({0, 0, "Error writing output", 1});
+      }
+    }
+  }
+
+  if (!job->timings.empty()) {
+    /* the fonts all read the whole collection */
+    job->timings[0].bytes_in = length;
+    job->timings[0].bytes_out = job->output && job->sanitized
+                                ? static_cast<size_t>(job->output->Tell())
+                                : 0;
+  }
+
+  /* the sanitized fonts are only kept for putting the collection together */
+  for (auto &member : members) {
+    member.output.reset();
+    member.keep_output = false;
+  }
+}
+
+// Drop the output of |job|, once it isn't needed any more, giving its buffer
+// back to the job's scratch space (if it has one).
+inline void RecycleOutput(PyOTSJob *job) {
+  if (job->scratch && job->output && !job->scratch->buffer &&
+      job->output->capacity() <= PyOTSScratch::kMaxLength) {
+    job->scratch->length = job->output->capacity();
+    job->scratch->buffer.reset(job->output->Release());
+  }
+  job->output.reset();
+}
+
+// Encode the sanitized font of |job| in its output format. If it can't be,
+// the font isn't sanitized after all.
+inline void EncodeOutput(PyOTSJob *job) {
+  const uint8_t *sfnt = static_cast<const uint8_t *>(job->output->get());
+  const size_t sfnt_length = static_cast<size_t>(job->output->Tell());
+  std::unique_ptr<PyOTSMemoryStream> output(new PyOTSMemoryStream(
+    sfnt_length, job->max_memory ? job->max_memory
+                                 : std::numeric_limits<size_t>::max()));
+  const bool collection = sfnt_length >= 4 &&
+                          std::memcmp(sfnt, "ttcf", 4) == 0;
+  bool encoded;
+  if (job->output_format == OUTPUT_WOFF) {
+    encoded = PyOTSEncodeWoff(sfnt, sfnt_length, output.get());
+  } else {
+    encoded = PyOTSEncodeWoff2(sfnt, sfnt_length, output.get());
+  }
+
+  /* the sfnt's buffer can be reused */
+  RecycleOutput(job);
+  if (output->exceeded()) {
+    job->error = JOB_MEMORY_LIMIT;
+  } else if (!encoded) {
+    job->sanitized = false;
+    if (!job->quiet) {
+      const char *text = collection && job->output_format == OUTPUT_WOFF
+        ? "Error writing output: a font collection can't be encoded as WOFF"
+        : "Error writing output";
+      job->messages.push_back({0, 0, text, 1});
+    }
+  } else {
+    job->output = std::move(output);
+  }
+}
+
+inline void RunJob(PyOTSJob *job) {
+  try {
+    const uint8_t *data = job->in_data;
+    size_t length = job->in_length;
+
+    /* Map (or read) the input file, if we were given one */
+    PyOTSInputFile in;
+    if (!job->in_filename.empty()) {
+      if (!in.Open(job->in_filename, &job->error_number)) {
+        job->error = JOB_READ_ERROR;
+        return;
+      }
+      data = in.data();
+      length = in.size();
+    }
+
+    if (job->max_memory && length > job->max_memory) {
+      job->error = JOB_MEMORY_LIMIT;
+      return;
+    }
+    /* (timeouts of decades can't be told from none) */
+    if (job->timeout > 0 && job->timeout < 1e9) {
+      job->has_deadline = true;
+      job->deadline = std::chrono::steady_clock::now() +
+        std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+          std::chrono::duration<double>(job->timeout));
+    }
+
+    std::vector<uint32_t> offsets;
+    if (job->workers > 0 && job->font_index == -1 &&
+        PyOTSReadCollection(data, length, &offsets)) {
+      SanitizeCollection(job, data, length, offsets);
+    } else {
+      SanitizeFont(job, data, length);
+    }
+
+    /* a font that wasn't sanitized isn't output at all, so an existing file
+       is left as it was rather than replaced with a partial font */
+    if (job->output && !job->sanitized) {
+      RecycleOutput(job);
+    }
+
+    if (job->output && job->sanitized &&
+        job->output_format != OUTPUT_SFNT) {
+      EncodeOutput(job);
+    }
+
+    /* write output, if specified (there is none when validating) */
+    if (!job->output) {
+      // nothing to write
+    } else if (!job->out_filename.empty()) {
+      if (!PyOTSWriteFileAtomic(job->out_filename, job->output->get(),
+                                job->output->Tell(), &job->error_number)) {
+        job->error = JOB_WRITE_ERROR;
+      }
+    } else if (job->out_fd >= 0) {
+      if (!PyOTSWriteFd(job->out_fd, job->output->get(), job->output->Tell(),
+                        &job->error_number)) {
+        job->error = JOB_WRITE_ERROR;
+      }
+    }
+
+    if (!job->keep_output) {
+      RecycleOutput(job);
+    }
+  } catch (const std::bad_alloc &) {
+    job->output.reset();
+    job->members.reset();
+    job->messages.clear();
+    job->error = JOB_NO_MEMORY;
+  }
+}
+
+// Run all |jobs| on a pool of (up to) |workers| threads, the calling thread
+// included. Each thread picks the next unclaimed job until none are left.
+inline void RunJobs(std::vector<PyOTSJob> *jobs, size_t workers) {
+  std::atomic<size_t> next(0);
+  auto work = [jobs, &next]() {
+    for (size_t i = next++; i < jobs->size(); i = next++) {
+      RunJob(&(*jobs)[i]);
+    }
+  };
+
+  workers = std::min(workers, jobs->size());
+  std::vector<std::thread> threads;
+  for (size_t i = 1; i < workers; i++) {
+    try {
+      threads.emplace_back(work);
+    } catch (const std::exception &) {
+      break;  // carry on with the threads we could start
+    }
+  }
+
+  work();
+
+  for (auto &thread : threads) {
+    thread.join();
+  }
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_JOB_H_
@@ -0,0 +1,178 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_MEMO_H_
+#define SRC__PYOTS_PYOTS_MEMO_H_
+
+#include <cstdint>
+#include <list>
+#include <mutex>  // NOLINT(build/c++11)
+#include <string>
+#include <unordered_map>
+#include <utility>
+
+#include "opentype-sanitiser.h"
+#include "pyots-diff.h"
+
+namespace ots {
+
+// Tables a reusable sanitizer has seen come out of sanitizing unchanged,
+// and without a message about them, so that the same table can be passed
+// through, rather than sanitized again, in the fonts that follow (e.g. the
+// fonts of a family, rebuilt after a change to their names).
+//
+// OTS can only be told to sanitize, pass through or drop a table, so only
+// tables sanitizing leaves as they are can be memoized, and only those OTS
+// doesn't look at while sanitizing other tables (those it parses for
+// others, like maxp or GDEF, must be parsed), and whose sanitizing doesn't
+// fix up other tables (glyf rewrites loca, and parts of maxp and head). A
+// table is memoized along with the tables OTS looks at while sanitizing it,
+// which must be the same for it to be passed through.
+//
+// Entries are looked up by their whole data, not by a hash of it: a table
+// is only passed through if it is byte for byte one that was sanitized, so
+// a table made to collide with one that was can't slip through unsanitized.
+// The entries are bounded by their total size, the least recently used ones
+// going first.
+class PyOTSTableMemo {
+ public:
+  explicit PyOTSTableMemo(size_t max_bytes) : max_bytes_(max_bytes) { }
+
+  // The key of the table |tag| of the sfnt font whose tables are |tables|,
+  // in |*key|. Returns false if the table can't be memoized.
+  static bool Key(uint32_t tag, const PyOTSTables &tables, std::string *key) {
+    // the tables that can be memoized, with the tables OTS looks at while
+    // sanitizing them
+    static const struct {
+      uint32_t tag;
+      uint32_t dependencies[3];
+    } kTables[] = {
+      {OTS_TAG('C', 'F', 'F', ' '), {OTS_TAG('m', 'a', 'x', 'p')}},
+      {OTS_TAG('C', 'F', 'F', '2'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('G', 'S', 'U', 'B'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('G', 'D', 'E', 'F'),
+        OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('G', 'P', 'O', 'S'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('G', 'D', 'E', 'F'),
+        OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('C', 'O', 'L', 'R'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('C', 'P', 'A', 'L'),
+        OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('g', 'v', 'a', 'r'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('H', 'V', 'A', 'R'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('V', 'V', 'A', 'R'),
+       {OTS_TAG('m', 'a', 'x', 'p'), OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('M', 'V', 'A', 'R'), {OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('a', 'v', 'a', 'r'), {OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('c', 'v', 'a', 'r'), {OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('S', 'T', 'A', 'T'),
+       {OTS_TAG('n', 'a', 'm', 'e'), OTS_TAG('f', 'v', 'a', 'r')}},
+      {OTS_TAG('g', 'a', 's', 'p'), {}},
+    };
+
+    static const std::pair<const uint8_t *, size_t> kMissing(NULL, 0);
+
+    const auto &table = tables.find(tag);
+    if (table == tables.end()) {
+      return false;
+    }
+    for (const auto &memoized : kTables) {
+      if (memoized.tag != tag) {
+        continue;
+      }
+      key->clear();
+      Append(tag, table->second, key);
+      for (uint32_t dependency : memoized.dependencies) {
+        if (!dependency) {
+          break;
+        }
+        const auto &it = tables.find(dependency);
+        Append(dependency, it != tables.end() ? it->second : kMissing, key);
+      }
+      return true;
+    }
+    return false;
+  }
+
+  // Whether the table with |key| is memoized (which makes it the most
+  // recently used entry).
+  bool Find(const std::string &key) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    const auto &it = entries_.find(key);
+    if (it == entries_.end()) {
+      misses_++;
+      return false;
+    }
+    lru_.splice(lru_.end(), lru_, it->second);
+    hits_++;
+    return true;
+  }
+
+  // Memoize the table with |key|, making room for it if need be.
+  void Add(std::string &&key) {
+    if (key.size() > max_bytes_) {
+      return;
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (entries_.count(key)) {
+      return;
+    }
+    while (!lru_.empty() && bytes_ + key.size() > max_bytes_) {
+      const auto &it = entries_.find(*lru_.front());
+      bytes_ -= it->first.size();
+      lru_.pop_front();
+      entries_.erase(it);
+    }
+    bytes_ += key.size();
+    const auto &it = entries_.insert(
+      std::make_pair(std::move(key), lru_.end())).first;
+    it->second = lru_.insert(lru_.end(), &it->first);
+  }
+
+  // How many lookups found the table memoized, and how many didn't, and
+  // how many entries of how many bytes there are.
+  void Stats(size_t *hits, size_t *misses, size_t *entries, size_t *bytes) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    *hits = hits_;
+    *misses = misses_;
+    *entries = entries_.size();
+    *bytes = bytes_;
+  }
+
+ private:
+  // Append the table |tag| (|table|, or a missing one if its data is null)
+  // to |key|.
+  static void Append(uint32_t tag,
+                     const std::pair<const uint8_t *, size_t> &table,
+                     std::string *key) {
+    const char header[8] = {
+      OTS_UNTAG(tag),
+      static_cast<char>(table.first ? table.second >> 24 : 0xff),
+      static_cast<char>(table.first ? table.second >> 16 : 0xff),
+      static_cast<char>(table.first ? table.second >> 8 : 0xff),
+      static_cast<char>(table.first ? table.second : 0xff),
+    };
+    key->append(header, sizeof(header));
+    if (table.first) {
+      key->append(reinterpret_cast<const char *>(table.first), table.second);
+    }
+  }
+
+  const size_t max_bytes_;
+  std::mutex mutex_;
+  // the entries, by key, and their keys, least recently used first
+  std::unordered_map<std::string, std::list<const std::string *>::iterator>
+    entries_;
+  std::list<const std::string *> lru_;
+  size_t bytes_ = 0;
+  size_t hits_ = 0;
+  size_t misses_ = 0;
+};
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_MEMO_H_
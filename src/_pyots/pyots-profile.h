@@ -0,0 +1,260 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_PROFILE_H_
+#define SRC__PYOTS_PYOTS_PROFILE_H_
+
+#include <chrono>  // NOLINT(build/c++11)
+#include <cstdint>
+#include <cstring>
+#include <map>
+#include <set>
+#include <utility>
+#include <vector>
+
+#include "opentype-sanitiser.h"
+#include "pyots-collection.h"
+#include "pyots-inspect.h"
+
+namespace ots {
+
+// Where the time went while sanitizing one table (or, with tag 0, the font
+// as a whole: reading its header and table directory, and decompressing
+// WOFF2, before the first table is parsed, and writing the table directory
+// afterwards). Times are in seconds.
+struct PyOTSTableTiming {
+  uint32_t tag;
+  double parse;
+  double serialize;
+  uint64_t bytes_in;   // size of the table as OTS parses it (uncompressed)
+  uint64_t bytes_out;  // size of the sanitized table
+};
+
+// Timeline of a sanitization, for profiling. OTS has no hooks around
+// parsing and serializing tables, but it asks the context what to do with
+// each table right before parsing it (PyOTSContext::GetTableAction()), and
+// pads the output to four bytes right after serializing each table
+// (OTSStream::Pad()). Between them, these events split the timeline into
+// the phases of each table. Serialized tables are matched to their tags
+// through the table directory of the output, so the output must be kept.
+class PyOTSProfile {
+ public:
+  typedef std::chrono::steady_clock Clock;
+
+  PyOTSProfile() : start_(Clock::now()) {
+  }
+
+  // OTS is about to parse the table |tag|
+  void TableStarted(uint32_t tag) {
+    events_.push_back({false, tag, 0, 0, Clock::now()});
+  }
+
+  // OTS padded the output from |before| to |after|
+  void Padded(size_t before, size_t after) {
+    events_.push_back({true, 0, before, after, Clock::now()});
+  }
+
+  // Work out the timings from the events, once sanitizing is done. |input|
+  // is the font that was sanitized (with |font_index|, as for Process()),
+  // |output| the sanitized font; if it is NULL (sanitizing failed), only
+  // parsing is accounted for.
+  std::vector<PyOTSTableTiming> Timings(const uint8_t *input,
+                                        size_t input_length, int font_index,
+                                        const uint8_t *output,
+                                        size_t output_length) const {
+    const Clock::time_point end = Clock::now();
+    const std::map<uint32_t, uint64_t> lengths =
+      InputTableLengths(input, input_length, font_index);
+
+    std::vector<PyOTSTableTiming> timings(1);
+    timings[0] = {0, 0.0, 0.0, input_length, output ? output_length : 0};
+    std::map<uint32_t, size_t> index;  // tag -> position in |timings|
+
+    /* parsing: from a table's start to the next event */
+    for (size_t i = 0; i < events_.size(); i++) {
+      const Event &event = events_[i];
+      if (event.pad) {
+        continue;
+      }
+      const Clock::time_point until = i + 1 < events_.size()
+                                      ? events_[i + 1].time : end;
+      auto it = index.find(event.tag);
+      if (it == index.end()) {
+        auto length = lengths.find(event.tag);
+        it = index.insert(std::make_pair(event.tag, timings.size())).first;
+        timings.push_back({event.tag, 0.0, 0.0,
+                           length != lengths.end() ? length->second : 0, 0});
+      }
+      timings[it->second].parse += Seconds(event.time, until);
+    }
+    if (!events_.empty()) {
+      timings[0].parse = Seconds(start_, events_[0].time);
+    }
+
+    /* serializing: from the padding before a table (after the directory or
+       the previous table) to the padding after it */
+    if (output) {
+      std::map<size_t, Clock::time_point> padded_from, padded_to;
+      for (const Event &event : events_) {
+        if (event.pad) {
+          padded_from.insert(std::make_pair(event.before, event.time));
+          padded_to.insert(std::make_pair(event.after, event.time));
+        }
+      }
+
+      for (const auto &table : OutputTables(output, output_length)) {
+        const uint32_t tag = table.first;
+        const size_t offset = table.second.first;
+        const size_t length = table.second.second;
+        const auto &from = padded_to.find(offset);
+        const auto &to = padded_from.find(offset + length);
+        if (from == padded_to.end() || to == padded_from.end()) {
+          continue;
+        }
+        auto it = index.find(tag);
+        if (it == index.end()) {
+          it = index.insert(std::make_pair(tag, timings.size())).first;
+          timings.push_back({tag, 0.0, 0.0, 0, 0});
+        }
+        timings[it->second].serialize += Seconds(from->second, to->second);
+        timings[it->second].bytes_out += length;
+      }
+    }
+
+    /* whatever isn't accounted for by a table goes to the font as a whole */
+    double rest = Seconds(start_, end) - timings[0].parse;
+    for (size_t i = 1; i < timings.size(); i++) {
+      rest -= timings[i].parse + timings[i].serialize;
+    }
+    timings[0].serialize = rest > 0.0 ? rest : 0.0;
+
+    return timings;
+  }
+
+ private:
+  struct Event {
+    bool pad;      // padding the output, rather than starting on a table
+    uint32_t tag;  // the table being started on
+    size_t before;
+    size_t after;
+    Clock::time_point time;
+  };
+
+  static double Seconds(Clock::time_point from, Clock::time_point to) {
+    return std::chrono::duration<double>(to - from).count();
+  }
+
+  // The (uncompressed) length of the tables of the input font, by tag. For a
+  // collection sanitized as a whole, the tables of all its fonts are added
+  // up, counting shared ones once.
+  static std::map<uint32_t, uint64_t> InputTableLengths(const uint8_t *data,
+                                                        size_t length,
+                                                        int font_index) {
+    std::map<uint32_t, uint64_t> lengths;
+    if (length < 4) {
+      return lengths;
+    }
+
+    if (std::memcmp(data, "wOFF", 4) == 0) {
+      const size_t num_tables = length >= 44 ? PyOTSReadU16(data + 12) : 0;
+      for (size_t i = 0; i < num_tables && 44 + 20 * (i + 1) <= length; i++) {
+        const uint8_t *entry = data + 44 + 20 * i;
+        lengths[PyOTSReadU32(entry)] += PyOTSReadU32(entry + 12);
+      }
+    } else if (std::memcmp(data, "wOF2", 4) == 0) {
+      Woff2TableLengths(data, length, &lengths);
+    } else {
+      std::vector<uint32_t> offsets;
+      if (!PyOTSReadCollection(data, length, &offsets)) {
+        offsets.assign(1, 0);
+      } else if (font_index >= 0) {
+        if (static_cast<size_t>(font_index) >= offsets.size()) {
+          return lengths;
+        }
+        offsets.assign(1, offsets[font_index]);
+      }
+      std::set<uint32_t> seen;
+      for (uint32_t offset : offsets) {
+        if (offset > length || length - offset < 12) {
+          continue;
+        }
+        const size_t num_tables = PyOTSReadU16(data + offset + 4);
+        for (size_t i = 0; i < num_tables; i++) {
+          const size_t pos = offset + 12 + 16 * i;
+          if (pos + 16 > length) {
+            break;
+          }
+          if (seen.insert(PyOTSReadU32(data + pos + 8)).second) {
+            lengths[PyOTSReadU32(data + pos)] += PyOTSReadU32(data + pos + 12);
+          }
+        }
+      }
+    }
+    return lengths;
+  }
+
+  // The table directory of a WOFF2 font lists each table once (even in a
+  // collection), with its original length.
+  static void Woff2TableLengths(const uint8_t *data, size_t length,
+                                std::map<uint32_t, uint64_t> *lengths) {
+    if (length < 48) {
+      return;
+    }
+    const size_t num_tables = PyOTSReadU16(data + 12);
+    size_t pos = 48;
+    for (size_t i = 0; i < num_tables; i++) {
+      uint8_t flags;
+      uint32_t tag;
+      uint32_t orig_length;
+      if (!PyOTSReadWoff2Tag(data, length, &pos, &flags, &tag) ||
+          !PyOTSReadBase128(data, length, &pos, &orig_length)) {
+        return;
+      }
+      uint32_t transform_length;
+      if (PyOTSWoff2Transformed(flags, tag) &&
+          !PyOTSReadBase128(data, length, &pos, &transform_length)) {
+        return;
+      }
+      (*lengths)[tag] += orig_length;
+    }
+  }
+
+  // The tables of the sanitized font (of all the fonts of a collection), as
+  // (tag, (offset, length)), each shared table listed once.
+  static std::vector<std::pair<uint32_t, std::pair<size_t, size_t> > >
+  OutputTables(const uint8_t *data, size_t length) {
+    std::vector<std::pair<uint32_t, std::pair<size_t, size_t> > > tables;
+    std::vector<uint32_t> offsets;
+    if (!PyOTSReadCollection(data, length, &offsets)) {
+      offsets.assign(1, 0);
+    }
+    std::set<size_t> seen;
+    for (uint32_t offset : offsets) {
+      if (offset > length || length - offset < 12) {
+        continue;
+      }
+      const size_t num_tables = PyOTSReadU16(data + offset + 4);
+      for (size_t i = 0; i < num_tables; i++) {
+        const size_t pos = offset + 12 + 16 * i;
+        if (pos + 16 > length) {
+          break;
+        }
+        const size_t table_offset = PyOTSReadU32(data + pos + 8);
+        if (seen.insert(table_offset).second) {
+          tables.push_back(std::make_pair(
+            PyOTSReadU32(data + pos),
+            std::make_pair(table_offset, PyOTSReadU32(data + pos + 12))));
+        }
+      }
+    }
+    return tables;
+  }
+
+  const Clock::time_point start_;
+  std::vector<Event> events_;
+};
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_PROFILE_H_
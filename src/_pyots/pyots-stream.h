@@ -0,0 +1,298 @@
+// Copyright (c) 2020 The OTS Authors. All rights reserved.
+// Use of this source code is governed by a BSD-style license that can be
+// found in the LICENSE file.
+
+#ifndef SRC__PYOTS_PYOTS_STREAM_H_
+#define SRC__PYOTS_PYOTS_STREAM_H_
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <map>
+#include <memory>
+#include <utility>
+#include <vector>
+
+#include "opentype-sanitiser.h"
+#include "pyots-collection.h"
+#include "pyots-profile.h"
+#include "woff2/decode.h"
+
+namespace ots {
+
+// Output stream collecting the sanitized font in memory. Like OTS's
+// ExpandingMemoryStream, size() reports |limit| (OTS uses it as the bound on
+// the decompressed size of WOFF/WOFF2 input), but the buffer starts at the
+// size the caller expects the output to be and grows by half when that is
+// not enough, rather than starting at twice the input size and doubling.
+// If |profile| is given, padding is reported to it (see PyOTSProfile). If
+// |stop| is given, writes fail once it is set, which cuts serialization
+// short.
+class PyOTSMemoryStream : public OTSStream {
+ public:
+  PyOTSMemoryStream(size_t initial, size_t limit,
+                    PyOTSProfile *profile = NULL, const bool *stop = NULL)
+      : buffer_(new uint8_t[std::min(initial, limit)]),
+        length_(std::min(initial, limit)), limit_(limit), off_(0),
+        profile_(profile), stop_(stop), exceeded_(false) {
+  }
+
+  // Write into |buffer| (|length| bytes, allocated with new[]), a buffer
+  // kept from an earlier stream, for as long as it is large enough.
+  PyOTSMemoryStream(std::unique_ptr<uint8_t[]> buffer, size_t length,
+                    size_t limit, PyOTSProfile *profile = NULL,
+                    const bool *stop = NULL)
+      : buffer_(std::move(buffer)), length_(length), limit_(limit), off_(0),
+        profile_(profile), stop_(stop), exceeded_(false) {
+  }
+
+  void* get() const {
+    return buffer_.get();
+  }
+
+  // the size of the buffer (not of the output written to it)
+  size_t capacity() const {
+    return length_;
+  }
+
+  // Hand the buffer (allocated with new[]) over to the caller. The stream
+  // can't be written to afterwards.
+  uint8_t* Release() {
+    length_ = 0;
+    return buffer_.release();
+  }
+
+  size_t size() override { return limit_; }
+
+  bool WriteRaw(const void *data, size_t length) override {
+    size_t off = static_cast<size_t>(off_);
+    if (length > limit_ || off > limit_ - length) {
+      exceeded_ = true;
+      return false;
+    }
+    if (!buffer_ || (stop_ && *stop_)) {
+      return false;
+    }
+    if (off + length > length_) {
+      size_t new_length = std::max(off + length, length_ + length_ / 2);
+      new_length = std::min(new_length, limit_);
+      std::unique_ptr<uint8_t[]> new_buffer(new uint8_t[new_length]);
+      std::memcpy(new_buffer.get(), buffer_.get(), length_);
+      buffer_.swap(new_buffer);
+      length_ = new_length;
+    }
+    std::memcpy(buffer_.get() + off, data, length);
+    off_ += static_cast<off_t>(length);
+    return true;
+  }
+
+  bool Seek(off_t position) override {
+    if (position < 0) return false;
+    if (static_cast<size_t>(position) > limit_) {
+      exceeded_ = true;
+      return false;
+    }
+    off_ = position;
+    return true;
+  }
+
+  off_t Tell() const override {
+    return off_;
+  }
+
+  // whether a write (or seek) failed for going past |limit|
+  bool exceeded() const {
+    return exceeded_;
+  }
+
+  bool Pad(size_t bytes) override {
+    const size_t before = static_cast<size_t>(off_);
+    if (!OTSStream::Pad(bytes)) {
+      return false;
+    }
+    if (profile_) {
+      profile_->Padded(before, static_cast<size_t>(off_));
+    }
+    return true;
+  }
+
+ private:
+  std::unique_ptr<uint8_t[]> buffer_;
+  size_t length_;
+  const size_t limit_;
+  off_t off_;
+  PyOTSProfile *profile_;
+  const bool *stop_;
+  bool exceeded_;
+};
+
+// Output stream that throws the sanitized font away, for when the caller only
+// wants the verdict. OTS still serializes every table (that is where some of
+// its checks happen), and OTSStream::Write() still computes the checksums,
+// but only the position and length of the output are kept, along with what
+// OTS writes over again, seeking back to it: the table directories (with the
+// checksum and length of each table), the offsets of the fonts of a
+// collection, and a few fields within tables, e.g. checkSumAdjustment. That
+// is enough to tell which tables changed (see PyOTSChangedTableChecksums()).
+// Where the first write of each table came from is kept too: OTS writes the
+// tables it passes through (and those it keeps as they are, like CFF or
+// GSUB) in one piece, straight from the input. Bounded by |limit| exactly
+// like PyOTSMemoryStream, so both give the same verdicts. If |stop| is
+// given, writes fail once it is set, which cuts serialization short.
+class PyOTSCountingStream : public OTSStream {
+ public:
+  // what was written over again, by offset: each run of writes, one right
+  // after the other, in one piece
+  typedef std::map<size_t, std::vector<uint8_t> > Rewrites;
+  // where the first write of each table came from, and how long it was, by
+  // offset
+  typedef std::map<size_t, std::pair<const void *, size_t> > Sources;
+
+  explicit PyOTSCountingStream(size_t limit, const bool *stop = NULL)
+      : limit_(limit), stop_(stop), off_(0), length_(0), end_(0),
+        table_start_(0), exceeded_(false), run_(rewrites_.end()) {
+  }
+
+  size_t size() override { return limit_; }
+
+  bool WriteRaw(const void *data, size_t length) override {
+    size_t off = static_cast<size_t>(off_);
+    if (length > limit_ || off > limit_ - length) {
+      exceeded_ = true;
+      return false;
+    }
+    if (stop_ && *stop_) {
+      return false;
+    }
+    if (off == table_start_) {
+      sources_[off] = std::make_pair(data, length);
+    }
+    if (off < end_) {
+      const uint8_t *bytes = static_cast<const uint8_t *>(data);
+      if (run_ != rewrites_.end() &&
+          run_->first + run_->second.size() == off) {
+        run_->second.insert(run_->second.end(), bytes, bytes + length);
+      } else {
+        run_ = rewrites_.insert(std::make_pair(off, std::vector<uint8_t>()))
+                 .first;
+        run_->second.assign(bytes, bytes + length);
+      }
+    } else {
+      run_ = rewrites_.end();
+    }
+    off_ += static_cast<off_t>(length);
+    length_ = std::max(length_, static_cast<size_t>(off_));
+    end_ = std::max(end_, static_cast<size_t>(off_));
+    return true;
+  }
+
+  bool Seek(off_t position) override {
+    if (position < 0) return false;
+    if (static_cast<size_t>(position) > limit_) {
+      exceeded_ = true;
+      return false;
+    }
+    end_ = std::max(end_, static_cast<size_t>(off_));
+    off_ = position;
+    run_ = rewrites_.end();
+    return true;
+  }
+
+  off_t Tell() const override {
+    return off_;
+  }
+
+  // OTS pads the output after each table (and the table directory), so the
+  // next table starts after the padding
+  bool Pad(size_t bytes) override {
+    if (!OTSStream::Pad(bytes)) {
+      return false;
+    }
+    table_start_ = static_cast<size_t>(off_);
+    return true;
+  }
+
+  // whether a write (or seek) failed for going past |limit|
+  bool exceeded() const {
+    return exceeded_;
+  }
+
+  // the length of the output that would have been written
+  size_t length() const {
+    return length_;
+  }
+
+  // what was written over again
+  const Rewrites &rewrites() const {
+    return rewrites_;
+  }
+
+  // where the first write of each table came from
+  const Sources &sources() const {
+    return sources_;
+  }
+
+ private:
+  const size_t limit_;
+  const bool *stop_;
+  off_t off_;
+  size_t length_;
+  size_t end_;  // how far the output has been written or seeked to
+  size_t table_start_;  // where the next table starts
+  bool exceeded_;
+  Rewrites rewrites_;
+  Rewrites::iterator run_;  // the run being written, if any
+  Sources sources_;
+};
+
+// Best guess of the size of the sanitized font, used to size its buffer:
+// the sanitized font is usually about the size of its (uncompressed) input.
+// For WOFF and WOFF2 that is the totalSfntSize from the header.
+inline size_t PyOTSExpectedOutputSize(const uint8_t *data, size_t length) {
+  size_t expected = length;
+  if (length >= 20 && (std::memcmp(data, "wOFF", 4) == 0 ||
+                       std::memcmp(data, "wOF2", 4) == 0)) {
+    uint32_t total_sfnt_size = (static_cast<uint32_t>(data[16]) << 24) |
+                               (static_cast<uint32_t>(data[17]) << 16) |
+                               (static_cast<uint32_t>(data[18]) << 8) |
+                               static_cast<uint32_t>(data[19]);
+    if (total_sfnt_size > 0) {
+      expected = total_sfnt_size;
+    }
+  }
+  // leave some headroom for padding and tables OTS rebuilds a bit larger
+  if (expected > std::numeric_limits<size_t>::max() / 2) {
+    return expected;
+  }
+  return expected + expected / 8 + 1024;
+}
+
+// The size of the WOFF or WOFF2 font |data| once decompressed, as OTS works
+// it out (and checks it against the size of the output stream) before
+// decompressing it: for WOFF, the sum of the original lengths of its
+// compressed tables; for WOFF2, the size of the font it decodes to. 0 for
+// fonts that aren't compressed.
+inline size_t PyOTSDecompressedSize(const uint8_t *data, size_t length) {
+  if (length >= 44 && std::memcmp(data, "wOFF", 4) == 0) {
+    const size_t num_tables = PyOTSReadU16(data + 12);
+    size_t sum = 0;
+    for (size_t i = 0; i < num_tables && 44 + 20 * (i + 1) <= length; i++) {
+      const uint8_t *entry = data + 44 + 20 * i;
+      const uint32_t comp_length = PyOTSReadU32(entry + 8);
+      const uint32_t orig_length = PyOTSReadU32(entry + 12);
+      if (orig_length > comp_length) {
+        sum += orig_length;
+      }
+    }
+    return sum;
+  }
+  if (length >= 4 && std::memcmp(data, "wOF2", 4) == 0) {
+    return woff2::ComputeWOFF2FinalSize(data, length);
+  }
+  return 0;
+}
+
+}  // namespace ots
+
+#endif  // SRC__PYOTS_PYOTS_STREAM_H_
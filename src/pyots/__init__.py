@@ -3,43 +3,1039 @@
 # found in the LICENSE file.
 
 # Python interface for pyots.
+import asyncio
+import collections
+import collections.abc
+import contextlib
+import functools
+import mmap
+import os
+
 import _pyots
+from pyots.cache import (
+    SanitizeCache,  # noqa: F401
+    _temp_path,
+)
 
 version = _pyots.version
+# the optimizations pyots was built with: "default", "lto" (link-time
+# optimization) or "pgo" (link-time and profile-guided optimization)
+build_profile = _pyots.build_profile
+
+# raised when sanitizing a font would need more memory than 'max_memory'
+# allows; a MemoryError
+MemoryLimitError = _pyots.MemoryLimitError
+
+
+class OTSMessage(str):
+    """
+    A message generated during sanitization. It is a string holding the
+    message as OTS prints it (e.g. "WARNING: cmap: ..."), with its parts
+    available as attributes:
+        level (int)     OTSMessage.ERROR or OTSMessage.WARNING (None if not
+                        known, e.g. for the empty message of a result without
+                        messages)
+        tag (str)       tag of the table the message is about (None if the
+                        message isn't about a particular table)
+        text (str)      the message itself, without level and tag
+        count (int)     how many times OTS emitted the message: repeats of a
+                        message are only reported once
+    """
+
+    ERROR = 0
+    WARNING = 1
+
+    def __new__(cls, level, tag, text, count=1):
+        if level is None:
+            prefix = ""
+        else:
+            prefix = "ERROR: " if level == cls.ERROR else "WARNING: "
+        self = super().__new__(cls, f"{prefix}{tag}: {text}" if tag else prefix + text)
+        self.level = level
+        self.tag = tag
+        self.text = text
+        self.count = count
+        return self
+
+    def __getnewargs__(self):
+        return (self.level, self.tag, self.text, self.count)
+
+
+class OTSTableTiming(collections.namedtuple("OTSTableTiming", "parse serialize bytes_in bytes_out")):
+    """
+    Where the time went while sanitizing a table, as reported in
+    OTSResult.timings:
+        parse (float)       seconds spent parsing (and checking) the table
+        serialize (float)   seconds spent writing out the sanitized table
+        bytes_in (int)      size of the table in the input (uncompressed)
+        bytes_out (int)     size of the sanitized table (0 if it was dropped)
+    """
+
+    __slots__ = ()
+
+
+class OTSTableInfo(collections.namedtuple("OTSTableInfo", "offset length stored_length")):
+    """
+    A table, as listed in the table directory of a font (see inspect()):
+        offset (int)        where the table is in the font (None for WOFF2,
+                            whose tables are compressed as one stream)
+        length (int)        size of the table, uncompressed
+        stored_length (int) size of the table as stored in the font:
+                            compressed, for WOFF, or transformed, for some
+                            tables of WOFF2; otherwise 'length'
+    """
+
+    __slots__ = ()
+
+
+class OTSFaceInfo(collections.namedtuple("OTSFaceInfo", "flavor tables")):
+    """
+    A font, or a font of a collection, as described by inspect():
+        flavor (str)    its sfnt version, as a tag: "\\x00\\x01\\x00\\x00" or
+                        "true" for TrueType outlines, "OTTO" for CFF ones
+        tables (dict)   an OTSTableInfo for each table, by tag, in the order
+                        of the table directory
+    """
+
+    __slots__ = ()
+
+
+class OTSFontInfo(collections.namedtuple("OTSFontInfo", "format length sfnt_length faces")):
+    """
+    What the header and table directory of a font say about it, as returned
+    by inspect():
+        format (str)        "sfnt", "collection" (TTC/OTC), "woff" or "woff2"
+        length (int)        size of the font
+        sfnt_length (int)   size of the font once decompressed (that of the
+                            font, unless it is WOFF or WOFF2)
+        faces (tuple)       an OTSFaceInfo for each font (several for a
+                            collection, including a WOFF2 one)
+    """
+
+    __slots__ = ()
+
+
+class OTSTableCacheInfo(collections.namedtuple("OTSTableCacheInfo", "hits misses entries bytes")):
+    """
+    How the tables a Sanitizer memoizes are used, as reported by
+    Sanitizer.table_cache_info():
+        hits (int)      tables that were passed through rather than sanitized
+        misses (int)    tables that could have been, but weren't memoized
+        entries (int)   tables memoized
+        bytes (int)     size of the memoized tables (and of the tables they
+                        were sanitized with)
+    """
+
+    __slots__ = ()
 
 
 class OTSResult:
+    # results are created in large numbers (e.g. by sanitize_many()), and
+    # often only .sanitized is looked at: keep them small, and only make the
+    # OTSMessage objects when .messages is first used
+    __slots__ = (
+        "_messages",
+        "_raw_messages",
+        "_raw_timings",
+        "_timings",
+        "changed_tables",
+        "data",
+        "members",
+        "modified",
+        "omitted_messages",
+        "sanitized",
+    )
+
     def __init__(self, raw_tuple):
         self.sanitized = bool(raw_tuple[0])
         self.modified = bool(raw_tuple[1])
-        self.messages = tuple(raw_tuple[2].strip().split("\n"))
+        self.data = raw_tuple[3] if len(raw_tuple) > 3 else None
+        members = raw_tuple[4] if len(raw_tuple) > 4 else None
+        self.members = tuple(OTSResult(m) for m in members) if members is not None else None
+        self._raw_messages = raw_tuple[2]
+        self._messages = None
+        self._raw_timings = raw_tuple[5] if len(raw_tuple) > 5 else None
+        self._timings = None
+        changed_tables = raw_tuple[6] if len(raw_tuple) > 6 else None
+        self.changed_tables = tuple(changed_tables) if changed_tables is not None else None
+        self.omitted_messages = (raw_tuple[7] if len(raw_tuple) > 7 else None) or 0
 
+    @property
+    def messages(self):
+        if self._messages is None:
+            self._messages = _make_messages(self._raw_messages)
+        return self._messages
 
-def sanitize(input, output=None, quiet=False, font_index=-1) -> OTSResult:
+    @property
+    def timings(self):
+        """
+        With 'profile', a dict of OTSTableTiming by table tag, in the order
+        OTS worked on the tables, starting with "header" for the font as a
+        whole: reading its header and table directory (and decompressing
+        WOFF2) before any table is parsed, and writing the table directory
+        afterwards; its sizes are those of the whole input and output. None
+        if the font wasn't profiled.
+        """
+        if self._timings is None and self._raw_timings is not None:
+            self._timings = {
+                tag if tag is not None else "header": OTSTableTiming(*timing)
+                for (tag, *timing) in self._raw_timings
+            }
+        return self._timings
+
+    def __reduce__(self):
+        # pickle the raw messages rather than the OTSMessage objects
+        return (OTSResult, (self._raw(),))
+
+    def _raw(self):
+        raw = (
+            self.sanitized,
+            self.modified,
+            self._raw_messages,
+            self.data,
+            tuple(m._raw() for m in self.members) if self.members is not None else None,
+            self._raw_timings,
+            self.changed_tables,
+            self.omitted_messages or None,
+        )
+        # leave out the trailing fields that aren't there
+        while len(raw) > 3 and raw[-1] is None:
+            raw = raw[:-1]
+        return raw
+
+
+def sanitize(
+    input,
+    output=None,
+    quiet=False,
+    font_index=-1,
+    cache=None,
+    mode="sanitize",
+    workers=None,
+    profile=False,
+    table_actions=None,
+    max_messages=1000,
+    max_message_bytes=2**20,
+    timeout=None,
+    max_memory=None,
+    output_format="sfnt",
+) -> OTSResult:
     """
     Sanitize a file. Options:
-        output      path for output file. If not specified, no output will be
+        output      where to write the sanitized font: a path, an open file
+                    descriptor (int), or a file object with a write() method
+                    (e.g. a file opened with open(..., "wb") or io.BytesIO).
+                    A path is written atomically: the font is written to a
+                    temporary file that is then renamed to 'output'. Nothing
+                    is written if the font isn't sanitized (an existing file
+                    is left as it was). If not specified, no output will be
                     written (and input file will not be modified)
         quiet       ots "quiet" mode (no output). Default False.
         font_index  font_index for TTC/OTC. Specify a TTC index to sanitize.
                     Ignored for non-Collections; if left at default, will
                     sanitize all fonts in Collection.
+        cache       a SanitizeCache to look the result up in (and store it
+                    in). On a hit the font isn't sanitized again. Output is
+                    only written for fonts that were sanitized successfully.
+        mode        "sanitize" (default), or "validate" to only find out
+                    whether the font is valid: OTS stops at the first error
+                    (the messages up to and including it are reported), and
+                    no output is produced. Unlike "sanitize", any error fails
+                    the font, including ones OTS recovers from by dropping a
+                    table.
+        workers     for TTC/OTC with font_index left at default: sanitize the
+                    fonts of the Collection separately, on a pool of this many
+                    threads, and put the sanitized Collection back together
+                    (tables shared between fonts stay shared, unless the fonts
+                    sanitized them differently). The result then has the
+                    result for each font in 'members'. If not
+                    specified, OTS sanitizes the fonts one after the other.
+        profile     time the sanitization of each table, and report it in
+                    the result's 'timings'. Default False. Profiling keeps
+                    the sanitized font in memory even if it isn't output,
+                    and can't be combined with a cache.
+        table_actions
+                    what to do with particular tables, as a dict mapping table
+                    tags to actions: "sanitize" (what OTS does with most
+                    tables: sanitize the table if OTS knows how to, drop it if
+                    it doesn't), "passthrough" (keep the table as it is,
+                    unchecked) or "drop". Tables that aren't listed are
+                    sanitized, except CBDT, CBLC and sbix, which are passed
+                    through. The tables every font must have (head, hhea,
+                    hmtx, maxp, cmap, name, OS/2 and post) can only be
+                    sanitized. E.g. {"DSIG": "drop", "CBDT": "sanitize"}.
+        max_messages
+                    the most messages to report (default 1000), and the most
+        max_message_bytes
+                    text they can hold between them (default 1 MiB), so fonts
+                    that make OTS complain endlessly can't run away with
+                    memory (at least 1 each). Messages beyond these are
+                    left out, and counted in the result's
+                    'omitted_messages'. None for no limit. Repeats of a message are reported once, with their
+                    number in its 'count', and don't count against the
+                    limits.
+        timeout     give up on the font if sanitizing it takes longer than
+                    this many seconds, raising TimeoutError. OTS can't be
+                    interrupted at any point: the time is checked between
+                    tables (and whenever OTS reports a message), so a single
+                    table that takes long to sanitize can overrun it. None
+                    (default) for no limit.
+        max_memory  give up on the font if the input, the font it
+                    decompresses to (for WOFF and WOFF2) or the sanitized
+                    font would be larger than this many bytes, raising
+                    MemoryLimitError (a MemoryError). None (default) for no
+                    limit. OTS's own bookkeeping isn't counted.
+                    Results taken from a cache are returned whatever
+                    'timeout' and 'max_memory' are: no work is done for
+                    them (but a file larger than 'max_memory' is given up
+                    on before it is read, cache or not).
+        output_format
+                    the format to output the sanitized font in: "sfnt"
+                    (default; a TrueType or OpenType font or collection, as
+                    OTS writes it), "woff" (WOFF 1.0, which can't hold a
+                    collection) or "woff2" (WOFF 2.0). The font is encoded
+                    straight from the sanitized data; 'modified',
+                    'changed_tables' and 'timings' are about the sanitized
+                    sfnt. A font that can't be encoded isn't sanitized.
 
     Returns an OTSResult with the following attributes:
         sanitized (bool)    File was successfully sanitized
-        modified (bool)     Modifications were necessary to sanitize the input
-                            file (SEE README.md!)
-        messages (string)   Messages generated during sanitzation (empty if
-                            'quiet' was specified as True).
+        modified (bool)     Sanitizing changed the font: the sanitized font
+                            doesn't have the same tables as the input, with
+                            the same data (see changed_tables). Without an
+                            'output', the sanitized font isn't kept, and
+                            the tables are compared through their checksums
+                            and lengths instead. Always False if mode is
+                            "validate".
+        changed_tables (tuple)
+                            Tags of the tables sanitizing changed, dropped
+                            or added, sorted; empty if it changed none. None
+                            if the font wasn't sanitized, or if mode is
+                            "validate" (or if the sanitized font couldn't be
+                            compared with the input, in which case
+                            'modified' is True).
+        messages (tuple)    Messages generated during sanitzation, as
+                            OTSMessage strings (empty if 'quiet' was specified
+                            as True).
+        omitted_messages (int)
+                            Number of messages left out of 'messages' because
+                            of 'max_messages' or 'max_message_bytes'.
+        members (tuple)     With 'workers', for a Collection: an OTSResult for
+                            each of its fonts (without data), in Collection
+                            order. None otherwise, and for results taken from
+                            a cache.
+        timings (dict)      With 'profile': an OTSTableTiming for each table
+                            (see OTSResult.timings). For a Collection whose
+                            fonts were sanitized separately, the timings of
+                            the fonts are added up. None otherwise.
+    """
+    validate = _is_validate(mode)
+    workers = _collection_workers(workers)
+    table_actions = _table_actions(table_actions)
+    limits = _message_limits(max_messages, max_message_bytes) + _resource_limits(timeout, max_memory)
+    output_format = _output_format(output_format, validate)
+    if cache is not None:
+        if profile:
+            raise ValueError("profiling can't be combined with a cache")
+        if validate and output is not None:
+            raise ValueError("validating doesn't write any output")
+        with _map_input(input, limits[3]) as data:
+            raw = _sanitize_cached(
+                cache,
+                data,
+                quiet,
+                font_index,
+                validate,
+                output is not None,
+                workers,
+                table_actions,
+                limits,
+                output_format,
+            )
+        if raw[3] is not None:
+            _write_output(output, raw[3])
+        return OTSResult((*raw[:3], None, *raw[4:]))
+
+    return OTSResult(
+        _pyots._sanitize(
+            input,
+            output,
+            quiet,
+            font_index,
+            validate,
+            workers,
+            profile,
+            table_actions,
+            *limits,
+            output_format,
+        )
+    )
+
+
+def sanitize_bytes(
+    data,
+    quiet=False,
+    font_index=-1,
+    cache=None,
+    mode="sanitize",
+    workers=None,
+    profile=False,
+    table_actions=None,
+    max_messages=1000,
+    max_message_bytes=2**20,
+    timeout=None,
+    max_memory=None,
+    output_format="sfnt",
+) -> OTSResult:
+    """
+    Sanitize font data held in memory. 'data' can be any bytes-like object
+    (bytes, bytearray, memoryview, mmap, ...); it is read in place, without
+    being copied. Options:
+        quiet       ots "quiet" mode (no output). Default False.
+        font_index  font_index for TTC/OTC. Specify a TTC index to sanitize.
+                    Ignored for non-Collections; if left at default, will
+                    sanitize all fonts in Collection.
+        cache       a SanitizeCache to look the result up in (and store it
+                    in). On a hit the font isn't sanitized again.
+        mode        "sanitize" (default) or "validate" (see sanitize()).
+        workers     sanitize the fonts of a TTC/OTC separately, on this many
+                    threads (see sanitize()).
+        profile     time the sanitization of each table (see sanitize()).
+        table_actions
+                    what to do with particular tables (see sanitize()).
+        max_messages, max_message_bytes
+                    limits on the messages reported (see sanitize()).
+        timeout, max_memory
+                    limits on the time and memory sanitizing can take (see
+                    sanitize()).
+        output_format
+                    "sfnt" (default), "woff" or "woff2" (see sanitize()).
+
+    Returns an OTSResult like sanitize(), with one additional attribute:
+        data (bytes)        The sanitized font, in 'output_format' (None if
+                            sanitization failed, or if mode is "validate")
+    """
+    validate = _is_validate(mode)
+    workers = _collection_workers(workers)
+    table_actions = _table_actions(table_actions)
+    limits = _message_limits(max_messages, max_message_bytes) + _resource_limits(timeout, max_memory)
+    output_format = _output_format(output_format, validate)
+    if cache is not None:
+        if profile:
+            raise ValueError("profiling can't be combined with a cache")
+        return OTSResult(
+            _sanitize_cached(
+                cache,
+                data,
+                quiet,
+                font_index,
+                validate,
+                not validate,
+                workers,
+                table_actions,
+                limits,
+                output_format,
+            )
+        )
+
+    return OTSResult(
+        _pyots._sanitize_bytes(
+            data, quiet, font_index, validate, workers, profile, table_actions, *limits, output_format
+        )
+    )
+
+
+def sanitize_many(
+    inputs,
+    output_dir=None,
+    quiet=False,
+    font_index=-1,
+    workers=None,
+    mode="sanitize",
+    table_actions=None,
+    max_messages=1000,
+    max_message_bytes=2**20,
+    timeout=None,
+    max_memory=None,
+    output_format="sfnt",
+) -> list:
     """
-    (san, mod, rmsg) = _pyots._sanitize(input, output or "", quiet, font_index)
+    Sanitize a batch of fonts on a pool of native threads. 'inputs' is an
+    iterable of paths (str or os.PathLike) and/or bytes-like objects holding
+    font data. Options:
+        output_dir  directory to write the sanitized fonts to, named after
+                    their input files (with a .woff or .woff2 extension for
+                    those 'output_format's). If not specified, no output will
+                    be written. Fonts given as bytes-like objects are never
+                    written; their sanitized data is returned instead.
+        quiet       ots "quiet" mode (no output). Default False.
+        font_index  font_index for TTC/OTC, applied to every input (see
+                    sanitize()).
+        workers     number of threads to use. Defaults to os.cpu_count().
+        mode        "sanitize" (default) or "validate" (see sanitize()).
+                    Validating doesn't write any output, so output_dir must
+                    not be given.
+        table_actions
+                    what to do with particular tables, applied to every input
+                    (see sanitize()).
+        max_messages, max_message_bytes
+                    limits on the messages reported for each input (see
+                    sanitize()).
+        timeout, max_memory
+                    limits on the time and memory sanitizing each input can
+                    take (see sanitize()); the time is counted from when the
+                    font is started on. A font that hits a limit gets the
+                    exception (TimeoutError or MemoryLimitError) as its
+                    result.
+        output_format
+                    "sfnt" (default), "woff" or "woff2" (see sanitize()).
+
+    Returns a list with one entry per input, in input order: an OTSResult (as
+    returned by sanitize() or sanitize_bytes()), or, if the font could not be
+    read or its output could not be written, the exception (e.g. an OSError)
+    describing the failure. A failure never aborts the rest of the batch.
+    """
+    validate = _is_validate(mode)
+    if validate and output_dir is not None:
+        raise ValueError("validating doesn't write any output")
+    table_actions = _table_actions(table_actions)
+    limits = _message_limits(max_messages, max_message_bytes) + _resource_limits(timeout, max_memory)
+    output_format = _output_format(output_format, validate)
 
-    if rmsg is not None:
-        if isinstance(rmsg, bytes):
-            msg = rmsg.decode("ascii", errors="backslashreplace")
+    inputs = list(inputs)
+    outputs = []
+    for item in inputs:
+        if output_dir is None or not isinstance(item, (str, os.PathLike)):
+            outputs.append(None)
         else:
-            msg = rmsg
+            outputs.append(_output_path(output_dir, item, output_format))
+
+    raw_results = _pyots._sanitize_many(
+        inputs,
+        outputs,
+        quiet,
+        font_index,
+        validate,
+        workers or os.cpu_count() or 1,
+        table_actions,
+        *limits,
+        output_format,
+    )
+
+    results = []
+    for raw in raw_results:
+        if isinstance(raw, BaseException):
+            results.append(raw)
+        else:
+            results.append(OTSResult(raw))
+
+    return results
+
+
+async def sanitize_async(
+    input,
+    output=None,
+    quiet=False,
+    font_index=-1,
+    cache=None,
+    mode="sanitize",
+    workers=None,
+    profile=False,
+    table_actions=None,
+    max_messages=1000,
+    max_message_bytes=2**20,
+    timeout=None,
+    max_memory=None,
+    executor=None,
+    output_format="sfnt",
+) -> OTSResult:
+    """
+    Sanitize a font without blocking the asyncio event loop: the work is done
+    in 'executor' (a concurrent.futures.Executor; the event loop's default
+    executor if not specified). Sanitization releases the GIL, so fonts
+    sanitized from several tasks are sanitized in parallel.
+
+    'input' is a path, like for sanitize(), or a bytes-like object holding
+    font data, like for sanitize_bytes() (in which case 'output' can't be
+    given). The other options are the same as for sanitize().
+
+    Cancelling the awaiting task cancels the sanitization if it hasn't started
+    yet; one that is already running completes in the background, and its
+    result is discarded.
+    """
+    if _is_font_data(input):
+        if output is not None:
+            raise ValueError("output can only be given for fonts read from a file")
+        call = functools.partial(
+            sanitize_bytes,
+            input,
+            quiet,
+            font_index,
+            cache,
+            mode,
+            workers,
+            profile,
+            table_actions,
+            max_messages,
+            max_message_bytes,
+            timeout,
+            max_memory,
+            output_format,
+        )
+    else:
+        call = functools.partial(
+            sanitize,
+            input,
+            output,
+            quiet,
+            font_index,
+            cache,
+            mode,
+            workers,
+            profile,
+            table_actions,
+            max_messages,
+            max_message_bytes,
+            timeout,
+            max_memory,
+            output_format,
+        )
+
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+async def sanitize_many_async(
+    inputs,
+    output_dir=None,
+    quiet=False,
+    font_index=-1,
+    mode="sanitize",
+    concurrency=None,
+    executor=None,
+    table_actions=None,
+    max_messages=1000,
+    max_message_bytes=2**20,
+    timeout=None,
+    max_memory=None,
+    output_format="sfnt",
+) -> list:
+    """
+    Sanitize a batch of fonts with sanitize_async(), at most 'concurrency'
+    (default: os.cpu_count()) at a time. 'inputs' and the other options are
+    the same as for sanitize_many().
+
+    Returns a list like sanitize_many(): an OTSResult or, if the font could not
+    be read or its output could not be written, the exception describing the
+    failure, for each input in input order. Cancelling the batch cancels all
+    the sanitizations that haven't completed.
+    """
+    if _is_validate(mode) and output_dir is not None:
+        raise ValueError("validating doesn't write any output")
+    # fail before starting on the batch
+    _table_actions(table_actions)
+    _message_limits(max_messages, max_message_bytes)
+    _resource_limits(timeout, max_memory)
+    output_format_index = _output_format(output_format, _is_validate(mode))
+
+    semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+    async def one(item):
+        output = None
+        if output_dir is not None and not _is_font_data(item):
+            output = _output_path(output_dir, item, output_format_index)
+        async with semaphore:
+            try:
+                return await sanitize_async(
+                    item,
+                    output,
+                    quiet,
+                    font_index,
+                    mode=mode,
+                    table_actions=table_actions,
+                    max_messages=max_messages,
+                    max_message_bytes=max_message_bytes,
+                    timeout=timeout,
+                    max_memory=max_memory,
+                    executor=executor,
+                    output_format=output_format,
+                )
+            except (OSError, MemoryError) as e:
+                return e
+
+    return await asyncio.gather(*(one(item) for item in inputs))
+
+
+def inspect(input) -> OTSFontInfo:
+    """
+    Read the header and table directory of a font, without sanitizing it:
+    its format, its fonts (if it is a collection) and their tables, with
+    their sizes. This is cheap, whatever the size of the font (no table is
+    looked at, let alone decompressed), so it can be used to decide what to
+    do with a font before sanitizing it.
+
+    'input' is a path, or a bytes-like object holding font data. Where the
+    tables are is checked to be within the font, but nothing more: a font
+    that can be inspected may well fail to sanitize.
+
+    Raises ValueError if 'input' isn't a font, or its header or table
+    directory is truncated or points outside of it; OSError if it can't be
+    read.
+    """
+    format, length, sfnt_length, faces = _pyots._inspect(input)
+    return OTSFontInfo(
+        _FONT_FORMATS[format],
+        length,
+        sfnt_length,
+        tuple(
+            OTSFaceInfo(
+                flavor.to_bytes(4, "big").decode("latin-1"),
+                {tag: OTSTableInfo(*table) for (tag, *table) in tables},
+            )
+            for flavor, tables in faces
+        ),
+    )
+
+
+class Sanitizer:
+    """
+    Sanitizes font after font with the same options, for workloads of many
+    small fonts (icon fonts, subset webfonts, ...), where setting up each call
+    costs about as much as sanitizing. The options are checked and converted
+    once, when the sanitizer is made, and the buffer the sanitized font is
+    written to is kept from one call to the next (unless it is larger than 16
+    MiB), so fonts of similar sizes don't need to allocate one each.
+
+    The options are those of sanitize_bytes(). A sanitizer can be shared
+    between threads; fonts sanitized at the same time don't share the kept
+    buffer, and are sanitized in parallel.
+
+        sanitizer = pyots.Sanitizer(quiet=True, table_actions={"DSIG": "drop"})
+        for path in paths:
+            result = sanitizer.sanitize(path)
+
+    With 'table_cache_size', a number of bytes, the sanitizer also remembers
+    the tables that came out of sanitizing unchanged (and without a message
+    about them), up to that many bytes of them, and passes the same tables
+    through, rather than sanitizing them again, in the fonts that follow.
+    Fonts that share large tables (e.g. the fonts of a family, rebuilt after
+    a change to their names) then cost little more than their other tables.
+    Only the tables of TrueType/OpenType fonts (not collections, WOFF or
+    WOFF2) that OTS doesn't look at while sanitizing other tables, or fix up
+    other tables while sanitizing, can be memoized: CFF, CFF2, GSUB, GPOS,
+    COLR, the variation tables (gvar, HVAR, ...), STAT and gasp. A table is
+    only passed through if it is the same, byte for byte, as one that was
+    sanitized, and so are the tables OTS looks at while sanitizing it. When
+    the sanitized font isn't kept, STAT and gasp aren't memoized: OTS writes
+    them out anew, and only the tables it copies from the input are known to
+    be unchanged without it.
+    """
+
+    __slots__ = ("_native", "_options")
+
+    def __init__(
+        self,
+        quiet=False,
+        font_index=-1,
+        cache=None,
+        mode="sanitize",
+        workers=None,
+        profile=False,
+        table_actions=None,
+        max_messages=1000,
+        max_message_bytes=2**20,
+        timeout=None,
+        max_memory=None,
+        output_format="sfnt",
+        table_cache_size=None,
+    ):
+        validate = _is_validate(mode)
+        if cache is not None and profile:
+            raise ValueError("profiling can't be combined with a cache")
+        if table_cache_size is not None:
+            if table_cache_size < 1:
+                raise ValueError(f"table_cache_size must be at least 1, not {table_cache_size!r}")
+            if cache is not None:
+                raise ValueError("memoizing tables can't be combined with a cache")
+            if validate:
+                raise ValueError("tables are only memoized while sanitizing")
+        self._native = _pyots.Sanitizer(
+            quiet,
+            font_index,
+            validate,
+            _collection_workers(workers),
+            profile,
+            _table_actions(table_actions),
+            *_message_limits(max_messages, max_message_bytes),
+            *_resource_limits(timeout, max_memory),
+            _output_format(output_format, validate),
+            table_cache_size or 0,
+        )
+        self._options = {
+            "quiet": quiet,
+            "font_index": font_index,
+            "cache": cache,
+            "mode": mode,
+            "workers": workers,
+            "profile": profile,
+            "table_actions": table_actions,
+            "max_messages": max_messages,
+            "max_message_bytes": max_message_bytes,
+            "timeout": timeout,
+            "max_memory": max_memory,
+            "output_format": output_format,
+        }
+
+    def sanitize(self, input, output=None) -> OTSResult:
+        """
+        Sanitize 'input', a path, like for sanitize() (writing the sanitized
+        font to 'output'), or a bytes-like object holding font data, like for
+        sanitize_bytes() (in which case 'output' can't be given). Returns an
+        OTSResult like they do.
+        """
+        if self._options["cache"] is not None:
+            # results taken from the cache don't need setting up anything
+            if _is_font_data(input):
+                if output is not None:
+                    raise ValueError("output can only be given for fonts read from a file")
+                return sanitize_bytes(input, **self._options)
+            return sanitize(input, output, **self._options)
+
+        return OTSResult(self._native.sanitize(input, output))
+
+    def table_cache_info(self):
+        """
+        Return how the memoized tables (see 'table_cache_size') are used, as
+        an OTSTableCacheInfo, or None if the sanitizer doesn't memoize tables.
+        """
+        info = self._native.table_cache_info()
+        return OTSTableCacheInfo(*info) if info is not None else None
+
+
+def _is_font_data(input):
+    # like sanitize_many(): anything supporting the buffer protocol is font
+    # data, anything else is a path
+    if isinstance(input, (str, os.PathLike)):
+        return False
+    try:
+        memoryview(input).release()
+    except TypeError:
+        return False
+    return True
+
+
+def _is_validate(mode):
+    if mode not in ("sanitize", "validate"):
+        raise ValueError(f'mode must be "sanitize" or "validate", not {mode!r}')
+    return mode == "validate"
+
+
+def _collection_workers(workers):
+    if workers is None:
+        return 0
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, not {workers!r}")
+    return workers
+
+
+_TABLE_ACTIONS = ("sanitize", "passthrough", "drop")
+
+
+def _table_actions(table_actions):
+    """
+    Check the 'table_actions' option, and return it as the sorted tuple of
+    (tag, action) pairs _pyots takes (None if there are none). Tags shorter
+    than four characters are padded with spaces, as in the font ("cvt" is
+    "cvt ").
+    """
+    if table_actions is None:
+        return None
+    if not isinstance(table_actions, collections.abc.Mapping):
+        raise TypeError(f"table_actions must be a dict, not {type(table_actions).__name__}")
+    actions = {}
+    for tag, action in table_actions.items():
+        if not isinstance(tag, str) or not 1 <= len(tag) <= 4 or not all(" " <= c <= "~" for c in tag):
+            raise ValueError(f"invalid table tag: {tag!r}")
+        if action not in _TABLE_ACTIONS:
+            raise ValueError(f"table action must be one of {', '.join(_TABLE_ACTIONS)}, not {action!r}")
+        actions[tag.ljust(4)] = action
+    return tuple(sorted(actions.items())) or None
+
+
+_OUTPUT_FORMATS = ("sfnt", "woff", "woff2")
+# the formats of fonts inspect() reads, as _pyots numbers them
+_FONT_FORMATS = ("sfnt", "collection", "woff", "woff2")
+
+
+def _output_format(output_format, validate):
+    """
+    Check the 'output_format' option, and return it as _pyots takes it (its
+    index in _OUTPUT_FORMATS).
+    """
+    if output_format not in _OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(_OUTPUT_FORMATS)}, not {output_format!r}")
+    if validate and output_format != "sfnt":
+        raise ValueError("validating doesn't write any output")
+    return _OUTPUT_FORMATS.index(output_format)
+
+
+def _output_path(output_dir, input, output_format):
+    """
+    Return where sanitize_many() writes the sanitized 'input' in
+    'output_dir': under its own name, or for WOFF and WOFF2 output, under
+    its name with the extension of the format ('output_format' is as
+    _output_format() returns it).
+    """
+    name = os.path.basename(input)
+    if output_format:
+        name = f"{os.path.splitext(name)[0]}.{_OUTPUT_FORMATS[output_format]}"
+    return os.path.join(output_dir, name)
+
+
+def _message_limits(max_messages, max_message_bytes):
+    """
+    Check the 'max_messages' and 'max_message_bytes' options, and return them
+    as _pyots takes them (0 for no limit).
+    """
+    limits = []
+    for name, limit in (("max_messages", max_messages), ("max_message_bytes", max_message_bytes)):
+        if limit is None:
+            limit = 0
+        elif limit < 1:
+            # _pyots takes 0 for no limit, which is what None is for
+            raise ValueError(f"{name} must be at least 1, not {limit!r}")
+        limits.append(limit)
+    return tuple(limits)
+
+
+def _resource_limits(timeout, max_memory):
+    """
+    Check the 'timeout' and 'max_memory' options, and return them as _pyots
+    takes them (0 for no limit).
+    """
+    if timeout is None:
+        timeout = 0.0
+    elif not timeout > 0:
+        raise ValueError(f"timeout must be positive, not {timeout!r}")
+    if max_memory is None:
+        max_memory = 0
+    elif max_memory < 1:
+        raise ValueError(f"max_memory must be at least 1, not {max_memory!r}")
+    return (float(timeout), max_memory)
+
+
+@contextlib.contextmanager
+def _map_input(input, max_memory):
+    """
+    Map the file 'input' into memory, for hashing and sanitizing it in place,
+    after checking that it is no larger than 'max_memory' (0 for no limit)
+    the way _pyots._sanitize() does.
+    """
+    with open(input, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if max_memory and size > max_memory:
+            raise MemoryLimitError(f"sanitizing needs more than {max_memory} bytes")
+        if not size:
+            # empty files can't be mapped
+            yield b""
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def _sanitize_cached(
+    cache,
+    data,
+    quiet,
+    font_index,
+    validate,
+    need_data,
+    workers=0,
+    table_actions=None,
+    limits=(0, 0, 0.0, 0),
+    output_format=0,
+):
+    """
+    Look the result up in 'cache', sanitizing the font if it isn't there.
+    Returns the result as _pyots._sanitize_bytes() does, but without the
+    results for the fonts of a collection, which aren't cached.
+    """
+    mode = "validate" if validate else "sanitize"
+    key = cache.key(
+        data,
+        quiet,
+        font_index,
+        mode,
+        members=bool(workers),
+        table_actions=table_actions,
+        max_messages=limits[0],
+        max_message_bytes=limits[1],
+        output_format=_OUTPUT_FORMATS[output_format],
+    )
+    raw = cache.get(key, need_data)
+    if raw is None:
+        raw = _pyots._sanitize_bytes(
+            data, quiet, font_index, validate, workers, False, table_actions, *limits, output_format
+        )
+        raw = (*raw[:4], raw[6] if len(raw) > 6 else None, raw[7] if len(raw) > 7 else 0)
+        cache.put(key, raw)
+    sanitized, modified, messages, data, changed_tables, omitted_messages = raw
+    return (sanitized, modified, messages, data, None, None, changed_tables, omitted_messages or None)
+
+
+def _write_output(output, data):
+    """
+    Write 'data' to 'output' the way _pyots._sanitize() does: to an open file
+    descriptor, a file object, or (atomically) to a path.
+    """
+    if output is None or output is False or output == "":
+        return
+    if isinstance(output, int) and not isinstance(output, bool):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(output, view) :]
+    elif hasattr(output, "write") and not isinstance(output, (str, bytes)):
+        output.write(data)
     else:
-        msg = ""
+        path = os.fspath(output)
+        temp = _temp_path(path)
+        try:
+            with open(temp, "wb") as fp:
+                fp.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+
+def _make_messages(raw):
+    """
+    Make the OTSResult.messages tuple from the (level, tag, text, count) records
+    returned by _pyots, or from the messages as printed by OTS (one per line).
+    A result without messages has a single empty message.
+    """
+    if isinstance(raw, bytes):
+        raw = raw.decode("ascii", errors="backslashreplace")
+    if isinstance(raw, str):
+        return tuple(_parse_message(line) for line in raw.strip().split("\n"))
+    if not raw:
+        return (OTSMessage(None, None, ""),)
+    return tuple(OTSMessage(*message) for message in raw)
+
+
+def _parse_message(line):
+    level = None
+    for prefix, prefix_level in (("ERROR: ", OTSMessage.ERROR), ("WARNING: ", OTSMessage.WARNING)):
+        if line.startswith(prefix):
+            level = prefix_level
+            line = line[len(prefix) :]
+            break
+
+    tag = None
+    if line[4:6] == ": " and all(" " <= c <= "~" for c in line[:4]):
+        tag = line[:4]
+        line = line[6:]
 
-    return OTSResult((san, mod, msg))
+    return OTSMessage(level, tag, line)
@@ -0,0 +1,280 @@
+# Copyright (c) 2020 The OTS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Command-line interface: sanitize files and directory trees on a pool of
+# processes or threads, reporting a JSON Lines record per font.
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import json
+import os
+import sys
+
+import pyots
+
+FONT_EXTENSIONS = {".ttf", ".otf", ".ttc", ".otc", ".woff", ".woff2"}
+
+
+def _find_fonts(paths):
+    """
+    Yield (path, output name) for every font to sanitize: the files in
+    'paths', and the font files found under the directories in 'paths'. The
+    output name is where, relative to the output directory, the sanitized
+    font goes: fonts found under a directory keep their place in its tree.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() in FONT_EXTENSIONS:
+                        font = os.path.join(dirpath, filename)
+                        yield font, os.path.relpath(font, path)
+        else:
+            yield path, _output_name(path)
+
+
+def _output_name(path):
+    # a file given on its own keeps its relative path (so that e.g. the output
+    # of 'find' is mirrored too), unless that would leave the output directory
+    name = os.path.normpath(path)
+    if os.path.isabs(name) or name == os.pardir or name.startswith(os.pardir + os.sep):
+        return os.path.basename(name)
+    return name
+
+
+def _expand_stdin(paths):
+    # '-' stands for the paths read from stdin, one per line
+    for path in paths:
+        if path != "-":
+            yield path
+            continue
+        for line in sys.stdin:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+
+
+def _done_paths(results):
+    """
+    Return the paths that already have a result in the JSON Lines file
+    'results' (records for fonts that could not be read or written don't
+    count, so they are tried again).
+    """
+    done = set()
+    try:
+        with open(results, encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # e.g. the last line of an interrupted run
+                if isinstance(record, dict) and "sanitized" in record:
+                    done.add(record.get("path"))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _open_results(results):
+    if results is None:
+        return contextlib.nullcontext(sys.stdout)
+    fp = open(results, "a", encoding="utf-8")  # noqa: SIM115
+    if fp.tell():
+        # finish the last line of an interrupted run
+        with open(results, "rb") as last:
+            last.seek(-1, os.SEEK_END)
+            if last.read() != b"\n":
+                fp.write("\n")
+    return fp
+
+
+def _sanitize_one(task):
+    """
+    Sanitize one font and return its JSON Lines record. Runs in the pool, so
+    it only takes and returns plain (picklable) values.
+    """
+    path, output, quiet, font_index, mode, timeout, max_memory, output_format, written_for = task
+    if written_for is not None:
+        # another font already goes to 'output'; don't overwrite it
+        return {"path": path, "output": None, "error": f"{output} is the output of {written_for} already"}
+
+    record = {"path": path, "output": output}
+    try:
+        if output is not None:
+            os.makedirs(os.path.dirname(output) or os.curdir, exist_ok=True)
+        result = pyots.sanitize(
+            path,
+            output=output,
+            quiet=quiet,
+            font_index=font_index,
+            mode=mode,
+            timeout=timeout,
+            max_memory=max_memory,
+            output_format=output_format,
+        )
+        if not result.sanitized:
+            # (a font that isn't sanitized isn't written)
+            record["output"] = None
+    except (OSError, pyots.MemoryLimitError) as e:
+        # (a font that hits --timeout gets a TimeoutError, an OSError)
+        record["output"] = None
+        record["error"] = str(e)
+        return record
+
+    record["sanitized"] = result.sanitized
+    record["modified"] = result.modified
+    record["changed_tables"] = list(result.changed_tables) if result.changed_tables is not None else None
+    record["messages"] = [str(m) for m in result.messages if m]
+    return record
+
+
+def _imap(executor, fn, items, window):
+    """
+    Like executor.map(fn, items), but with at most 'window' calls submitted
+    ahead of the results that have been consumed, so huge inputs are neither
+    read nor queued all at once.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="pyots",
+        description="Sanitize fonts with OTS, writing a JSON Lines record for each one.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="font files, and directories to search for fonts (recursively). "
+        "If none are given, or '-' is, paths are read from stdin, one per line.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="write the sanitized fonts here, mirroring the input tree. "
+        "Fonts that fail to sanitize aren't written.",
+    )
+    parser.add_argument(
+        "-r", "--results", help="append the JSON Lines results to this file instead of writing to stdout"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip fonts that already have a result in the --results file",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of fonts sanitized at a time"
+    )
+    parser.add_argument(
+        "--executor",
+        choices=("thread", "process"),
+        default="thread",
+        help="sanitize on a pool of threads (the default: pyots releases the GIL "
+        "while it works) or of processes",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't collect OTS messages")
+    parser.add_argument("--font-index", type=int, default=-1, help="font index for TTC/OTC")
+    parser.add_argument("--mode", choices=("sanitize", "validate"), default="sanitize")
+    parser.add_argument(
+        "--timeout", type=float, help="give up on fonts that take longer than this many seconds to sanitize"
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        help="give up on fonts whose input, decompressed or sanitized data is larger than this many bytes",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=("sfnt", "woff", "woff2"),
+        default="sfnt",
+        help="write the sanitized fonts as TrueType/OpenType (the default), WOFF or WOFF2; "
+        "WOFF and WOFF2 fonts get a .woff or .woff2 extension",
+    )
+
+    args = parser.parse_args(argv)
+    if args.resume and not args.results:
+        parser.error("--resume needs a --results file")
+    if args.mode == "validate" and (args.output_dir or args.output_format != "sfnt"):
+        parser.error("validating doesn't write any output")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.timeout is not None and not args.timeout > 0:
+        parser.error("--timeout must be positive")
+    if args.max_memory is not None and args.max_memory < 1:
+        parser.error("--max-memory must be at least 1")
+    return args
+
+
+def main(argv=None):
+    """
+    Entry point of the 'pyots' command (and of 'python -m pyots'). Returns 0
+    if all fonts were sanitized, 1 if any failed or could not be read or
+    written.
+    """
+    args = _parse_args(argv)
+
+    paths = _expand_stdin(args.paths or ["-"])
+    done = _done_paths(args.results) if args.resume else set()
+
+    # the fonts the outputs are for, by output, so that a font whose output
+    # would be another's (e.g. x.ttf and x.otf, both written as x.woff2) fails
+    # rather than overwriting it
+    outputs = {}
+
+    def tasks():
+        for path, name in _find_fonts(paths):
+            output = written_for = None
+            if args.output_dir:
+                output = os.path.join(args.output_dir, name)
+                if args.output_format != "sfnt":
+                    output = f"{os.path.splitext(output)[0]}.{args.output_format}"
+                written_for = outputs.setdefault(os.path.normcase(os.path.normpath(output)), path)
+                if written_for == path:
+                    written_for = None
+            if path in done:
+                continue
+            yield (
+                path,
+                output,
+                args.quiet,
+                args.font_index,
+                args.mode,
+                args.timeout,
+                args.max_memory,
+                args.output_format,
+                written_for,
+            )
+
+    if args.executor == "process":
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs)
+
+    status = 0
+    with _open_results(args.results) as out:
+        try:
+            for record in _imap(executor, _sanitize_one, tasks(), args.jobs * 4):
+                if not record.get("sanitized"):
+                    status = 1
+                # one line per font, flushed as it's done, so an interrupted
+                # run can be resumed
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+        finally:
+            # on an interrupt, don't start on the fonts that are still queued
+            executor.shutdown(cancel_futures=True)
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
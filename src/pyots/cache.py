@@ -0,0 +1,278 @@
+# Copyright (c) 2020 The OTS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Content-addressed cache of sanitization results.
+import collections
+import hashlib
+import itertools
+import json
+import os
+import threading
+
+import _pyots
+
+_SUFFIX = ".otsr"
+_temp_names = itertools.count()
+
+
+def _temp_path(path):
+    """
+    A name for the temporary file 'path' (a str or bytes path) is written to
+    before it is renamed into place. It is unique to this process and thread
+    (the thread id keeps names apart even if next() isn't atomic, as on
+    free-threaded builds).
+    """
+    suffix = f".{os.getpid()}.{threading.get_ident()}.{next(_temp_names)}.tmp"
+    return path + (os.fsencode(suffix) if isinstance(path, bytes) else suffix)
+
+
+class SanitizeCache:
+    """
+    Cache of sanitization results, keyed on a hash of the font data, the OTS
+    version and the sanitize options. Pass it to sanitize() or
+    sanitize_bytes() as 'cache=' to skip sanitizing fonts that were seen
+    before. Options:
+        directory       directory for the on-disk tier. If not specified, results
+                        are only cached in memory. The directory can be shared
+                        between processes.
+        max_entries     number of results kept in memory. Default 1024.
+        max_memory_size total size (in bytes) of the sanitized fonts kept in
+                        memory. Default 256 MiB.
+        max_disk_size   total size (in bytes) of the on-disk tier; the least
+                        recently used entries are removed to stay below it.
+                        Default 1 GiB.
+        store_data      keep the sanitized fonts, so hits can also write output
+                        (or return data, for sanitize_bytes()). Default True.
+
+    The cache counts its hits and misses in 'hits', 'misses', 'memory_hits'
+    and 'disk_hits'. A SanitizeCache can be shared between threads.
+    """
+
+    def __init__(
+        self,
+        directory=None,
+        max_entries=1024,
+        max_memory_size=256 * 2**20,
+        max_disk_size=2**30,
+        store_data=True,
+    ):
+        self.directory = os.fspath(directory) if directory is not None else None
+        self.max_entries = max_entries
+        self.max_memory_size = max_memory_size
+        self.max_disk_size = max_disk_size
+        self.store_data = store_data
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None  # computed on first use
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(
+        data,
+        quiet=False,
+        font_index=-1,
+        mode="sanitize",
+        members=False,
+        table_actions=None,
+        max_messages=None,
+        max_message_bytes=None,
+        output_format="sfnt",
+    ):
+        """
+        Return the cache key for sanitizing 'data' (a bytes-like object) with
+        the given options. 'members' is whether the fonts of a collection
+        are sanitized separately (i.e. sanitize() is given 'workers'); the
+        other options are those of sanitize().
+        """
+        options = f"{_pyots.version}\0{bool(quiet)}\0{font_index}\0{mode}\0"
+        # no limit (None, or 0 as _pyots takes it) is filed as 0: sanitize()
+        # only takes limits of at least 1
+        options += f"{max_messages or 0}\0{max_message_bytes or 0}\0"
+        if output_format != "sfnt":
+            options += f"{output_format}\0"
+        if members:
+            options += "members\0"
+        for tag, action in sorted(dict(table_actions or {}).items()):
+            options += f"{tag.ljust(4)}={action}\0"
+        h = hashlib.sha256(options.encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def get(self, key, need_data=False):
+        """
+        Return the cached (sanitized, modified, messages, data,
+        changed_tables, omitted_messages) for 'key', or None if there is
+        none. With 'need_data', entries for sanitized fonts whose data wasn't
+        kept are treated as missing.
+        """
+        with self._lock:
+            raw = self._memory.get(key)
+            if raw is not None and self._usable(raw, need_data):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return raw
+
+        raw = self._read(key) if self.directory is not None else None
+        with self._lock:
+            if raw is not None and self._usable(raw, need_data):
+                self._remember(key, raw)
+                self.hits += 1
+                self.disk_hits += 1
+                return raw
+            self.misses += 1
+        return None
+
+    def put(self, key, raw):
+        """
+        Store the (sanitized, modified, messages, data, changed_tables,
+        omitted_messages) result of sanitizing the font 'key' was computed
+        for.
+        """
+        sanitized, modified, messages, data, changed_tables, omitted_messages = raw
+        if not self.store_data:
+            data = None
+        if changed_tables is not None:
+            changed_tables = tuple(changed_tables)
+        raw = (bool(sanitized), bool(modified), messages, data, changed_tables, omitted_messages)
+
+        with self._lock:
+            self._remember(key, raw)
+        if self.directory is not None:
+            self._write(key, raw)
+
+    def clear(self):
+        """
+        Remove all entries, from memory and from disk, and reset the counters.
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            self.hits = self.misses = self.memory_hits = self.disk_hits = 0
+        if self.directory is not None:
+            for path, _ in self._disk_entries():
+                _remove(path)
+            self._disk_size = 0
+
+    @staticmethod
+    def _usable(raw, need_data):
+        return not need_data or not raw[0] or raw[3] is not None
+
+    def _remember(self, key, raw):
+        # callers hold self._lock
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[3] or b"")
+        self._memory[key] = raw
+        self._memory_size += len(raw[3] or b"")
+        while self._memory and (
+            len(self._memory) > self.max_entries or self._memory_size > self.max_memory_size
+        ):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted[3] or b"")
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _read(self, key):
+        # an entry is a line of JSON describing the result, followed by the
+        # sanitized font (if it was kept)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                header = json.loads(fp.readline())
+                # entries written before changed_tables was kept (whose
+                # 'modified' isn't to be trusted) don't count
+                changed_tables = header["changed_tables"]
+                omitted_messages = header["omitted_messages"]
+                data = fp.read() if header["data"] else None
+            os.utime(path)  # for least recently used eviction
+        except (OSError, ValueError, KeyError):
+            return None
+        if changed_tables is not None:
+            changed_tables = tuple(changed_tables)
+        return (
+            header["sanitized"],
+            header["modified"],
+            header["messages"],
+            data,
+            changed_tables,
+            omitted_messages,
+        )
+
+    def _write(self, key, raw):
+        sanitized, modified, messages, data, changed_tables, omitted_messages = raw
+        header = json.dumps(
+            {
+                "sanitized": sanitized,
+                "modified": modified,
+                "messages": messages,
+                "data": data is not None,
+                "changed_tables": changed_tables,
+                "omitted_messages": omitted_messages,
+            }
+        )
+        entry = header.encode() + b"\n" + (data or b"")
+
+        # write to a temporary file and rename it into place, so readers (in
+        # this or other processes) never see a partial entry
+        path = self._path(key)
+        temp = _temp_path(path)
+        try:
+            with open(temp, "wb") as fp:
+                fp.write(entry)
+            os.replace(temp, path)
+        except OSError:
+            _remove(temp)
+            return
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size in self._disk_entries())
+            else:
+                self._disk_size += len(entry)
+            if self._disk_size <= self.max_disk_size:
+                return
+        self._evict()
+
+    def _disk_entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry.path, st.st_size, st.st_mtime))
+        return [(path, size) for path, size, _ in sorted(entries, key=lambda e: e[2])]
+
+    def _evict(self):
+        # other processes may share the directory, so go by what's on disk
+        entries = self._disk_entries()
+        total = sum(size for _, size in entries)
+        for path, size in entries:
+            if total <= self.max_disk_size:
+                break
+            if _remove(path):
+                total -= size
+        with self._lock:
+            self._disk_size = total
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
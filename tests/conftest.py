@@ -0,0 +1,31 @@
+"""
+Helpers shared by the tests: where the OTS test fonts are, and how to list
+and compare them.
+"""
+
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.resolve()
+TEST_FONTS_DIR = ROOT / "src" / "ots" / "tests" / "fonts"
+KNOWN_EXTENSIONS = {".ttf", ".woff", ".ttc", ".woff2", ".otf"}
+
+
+def font_files(*subdirs, suffixes=KNOWN_EXTENSIONS):
+    """
+    The fonts in each of 'subdirs' (of the OTS test fonts, e.g. "good"), in
+    order, that have one of 'suffixes'.
+    """
+    files = []
+    for subdir in subdirs:
+        for f in sorted((TEST_FONTS_DIR / subdir).iterdir()):
+            if f.suffix.lower() in suffixes:
+                files.append(f)
+    return files
+
+
+def summary(result, *fields):
+    """
+    What tells two OTSResults apart: whether the font was sanitized and
+    modified, its messages, and the other 'fields' named (e.g. "data").
+    """
+    return (result.sanitized, result.modified, result.messages) + tuple(getattr(result, f) for f in fields)
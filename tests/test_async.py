@@ -0,0 +1,177 @@
+"""
+Tests for the asyncio API: sanitize_async() and sanitize_many_async() must give
+the same results as their blocking counterparts, without blocking the event
+loop.
+"""
+
+import asyncio
+import os
+import statistics
+import threading
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import pyots
+from tests.conftest import font_files, summary
+
+
+def test_sanitize_async():
+    files = font_files("good", "bad")
+
+    async def run():
+        return await asyncio.gather(*(pyots.sanitize_async(f) for f in files))
+
+    assert [summary(r, "data") for r in asyncio.run(run())] == [
+        summary(pyots.sanitize(f), "data") for f in files
+    ]
+
+
+def test_sanitize_async_bytes():
+    files = font_files("good", "bad")
+
+    async def run():
+        return await asyncio.gather(*(pyots.sanitize_async(f.read_bytes()) for f in files))
+
+    expected = [summary(pyots.sanitize_bytes(f.read_bytes()), "data") for f in files]
+    assert [summary(r, "data") for r in asyncio.run(run())] == expected
+
+
+def test_sanitize_async_output(tmp_path):
+    f = font_files("good")[0]
+    asyncio.run(pyots.sanitize_async(f, output=tmp_path / f.name))
+    assert (tmp_path / f.name).read_bytes() == pyots.sanitize_bytes(f.read_bytes()).data
+
+    with pytest.raises(ValueError):
+        asyncio.run(pyots.sanitize_async(f.read_bytes(), output=tmp_path / f.name))
+
+
+def test_sanitize_many_async(tmp_path):
+    files = font_files("good", "bad")
+    missing = tmp_path / "missing.ttf"
+    inputs = [*files, missing, files[0].read_bytes()]
+
+    results = asyncio.run(pyots.sanitize_many_async(inputs, concurrency=2))
+
+    assert len(results) == len(inputs)
+    assert [summary(r, "data") for r in results[: len(files)]] == [
+        summary(pyots.sanitize(f), "data") for f in files
+    ]
+    assert isinstance(results[len(files)], FileNotFoundError)
+    assert results[-1].data == pyots.sanitize_bytes(inputs[-1]).data
+
+
+def test_sanitize_many_async_concurrency():
+    files = font_files("good") * 4
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def tracking(call):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        try:
+            return call()
+        finally:
+            with lock:
+                running -= 1
+
+    class TrackingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            return super().submit(tracking, lambda: fn(*args, **kwargs))
+
+    with TrackingExecutor(max_workers=8) as executor:
+        asyncio.run(pyots.sanitize_many_async(files, concurrency=2, executor=executor))
+
+    assert 1 <= peak <= 2
+
+
+def test_sanitize_many_async_cancel():
+    files = font_files("good") * 8
+    started = 0
+    release = threading.Event()
+
+    def blocking(call):
+        nonlocal started
+        started += 1
+        release.wait()
+        return call()
+
+    class BlockingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            return super().submit(blocking, lambda: fn(*args, **kwargs))
+
+    async def run(executor):
+        task = asyncio.ensure_future(pyots.sanitize_many_async(files, concurrency=2, executor=executor))
+        while started < 2:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with BlockingExecutor(max_workers=2) as executor:
+        asyncio.run(run(executor))
+        release.set()
+
+    # the semaphore kept the rest of the batch from ever being submitted
+    assert started == 2
+
+
+async def _loop_lag(work, interval=0.001):
+    """
+    Run 'work' while measuring how late a ticker waking up every 'interval'
+    seconds is. Returns the list of delays, in seconds.
+    """
+    delays = []
+    done = False
+
+    async def ticker():
+        while not done:
+            start = timeit.default_timer()
+            await asyncio.sleep(interval)
+            delays.append(timeit.default_timer() - start - interval)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)
+    await work()
+    done = True
+    await tick
+    return delays
+
+
+def cmp_event_loop_latency(fonts=None, concurrency=None, rounds=4):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Measures event-loop latency while sanitizing fonts concurrently, with blocking
+    sanitize() calls in coroutines vs. sanitize_async():
+        python -c "from tests.test_async import cmp_event_loop_latency; cmp_event_loop_latency()"
+    """
+    fonts = [Path(f) for f in (fonts or font_files("good"))]
+    payloads = [f.read_bytes() for f in fonts] * rounds
+    concurrency = concurrency or os.cpu_count() or 1
+
+    async def blocking():
+        async def one(data):
+            await asyncio.sleep(0)
+            return pyots.sanitize_bytes(data)
+
+        await asyncio.gather(*(one(data) for data in payloads))
+
+    async def non_blocking():
+        await pyots.sanitize_many_async(payloads, concurrency=concurrency)
+
+    for name, work in (("sanitize_bytes", blocking), ("sanitize_many_async", non_blocking)):
+        start = timeit.default_timer()
+        delays = asyncio.run(_loop_lag(work))
+        elapsed = timeit.default_timer() - start
+        delays.sort()
+        p99 = delays[int(len(delays) * 0.99)] if delays else 0.0
+        print(
+            f"[latency] {name}: {elapsed:.3f}s total, loop lag "
+            f"median {statistics.median(delays or [0]) * 1000:.2f}ms, "
+            f"p99 {p99 * 1000:.2f}ms, max {max(delays or [0]) * 1000:.2f}ms"
+        )
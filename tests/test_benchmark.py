@@ -0,0 +1,205 @@
+"""
+Benchmarks of pyots over the OTS test corpus: per-font latency (p50/p99),
+throughput of the single-threaded, multi-threaded and batch paths, and the
+peak memory a call takes. The results are JSON, so runs can be kept and
+compared, e.g. before and after an OTS version bump.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pyots
+from tests.conftest import font_files
+
+# measures the peak RSS of one call, in a fresh interpreter: the peak RSS
+# of the interpreter once pyots is imported, and after the call (ru_maxrss
+# only ever grows, so a call that needs little memory may not move it)
+RSS_SCRIPT = """
+import resource, sys
+import pyots
+
+def peak():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+data = open(sys.argv[1], "rb").read()
+before = peak()
+pyots.sanitize_bytes(data, quiet=True)
+print(before, peak())
+"""
+
+
+def _percentile(values, percent):
+    """
+    The 'percent' percentile of 'values', interpolating between the closest
+    ranks.
+    """
+    values = sorted(values)
+    rank = (len(values) - 1) * percent / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _latency(func, inputs, repeat):
+    """
+    Time 'func' on each of 'inputs', 'repeat' times (after one untimed call,
+    to warm up), and summarize the per-call times, in seconds.
+    """
+    times = []
+    for item in inputs:
+        func(item)
+        for _ in range(repeat):
+            start = timeit.default_timer()
+            func(item)
+            times.append(timeit.default_timer() - start)
+    return {
+        "calls": len(times),
+        "p50": _percentile(times, 50),
+        "p99": _percentile(times, 99),
+        "max": max(times),
+        "fonts_per_second": len(times) / sum(times),
+    }
+
+
+def _throughput(func, inputs, repeat):
+    """
+    Time 'func' on the whole of 'inputs', 'repeat' times, and return the best
+    throughput, in fonts per second.
+    """
+    func(inputs)
+    best = min(timeit.repeat(lambda: func(inputs), number=1, repeat=repeat))
+    return {"fonts": len(inputs), "seconds": best, "fonts_per_second": len(inputs) / best}
+
+
+def _peak_rss(files):
+    """
+    Return {font name: {"base": peak RSS before sanitizing it, "peak": peak
+    RSS after}}, in bytes, or None where the peak RSS can't be measured.
+    """
+    if sys.platform == "win32":
+        return None
+    peaks = {}
+    for f in files:
+        proc = subprocess.run(
+            [sys.executable, "-c", RSS_SCRIPT, str(f)], capture_output=True, text=True, check=True
+        )
+        base, peak = (int(n) for n in proc.stdout.split())
+        peaks[f.name] = {"base": base, "peak": peak}
+    return peaks
+
+
+def benchmark(files=None, repeat=5, threads=None, rss=True):
+    """
+    Run the benchmarks over 'files' (the test corpus by default) and return
+    the results, as a dict that can be dumped as JSON.
+    """
+    files = [Path(f) for f in (files or font_files("good", "bad", "fuzzing"))]
+    threads = threads or os.cpu_count() or 1
+    data = [f.read_bytes() for f in files]
+    sanitizer = pyots.Sanitizer(quiet=True)
+
+    def sanitize_threads(inputs):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(pyots.sanitize, inputs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = {f: Path(tmp) / f"{i}{f.suffix}" for i, f in enumerate(files)}
+        latency = {
+            "sanitize": _latency(pyots.sanitize, files, repeat),
+            "sanitize_output": _latency(lambda f: pyots.sanitize(f, output=outputs[f]), files, repeat),
+            "sanitize_bytes": _latency(pyots.sanitize_bytes, data, repeat),
+            "Sanitizer.sanitize": _latency(sanitizer.sanitize, data, repeat),
+        }
+
+    return {
+        "meta": {
+            "ots": pyots.version,
+            "build_profile": pyots.build_profile,
+            "python": sys.version,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "fonts": [f.name for f in files],
+            "repeat": repeat,
+            "threads": threads,
+        },
+        "latency": latency,
+        "throughput": {
+            "loop": _throughput(lambda inputs: [pyots.sanitize(f) for f in inputs], files, repeat),
+            "threads": _throughput(sanitize_threads, files, repeat),
+            "sanitize_many": _throughput(pyots.sanitize_many, files, repeat),
+            "sanitize_many_bytes": _throughput(pyots.sanitize_many, data, repeat),
+        },
+        "peak_rss": _peak_rss(files) if rss else None,
+    }
+
+
+def _compare(old, new):
+    """
+    Yield (benchmark, old fonts/s, new fonts/s) for each benchmark that is in
+    both the 'old' and 'new' results.
+    """
+    for section in ("latency", "throughput"):
+        for name, result in new[section].items():
+            if name in old[section]:
+                yield f"{section}.{name}", old[section][name]["fonts_per_second"], result["fonts_per_second"]
+
+
+def test_benchmark():
+    f = font_files("good", "bad", "fuzzing")[0]
+    results = benchmark([f], repeat=1, threads=2)
+    assert json.loads(json.dumps(results)) == results
+    assert results["meta"]["fonts"] == [f.name]
+    assert results["meta"]["build_profile"] in ("default", "lto", "pgo")
+    for result in results["latency"].values():
+        assert result["calls"] == 1
+        assert 0 < result["p50"] <= result["p99"] <= result["max"]
+    for result in results["throughput"].values():
+        assert result["fonts"] == 1
+        assert result["fonts_per_second"] > 0
+    if results["peak_rss"] is not None:
+        rss = results["peak_rss"][f.name]
+        assert 0 < rss["base"] <= rss["peak"]
+
+    assert [name for name, _, _ in _compare(results, results)] == [
+        f"{section}.{name}" for section in ("latency", "throughput") for name in results[section]
+    ]
+
+
+def test_percentile():
+    assert _percentile([3.0], 99) == 3.0
+    assert _percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert _percentile(list(range(101)), 99) == 99
+
+
+def cmp_benchmark(output=None, baseline=None, tolerance=0.1):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Benchmarks the test corpus and writes the results, as JSON, to 'output'
+    (or prints them). With 'baseline', the results of an earlier run, the
+    benchmarks that got more than 'tolerance' slower are listed too:
+        python -c "from tests.test_benchmark import cmp_benchmark; cmp_benchmark('new.json', 'old.json')"
+    """
+    results = benchmark()
+    text = json.dumps(results, indent=2)
+    if output:
+        Path(output).write_text(text)
+    else:
+        print(text)
+
+    if baseline:
+        old = json.loads(Path(baseline).read_text())
+        for name, before, after in _compare(old, results):
+            change = after / before - 1
+            flag = " SLOWER" if change < -tolerance else ""
+            print(f"[benchmark] {name}: {before:.1f} -> {after:.1f} fonts/s ({change:+.1%}){flag}")
@@ -0,0 +1,138 @@
+"""
+Tests for pyots.SanitizeCache: cached results must be identical to sanitizing
+the font, and hits must not sanitize it again.
+"""
+
+import io
+
+import pytest
+
+import _pyots
+import pyots
+from tests.conftest import font_files, summary
+
+
+@pytest.fixture
+def no_sanitize(monkeypatch):
+    """Make any call into the native sanitizer fail the test."""
+
+    def fail(*args):
+        raise AssertionError("font was sanitized despite a cache hit")
+
+    def patch():
+        monkeypatch.setattr(_pyots, "_sanitize", fail)
+        monkeypatch.setattr(_pyots, "_sanitize_bytes", fail)
+
+    return patch
+
+
+def test_cache_results(no_sanitize):
+    cache = pyots.SanitizeCache()
+    files = font_files("good", "bad")
+    expected = [summary(pyots.sanitize(f), "data") for f in files]
+
+    assert [summary(pyots.sanitize(f, cache=cache), "data") for f in files] == expected
+    assert (cache.hits, cache.misses) == (0, len(files))
+
+    no_sanitize()
+    assert [summary(pyots.sanitize(f, cache=cache), "data") for f in files] == expected
+    assert (cache.hits, cache.misses) == (len(files), len(files))
+    assert cache.memory_hits == len(files)
+
+
+def test_cache_bytes(no_sanitize):
+    cache = pyots.SanitizeCache()
+    files = font_files("good", "bad")
+    expected = [summary(pyots.sanitize_bytes(f.read_bytes()), "data") for f in files]
+
+    assert [summary(pyots.sanitize_bytes(f.read_bytes(), cache=cache), "data") for f in files] == expected
+    no_sanitize()
+    assert [summary(pyots.sanitize_bytes(f.read_bytes(), cache=cache), "data") for f in files] == expected
+
+
+def test_cache_options():
+    cache = pyots.SanitizeCache()
+    f = font_files("good")[0]
+
+    pyots.sanitize(f, cache=cache)
+    pyots.sanitize(f, quiet=True, cache=cache)
+    pyots.sanitize(f, font_index=0, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 3)
+
+
+def test_cache_output(tmp_path, no_sanitize):
+    cache = pyots.SanitizeCache()
+    f = font_files("good")[0]
+    expected = pyots.sanitize_bytes(f.read_bytes()).data
+
+    pyots.sanitize(f, output=tmp_path / "miss.ttf", cache=cache)
+    no_sanitize()
+    pyots.sanitize(f, output=tmp_path / "hit.ttf", cache=cache)
+    buf = io.BytesIO()
+    pyots.sanitize(f, output=buf, cache=cache)
+
+    assert (tmp_path / "miss.ttf").read_bytes() == expected
+    assert (tmp_path / "hit.ttf").read_bytes() == expected
+    assert buf.getvalue() == expected
+
+
+def test_cache_without_data():
+    cache = pyots.SanitizeCache(store_data=False)
+    f = font_files("good")[0]
+
+    pyots.sanitize(f, cache=cache)
+    pyots.sanitize(f, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # a hit can't write the output without the sanitized font
+    r = pyots.sanitize_bytes(f.read_bytes(), cache=cache)
+    assert r.data is not None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_disk(tmp_path, no_sanitize):
+    files = font_files("good", "bad")
+    expected = [summary(pyots.sanitize_bytes(f.read_bytes()), "data") for f in files]
+
+    cache = pyots.SanitizeCache(tmp_path)
+    for f in files:
+        pyots.sanitize_bytes(f.read_bytes(), cache=cache)
+
+    # a new cache (e.g. in another process) finds the results on disk
+    cache = pyots.SanitizeCache(tmp_path)
+    no_sanitize()
+    assert [summary(pyots.sanitize_bytes(f.read_bytes(), cache=cache), "data") for f in files] == expected
+    assert cache.disk_hits == len(files)
+
+
+def test_cache_memory_eviction():
+    cache = pyots.SanitizeCache(max_entries=2)
+    files = font_files("good")[:3]
+    for f in files:
+        pyots.sanitize(f, cache=cache)
+
+    pyots.sanitize(files[0], cache=cache)
+    assert (cache.hits, cache.misses) == (0, 4)
+    pyots.sanitize(files[2], cache=cache)
+    assert cache.hits == 1
+
+
+def test_cache_disk_eviction(tmp_path):
+    files = font_files("good")
+    cache = pyots.SanitizeCache(tmp_path, max_disk_size=1)
+    for f in files:
+        pyots.sanitize_bytes(f.read_bytes(), cache=cache)
+
+    # every entry is larger than the limit, so none are kept
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cache_clear(tmp_path):
+    cache = pyots.SanitizeCache(tmp_path)
+    f = font_files("good")[0]
+    pyots.sanitize(f, cache=cache)
+    cache.clear()
+
+    assert list(tmp_path.iterdir()) == []
+    pyots.sanitize(f, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 1)
@@ -0,0 +1,196 @@
+"""
+Tests for the command-line interface (python -m pyots): walking directory
+trees, mirroring them in the output directory, JSON Lines results and resuming
+an interrupted run.
+"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import pyots
+from pyots.__main__ import main
+from tests.conftest import KNOWN_EXTENSIONS, font_files
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    A small tree of fonts: good ones at the top, bad ones in a subdirectory,
+    plus a file that isn't a font.
+    """
+    root = tmp_path / "fonts"
+    (root / "bad").mkdir(parents=True)
+    for f in font_files("good"):
+        shutil.copy(f, root / f.name)
+    for f in font_files("bad"):
+        shutil.copy(f, root / "bad" / f.name)
+    (root / "README.txt").write_text("not a font")
+    return root
+
+
+def _read_results(path):
+    with open(path, encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_cli_tree(tree, tmp_path):
+    out_dir = tmp_path / "out"
+    results = tmp_path / "results.jsonl"
+    status = main([str(tree), "-o", str(out_dir), "-r", str(results), "-j", "2"])
+
+    records = _read_results(results)
+    fonts = sorted(p for p in tree.rglob("*") if p.suffix.lower() in KNOWN_EXTENSIONS)
+    assert sorted(Path(r["path"]) for r in records) == fonts
+    assert status == (0 if all(r["sanitized"] for r in records) else 1)
+
+    for r in records:
+        expected = pyots.sanitize(r["path"])
+        assert r["sanitized"] == expected.sanitized
+        assert r["modified"] == expected.modified
+        assert r["changed_tables"] == (list(expected.changed_tables) if expected.sanitized else None)
+        assert r["messages"] == [m for m in expected.messages if m]
+
+        out = out_dir / Path(r["path"]).relative_to(tree)
+        if r["sanitized"]:
+            assert r["output"] == str(out)
+            assert out.read_bytes() == pyots.sanitize_bytes(Path(r["path"]).read_bytes()).data
+        else:
+            assert r["output"] is None
+            assert not out.exists()
+
+
+def test_cli_resume(tree, tmp_path):
+    results = tmp_path / "results.jsonl"
+    first = sorted(str(p) for p in tree.glob("*") if p.suffix.lower() in KNOWN_EXTENSIONS)
+    main([*first, "-r", str(results)])
+    with open(results, "a", encoding="utf-8") as fp:
+        fp.write('{"path": "interrupted')  # a partially written record
+
+    main([str(tree), "-r", str(results), "--resume"])
+
+    lines = results.read_text(encoding="utf-8").splitlines()
+    records = [json.loads(line) for line in lines if not line.endswith("interrupted")]
+    paths = [r["path"] for r in records]
+    assert len(paths) == len(set(paths)), "resuming sanitized fonts again"
+    assert sorted(paths) == sorted(str(p) for p in tree.rglob("*") if p.suffix.lower() in KNOWN_EXTENSIONS)
+
+
+def test_cli_stdin(tree, tmp_path, monkeypatch, capsys):
+    fonts = sorted(p for p in tree.rglob("*") if p.suffix.lower() in KNOWN_EXTENSIONS)
+    monkeypatch.chdir(tree.parent)
+    paths = [os.path.relpath(p) for p in fonts]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(paths) + "\n"))
+
+    main(["-o", "out"])
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["path"] for r in records] == paths
+    for r in records:
+        if r["sanitized"]:
+            # relative paths are mirrored in the output directory
+            assert r["output"] == os.path.join("out", r["path"])
+            assert os.path.exists(r["output"])
+
+
+def test_cli_errors(tmp_path, capsys):
+    missing = tmp_path / "missing.ttf"
+    assert main([str(missing)]) == 1
+    (record,) = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert record["path"] == str(missing)
+    assert "sanitized" not in record
+    assert record["error"]
+
+    with pytest.raises(SystemExit):
+        main([str(missing), "--resume"])
+    with pytest.raises(SystemExit):
+        main([str(missing), "--mode", "validate", "-o", str(tmp_path)])
+
+
+def test_cli_limits(tree, capsys):
+    big = max(font_files("good"), key=lambda f: f.stat().st_size)
+    assert main([str(tree / big.name), "--max-memory", "100"]) == 1
+    (record,) = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert "sanitized" not in record
+    assert "100 bytes" in record["error"]
+
+    assert main([str(tree / big.name), "--timeout", "60", "--max-memory", str(2**30)]) == 0
+    for option in ("--timeout", "--max-memory"):
+        with pytest.raises(SystemExit):
+            main([str(tree), option, "0"])
+
+
+def test_cli_output_format(tree, tmp_path):
+    out_dir = tmp_path / "out"
+    assert (
+        main([str(tree), "-o", str(out_dir), "--output-format", "woff", "-r", str(tmp_path / "r.jsonl")]) == 1
+    )
+    for record in _read_results(tmp_path / "r.jsonl"):
+        if record["output"] is not None:
+            assert record["output"].endswith(".woff")
+            assert Path(record["output"]).read_bytes()[:4] == b"wOFF"
+
+    with pytest.raises(SystemExit):
+        main([str(tree), "--mode", "validate", "--output-format", "woff"])
+
+
+def _run_to_out(tmp_path, *args):
+    """
+    Run the command with an output directory, and return its records by path.
+    """
+    results = tmp_path / "r.jsonl"
+    main([*map(str, args), "-o", str(tmp_path / "out"), "-r", str(results), "-j", "2"])
+    return {r["path"]: r for r in _read_results(results)}
+
+
+def test_cli_output_collision_dirs(tmp_path):
+    # the same relative path under two directories
+    f = font_files("good", suffixes={".ttf"})[0]
+    a, b = tmp_path / "a", tmp_path / "b"
+    for d in (a, b):
+        d.mkdir()
+        shutil.copy(f, d / "x.ttf")
+
+    records = _run_to_out(tmp_path, a, b)
+    assert records[str(a / "x.ttf")]["sanitized"]
+    assert "already" in records[str(b / "x.ttf")]["error"]
+    assert records[str(b / "x.ttf")]["output"] is None
+    assert [p.name for p in (tmp_path / "out").iterdir()] == ["x.ttf"]
+
+
+def test_cli_output_collision_format(tmp_path):
+    # two fonts that both get a .woff extension
+    f = font_files("good", suffixes={".ttf"})[0]
+    shutil.copy(f, tmp_path / "x.otf")
+    shutil.copy(f, tmp_path / "x.ttf")
+
+    records = _run_to_out(tmp_path, tmp_path / "x.otf", tmp_path / "x.ttf", "--output-format", "woff")
+    assert records[str(tmp_path / "x.otf")]["output"] == str(tmp_path / "out" / "x.woff")
+    assert "already" in records[str(tmp_path / "x.ttf")]["error"]
+
+
+def test_cli_process_pool(tree, tmp_path):
+    results = tmp_path / "results.jsonl"
+    threads = tmp_path / "threads.jsonl"
+    main([str(tree), "-r", str(results), "--executor", "process", "-j", "2"])
+    main([str(tree), "-r", str(threads)])
+    assert _read_results(results) == _read_results(threads)
+
+
+def test_cli_module():
+    f = font_files("good")[0]
+    proc = subprocess.run(
+        [sys.executable, "-m", "pyots", str(f)],
+        check=False,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    assert proc.returncode == 0
+    assert json.loads(proc.stdout)["sanitized"]
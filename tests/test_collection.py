@@ -0,0 +1,281 @@
+"""
+Tests for sanitizing the fonts of a TTC/OTC separately (sanitize(..., workers=N)):
+the collection must be put back together with its shared tables still shared,
+and each font must come out as it does when sanitized on its own.
+"""
+
+import struct
+import timeit
+from pathlib import Path
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+
+def _collections():
+    return [f for f in font_files("good", "bad", "fuzzing") if f.read_bytes()[:4] == b"ttcf"]
+
+
+def _sfnt():
+    for f in font_files("good", suffixes={".ttf", ".otf"}):
+        data = f.read_bytes()
+        if data[:4] in (b"\0\1\0\0", b"OTTO") and pyots.sanitize_bytes(data).sanitized:
+            return data
+    pytest.skip("no sfnt font to build collections from")
+
+
+def _tables(data, offset=0):
+    """
+    Return {tag: (offset, length)} for the font whose offset table is at
+    'offset' in 'data'.
+    """
+    (num_tables,) = struct.unpack_from(">H", data, offset + 4)
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, length = struct.unpack_from(">4sLLL", data, offset + 12 + 16 * i)
+        tables[tag] = (table_offset, length)
+    return tables
+
+
+def _faces(data):
+    """
+    Return the offsets of the offset tables of the fonts of collection 'data'.
+    """
+    (num_fonts,) = struct.unpack_from(">L", data, 8)
+    return struct.unpack_from(f">{num_fonts}L", data, 12)
+
+
+def _table_data(data, offset, length, tag):
+    table = data[offset : offset + length]
+    if tag == b"head":
+        # checkSumAdjustment depends on where the font is
+        table = table[:8] + b"\0\0\0\0" + table[12:]
+    return table
+
+
+def _make_collection(fonts):
+    """
+    Build a collection from sfnt fonts. A font given more than once is only
+    stored once, so the fonts share all their tables.
+    """
+    header_size = 12 + 4 * len(fonts)
+    body = b""
+    placed = {}
+    offsets = []
+    for font in fonts:
+        if font not in placed:
+            placed[font] = header_size + len(body)
+            base = placed[font]
+            (num_tables,) = struct.unpack_from(">H", font, 4)
+            relocated = bytearray(font)
+            for i in range(num_tables):
+                pos = 12 + 16 * i + 8
+                (table_offset,) = struct.unpack_from(">L", font, pos)
+                struct.pack_into(">L", relocated, pos, table_offset + base)
+            body += bytes(relocated) + b"\0" * (-len(relocated) % 4)
+        offsets.append(placed[font])
+    return struct.pack(f">4sLL{len(fonts)}L", b"ttcf", 0x00010000, len(fonts), *offsets) + body
+
+
+def _with_tables(font, extra):
+    """
+    Return sfnt 'font' with the tables in 'extra' ({tag: data}) added.
+    """
+    tables = {tag: font[offset : offset + length] for tag, (offset, length) in _tables(font).items()}
+    tables.update(extra)
+    num_tables = len(tables)
+    entry_selector = num_tables.bit_length() - 1
+    search_range = 16 << entry_selector
+    out = font[:4] + struct.pack(
+        ">HHHH", num_tables, search_range, entry_selector, 16 * num_tables - search_range
+    )
+    offset = 12 + 16 * num_tables
+    directory, body = b"", b""
+    for tag in sorted(tables):
+        directory += struct.pack(">4sLLL", tag, 0, offset + len(body), len(tables[tag]))
+        body += tables[tag] + b"\0" * (-len(tables[tag]) % 4)
+    return out + directory + body
+
+
+def _break_head(font):
+    offset, _ = _tables(font)[b"head"]
+    broken = bytearray(font)
+    struct.pack_into(">L", broken, offset + 12, 0)  # magicNumber
+    return bytes(broken)
+
+
+def test_collection_same_as_serial():
+    sfnt = _sfnt()
+    # identical fonts come out the same however the collection is sanitized
+    for data in (_make_collection([sfnt] * 3), _make_collection([sfnt, sfnt + b"\0\0\0\0"])):
+        serial = pyots.sanitize_bytes(data)
+        assert serial.sanitized
+        for workers in (1, 4):
+            result = pyots.sanitize_bytes(data, workers=workers)
+            assert result.sanitized
+            assert result.data == serial.data
+            assert len(result.members) == len(_faces(data))
+
+
+def test_collection_members():
+    for f in _collections():
+        data = f.read_bytes()
+        result = pyots.sanitize_bytes(data, workers=4)
+        faces = _faces(data)
+        assert len(result.members) == len(faces)
+
+        for i, member in enumerate(result.members):
+            expected = pyots.sanitize_bytes(data, font_index=i)
+            assert (member.sanitized, member.modified, member.messages) == (
+                expected.sanitized,
+                expected.modified,
+                expected.messages,
+            )
+            assert member.data is None
+            assert member.members is None
+
+        assert result.sanitized == all(m.sanitized for m in result.members)
+        assert result.modified == any(m.modified for m in result.members)
+        assert [m for m in result.messages if m] == [m for r in result.members for m in r.messages if m]
+
+        if not result.sanitized:
+            assert result.data is None
+            continue
+
+        # each font has the tables it has when sanitized on its own...
+        out_faces = _faces(result.data)
+        for i, out_offset in enumerate(out_faces):
+            alone = pyots.sanitize_bytes(data, font_index=i).data
+            out_tables = _tables(result.data, out_offset)
+            alone_tables = _tables(alone)
+            assert out_tables.keys() == alone_tables.keys()
+            for tag, (offset, length) in out_tables.items():
+                assert _table_data(result.data, offset, length, tag) == _table_data(
+                    alone, *alone_tables[tag], tag
+                )
+
+        # ...and the fonts share the tables they shared in the input
+        for i in range(len(faces)):
+            for j in range(i):
+                in_i, in_j = _tables(data, faces[i]), _tables(data, faces[j])
+                out_i, out_j = _tables(result.data, out_faces[i]), _tables(result.data, out_faces[j])
+                for tag in out_i.keys() & out_j.keys():
+                    if in_i[tag][0] == in_j[tag][0]:
+                        assert out_i[tag] == out_j[tag]
+
+
+def test_collection_shared_offsets():
+    # the second font's fpgm is the first font's prep, and vice versa
+    sfnt = _with_tables(_sfnt(), {b"fpgm": b"\xb0\x01", b"prep": b"\xb0\x02"})
+    data = bytearray(_make_collection([sfnt, sfnt + b"\0\0\0\0"]))
+    first, second = _faces(data)
+    tables = _tables(data, first)
+    tables[b"fpgm"], tables[b"prep"] = tables[b"prep"], tables[b"fpgm"]
+    for i, tag in enumerate(sorted(tables)):
+        struct.pack_into(">4sLLL", data, second + 12 + 16 * i, tag, 0, *tables[tag])
+    data = bytes(data)
+
+    result = pyots.sanitize_bytes(data, workers=2)
+    assert result.sanitized
+    out_first, out_second = (_tables(result.data, offset) for offset in _faces(result.data))
+    for out_tables, fpgm, prep in (
+        (out_first, b"\xb0\x01", b"\xb0\x02"),
+        (out_second, b"\xb0\x02", b"\xb0\x01"),
+    ):
+        assert _table_data(result.data, *out_tables[b"fpgm"], b"fpgm") == fpgm
+        assert _table_data(result.data, *out_tables[b"prep"], b"prep") == prep
+    # the tables the fonts have in common are still shared
+    assert out_first[b"cmap"] == out_second[b"cmap"]
+
+
+def test_collection_shared_glyf():
+    # the fonts share glyf, but the second font's loca leaves all its glyphs
+    # empty, so OTS makes something else of its glyf
+    sfnt = _sfnt()
+    data = bytearray(_make_collection([sfnt, sfnt + b"\0\0\0\0"]))
+    first, second = _faces(data)
+    tables = _tables(data, second)
+    loca_offset, loca_length = tables[b"loca"]
+    data[loca_offset : loca_offset + loca_length] = b"\0" * loca_length
+    tables[b"glyf"] = _tables(data, first)[b"glyf"]
+    for i, tag in enumerate(sorted(tables)):
+        struct.pack_into(">4sLLL", data, second + 12 + 16 * i, tag, 0, *tables[tag])
+    data = bytes(data)
+
+    result = pyots.sanitize_bytes(data, workers=2)
+    assert result.sanitized
+    for i, out_offset in enumerate(_faces(result.data)):
+        alone = pyots.sanitize_bytes(data, font_index=i).data
+        out_tables, alone_tables = _tables(result.data, out_offset), _tables(alone)
+        for tag in (b"glyf", b"loca"):
+            assert _table_data(result.data, *out_tables[tag], tag) == _table_data(
+                alone, *alone_tables[tag], tag
+            )
+
+
+def test_collection_failed_member(tmp_path):
+    sfnt = _sfnt()
+    data = _make_collection([sfnt, _break_head(sfnt), sfnt])
+
+    result = pyots.sanitize_bytes(data, workers=2)
+    assert not result.sanitized
+    assert result.data is None
+    assert [m.sanitized for m in result.members] == [True, False, True]
+    assert any(m.tag == "head" for m in result.members[1].messages)
+
+    out = tmp_path / "out.ttc"
+    in_file = tmp_path / "in.ttc"
+    in_file.write_bytes(data)
+    assert not pyots.sanitize(in_file, output=out, workers=2).sanitized
+    assert not out.exists()
+
+
+def test_collection_workers_ignored():
+    # fonts that aren't collections, and single fonts of a collection, are
+    # sanitized as usual
+    for f in font_files("good"):
+        data = f.read_bytes()
+        result = pyots.sanitize_bytes(data, workers=2)
+        if data[:4] != b"ttcf":
+            assert result.members is None
+            assert result.data == pyots.sanitize_bytes(data).data
+        else:
+            assert pyots.sanitize_bytes(data, font_index=0, workers=2).members is None
+
+    with pytest.raises(ValueError):
+        pyots.sanitize_bytes(_sfnt(), workers=0)
+
+
+def test_collection_validate_and_cache():
+    data = _make_collection([_sfnt()] * 2)
+    result = pyots.sanitize_bytes(data, mode="validate", workers=2)
+    assert result.sanitized
+    assert result.data is None
+    assert [m.sanitized for m in result.members] == [True, True]
+
+    cache = pyots.SanitizeCache()
+    first = pyots.sanitize_bytes(data, cache=cache, workers=2)
+    second = pyots.sanitize_bytes(data, cache=cache, workers=2)
+    assert cache.hits == 1
+    assert first.data == second.data == pyots.sanitize_bytes(data, workers=2).data
+
+
+def cmp_collection_times(fonts=None, workers=None):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Compares sanitizing collections in one go against sanitizing their fonts separately:
+        python -c "from tests.test_collection import cmp_collection_times; cmp_collection_times()"
+    """
+    fonts = [Path(f) for f in (fonts or _collections())]
+    for f in fonts:
+        data = f.read_bytes()
+        rd = {}
+        for name, kwargs in (("serial", {}), ("members", {"workers": workers or 4})):
+            start = timeit.default_timer()
+            _ = pyots.sanitize_bytes(data, **kwargs)
+            rd[name] = timeit.default_timer() - start
+
+        xtime = rd["serial"] / rd["members"]
+        print(f"[timings] {f.name}: serial: {rd['serial']}, members: {rd['members']} ({round(xtime, 1)}x)")
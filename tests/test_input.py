@@ -0,0 +1,124 @@
+"""
+Tests for how pyots.sanitize() reads its input file. Regular files are
+memory-mapped; anything that can't be mapped (pipes, empty files) is read in
+bulk instead, and both must give the same results as sanitizing the bytes.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import pyots
+from tests.conftest import font_files, summary
+
+
+def test_mapped_matches_bytes():
+    for f in font_files("good"):
+        from_file = pyots.sanitize(f)
+        from_bytes = pyots.sanitize_bytes(f.read_bytes())
+        assert summary(from_file) == summary(from_bytes), f"mismatched results for {f}"
+
+
+def test_mapped_output(tmp_path):
+    for f in font_files("good"):
+        out = tmp_path / f.name
+        pyots.sanitize(f, output=out)
+        assert out.read_bytes() == pyots.sanitize_bytes(f.read_bytes()).data
+
+
+def test_empty_file(tmp_path):
+    empty = tmp_path / "empty.ttf"
+    empty.write_bytes(b"")
+    result = pyots.sanitize(empty)
+    assert not result.sanitized
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_pipe(tmp_path):
+    font = max(font_files("good"), key=lambda f: f.stat().st_size)
+    fifo = tmp_path / "font.fifo"
+    os.mkfifo(fifo)
+
+    def feed():
+        with open(fifo, "wb") as fp:
+            fp.write(font.read_bytes())
+
+    writer = threading.Thread(target=feed)
+    writer.start()
+    try:
+        result = pyots.sanitize(fifo)
+    finally:
+        writer.join()
+
+    assert summary(result) == summary(pyots.sanitize(font))
+
+
+def test_missing_file(tmp_path):
+    missing = tmp_path / "missing.ttf"
+    with pytest.raises(FileNotFoundError):
+        pyots.sanitize(missing)
+
+
+# Run in a fresh interpreter per measurement so the peak RSS of one doesn't
+# hide the other. "file" is the path sanitize() reads; "bytes" keeps a full
+# heap copy of the font (it needs sanitize_bytes(), so only this pyots runs
+# it).
+_LOAD_SCRIPT = """
+import json, resource, sys, timeit
+import pyots
+
+mode, path = sys.argv[1:]
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = timeit.default_timer()
+if mode == "file":
+    result = pyots.sanitize(path)
+else:
+    with open(path, "rb") as fp:
+        result = pyots.sanitize_bytes(fp.read())
+elapsed = timeit.default_timer() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"time": elapsed, "rss": peak - base, "sanitized": result.sanitized}))
+"""
+
+
+def _measure_load(python, mode, font):
+    out = subprocess.run(
+        [python, "-c", _LOAD_SCRIPT, mode, os.fspath(font)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out)
+
+
+def cmp_input_load(fonts=None, python=None):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Compares load + sanitize time and peak RSS of sanitizing a font from its file
+    (memory-mapped) against sanitizing a heap copy of it (POSIX only):
+        python -c "from tests.test_input import cmp_input_load; cmp_input_load()"
+    Pass |fonts| to measure your own (large CJK OTF or TTC) fonts. Pass |python|, an
+    interpreter with an older pyots (one that read its input through
+    istreambuf_iterator), to compare sanitizing from the file with it and with this
+    pyots instead.
+    """
+    fonts = fonts or sorted(font_files("good"), key=lambda f: f.stat().st_size)[-3:]
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    if python is None:
+        runs = [("file", sys.executable, "file"), ("bytes", sys.executable, "bytes")]
+    else:
+        runs = [("before", python, "file"), ("after", sys.executable, "file")]
+
+    for font in fonts:
+        size = os.path.getsize(font)
+        columns = []
+        for label, interpreter, mode in runs:
+            r = _measure_load(interpreter, mode, font)
+            columns.append(f"{label}: {r['time']:.3f}s, peak RSS +{r['rss'] * rss_unit / 2**20:.1f} MiB")
+        print(f"[input] {Path(font).name} ({size / 2**20:.1f} MiB) " + " | ".join(columns))
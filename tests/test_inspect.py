@@ -0,0 +1,237 @@
+"""
+Tests for reading the header and table directory of a font without
+sanitizing it (pyots.inspect()): what it reports must agree with the font,
+and what lies outside of it must be rejected, not read.
+"""
+
+import functools
+import struct
+import timeit
+import zlib
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+
+def _sfnt_tables(data, offset=0):
+    """
+    The tables of the sfnt font whose offset table is at 'offset' in 'data',
+    as {tag: (offset, length)}.
+    """
+    (num_tables,) = struct.unpack_from(">H", data, offset + 4)
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, length = struct.unpack_from(">4sLLL", data, offset + 12 + 16 * i)
+        tables[tag.decode("latin-1")] = (table_offset, length)
+    return tables
+
+
+def _woff2(tables, fonts=None, compressed=b"\0" * 16, compressed_length=None):
+    """
+    Make the header and table directory of a WOFF2 font holding 'tables', a
+    list of (tag, length, transformed length or None), followed by
+    'compressed' (which isn't looked at). With 'fonts', a list of (flavor,
+    table indices), it is a collection. The header says the compressed data
+    is 'compressed_length' bytes long, if given.
+    """
+    known = {"cmap": 0, "head": 1, "glyf": 10, "loca": 11}
+    directory = b""
+    for tag, length, transform_length in tables:
+        if tag in ("glyf", "loca"):
+            version = 0 if transform_length is not None else 3
+        else:
+            version = 1 if transform_length is not None else 0
+        flags = version << 6
+        if tag in known:
+            directory += bytes([flags | known[tag]])
+        else:
+            directory += bytes([flags | 0x3F]) + tag.encode("latin-1")
+        directory += _base128(length)
+        if transform_length is not None:
+            directory += _base128(transform_length)
+    if fonts is not None:
+        directory += struct.pack(">L", 0x00020000) + bytes([len(fonts)])
+        for flavor, indices in fonts:
+            directory += bytes([len(indices)]) + flavor + bytes(indices)
+    flavor = b"ttcf" if fonts is not None else b"\0\1\0\0"
+    length = 48 + len(directory) + len(compressed)
+    header = struct.pack(
+        ">4s4sLHHLLHHLLLLL",
+        b"wOF2",
+        flavor,
+        length,
+        len(tables),
+        0,
+        12345,
+        compressed_length or len(compressed),
+        1,
+        0,
+        0,
+        0,
+        0,
+        0,
+        0,
+    )
+    return header + directory + compressed
+
+
+def _base128(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(out)
+
+
+def test_inspect_sfnt():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] in (b"wOFF", b"wOF2", b"ttcf"):
+            continue
+        info = pyots.inspect(f)
+        assert info == pyots.inspect(data)
+        assert info.format == "sfnt"
+        assert info.length == info.sfnt_length == len(data)
+        (face,) = info.faces
+        assert face.flavor == data[:4].decode("latin-1")
+        assert {tag: (t.offset, t.length) for tag, t in face.tables.items()} == _sfnt_tables(data)
+        assert all(t.stored_length == t.length for t in face.tables.values())
+
+
+def test_inspect_collection():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] != b"ttcf":
+            continue
+        info = pyots.inspect(data)
+        assert info.format == "collection"
+        (num_fonts,) = struct.unpack_from(">L", data, 8)
+        assert len(info.faces) == num_fonts
+        for i, face in enumerate(info.faces):
+            (offset,) = struct.unpack_from(">L", data, 12 + 4 * i)
+            tables = _sfnt_tables(data, offset)
+            assert {tag: (t.offset, t.length) for tag, t in face.tables.items()} == tables
+
+
+def test_inspect_large_collection(tmp_path):
+    # OTS doesn't sanitize collections larger than 1 GiB, but their headers
+    # can still be read; the file is sparse, and mapped rather than read
+    font = next(f.read_bytes() for f in font_files("good") if f.suffix in (".ttf", ".otf"))
+    (num_tables,) = struct.unpack_from(">H", font, 4)
+    header = b"ttcf" + struct.pack(">LLL", 0x00010000, 1, 16)
+    directory = b""
+    for i in range(num_tables):
+        tag, checksum, offset, length = struct.unpack_from(">4sLLL", font, 12 + 16 * i)
+        directory += struct.pack(">4sLLL", tag, checksum, offset + 16, length)
+    path = tmp_path / "large.ttc"
+    with open(path, "wb") as fp:
+        fp.write(header + font[:12] + directory + font[12 + 16 * num_tables :])
+        fp.truncate(2**30 + 4096)
+
+    info = pyots.inspect(path)
+    assert (info.format, info.length) == ("collection", 2**30 + 4096)
+    assert set(info.faces[0].tables) == set(_sfnt_tables(font))
+
+
+def test_inspect_woff():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] != b"wOFF":
+            continue
+        info = pyots.inspect(data)
+        assert info.format == "woff"
+        assert info.length == len(data)
+        assert info.sfnt_length == struct.unpack_from(">L", data, 16)[0]
+        (face,) = info.faces
+        assert list(face.tables) == sorted(face.tables)
+        for table in face.tables.values():
+            stored = data[table.offset : table.offset + table.stored_length]
+            assert len(stored) == table.stored_length
+            if table.stored_length < table.length:
+                assert len(zlib.decompress(stored)) == table.length
+
+
+def test_inspect_woff2():
+    tables = [("cmap", 100, None), ("glyf", 5000, 3000), ("loca", 400, 0), ("GSUB", 70000, None)]
+    info = pyots.inspect(_woff2(tables))
+    assert info.format == "woff2"
+    assert info.sfnt_length == 12345
+    (face,) = info.faces
+    assert face.flavor == "\0\1\0\0"
+    assert face.tables == {
+        "cmap": (None, 100, 100),
+        "glyf": (None, 5000, 3000),
+        "loca": (None, 400, 0),
+        "GSUB": (None, 70000, 70000),
+    }
+
+    info = pyots.inspect(_woff2(tables, fonts=[(b"\0\1\0\0", [0, 1, 2]), (b"\0\1\0\0", [0, 3])]))
+    assert info.format == "woff2"
+    assert [list(face.tables) for face in info.faces] == [["cmap", "glyf", "loca"], ["cmap", "GSUB"]]
+
+
+def test_inspect_bad():
+    for f in font_files("bad", "fuzzing"):
+        try:
+            info = pyots.inspect(f)
+        except ValueError:
+            continue
+        # whatever is listed is within the font
+        for face in info.faces:
+            for table in face.tables.values():
+                assert table.offset + table.stored_length <= info.length
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"\0\1",
+        b"not a font at all",
+        # tables beyond the end of the font
+        struct.pack(">LHHHH4sLLL", 0x00010000, 1, 16, 0, 0, b"cmap", 0, 28, 1000),
+        struct.pack(">LHHHH4sLLL", 0x00010000, 1, 16, 0, 0, b"cmap", 0, 0xFFFFFFF0, 0x20),
+        # a table directory that doesn't fit
+        struct.pack(">LHHHH", 0x00010000, 100, 16, 0, 0),
+        # a collection whose font is beyond the end of it
+        struct.pack(">4sLLL", b"ttcf", 0x00010000, 1, 1000),
+        # a WOFF font with a compressed table larger than it is uncompressed
+        struct.pack(">4s4sLHHL4x8x12x4sLLLL", b"wOFF", b"\0\1\0\0", 84, 1, 0, 0, b"cmap", 44, 20, 10, 0)
+        + b"\0" * 20,
+        # a WOFF2 font with a truncated table directory or compressed data
+        _woff2([("cmap", 100, None)])[:49],
+        _woff2([("cmap", 100, None)], compressed_length=17),
+    ],
+)
+def test_inspect_errors(data):
+    with pytest.raises(ValueError):
+        pyots.inspect(data)
+
+
+def test_inspect_woff2_errors():
+    data = _woff2([("cmap", 100, None)])
+    with pytest.raises(ValueError, match="length"):
+        pyots.inspect(data + b"\0")
+    with pytest.raises(ValueError, match="collection directory"):
+        pyots.inspect(_woff2([("cmap", 100, None)], fonts=[(b"\0\1\0\0", [1])]))
+
+
+def test_inspect_os_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        pyots.inspect(tmp_path / "missing.ttf")
+
+
+def cmp_inspect_timings(repeat=1000):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Compare the time it takes to inspect and to sanitize each font of the test corpus:
+        python -c "from tests.test_inspect import cmp_inspect_timings; cmp_inspect_timings()"
+    """
+    for f in font_files("good"):
+        data = f.read_bytes()
+        inspect = timeit.timeit(functools.partial(pyots.inspect, data), number=repeat) / repeat
+        sanitize = timeit.timeit(functools.partial(pyots.sanitize_bytes, data), number=repeat) / repeat
+        print(f"[inspect] {f.name}: {inspect * 1e6:.1f} µs to inspect, {sanitize * 1e6:.1f} µs to sanitize")
@@ -0,0 +1,131 @@
+"""
+Tests for the per-call resource limits (sanitize(..., timeout=...,
+max_memory=...)): a font that hits one must fail with the limit's exception,
+however it is sanitized, and fonts within them must come out as if there
+were none.
+"""
+
+import asyncio
+import struct
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+# too short for any font to be sanitized in
+TINY_TIMEOUT = 1e-9
+
+
+def _good_fonts():
+    return [f for f in font_files("good") if pyots.sanitize(f).sanitized]
+
+
+def test_limits_within():
+    for f in font_files("good", "bad", "fuzzing"):
+        data = f.read_bytes()
+        plain = pyots.sanitize_bytes(data)
+        limited = pyots.sanitize_bytes(data, timeout=60, max_memory=2**30)
+        assert (limited.sanitized, limited.modified, limited.messages, limited.data) == (
+            plain.sanitized,
+            plain.modified,
+            plain.messages,
+            plain.data,
+        )
+
+
+def test_limits_timeout(tmp_path):
+    for f in _good_fonts():
+        with pytest.raises(TimeoutError):
+            pyots.sanitize(f, timeout=TINY_TIMEOUT)
+        with pytest.raises(TimeoutError):
+            pyots.sanitize_bytes(f.read_bytes(), timeout=TINY_TIMEOUT, mode="validate")
+
+        # nothing is written for a font that timed out
+        out = tmp_path / f.name
+        with pytest.raises(TimeoutError):
+            pyots.sanitize(f, output=out, timeout=TINY_TIMEOUT)
+        assert not out.exists()
+
+
+def test_limits_max_memory():
+    for f in _good_fonts():
+        data = f.read_bytes()
+        # the input itself is too large
+        with pytest.raises(pyots.MemoryLimitError):
+            pyots.sanitize_bytes(data, max_memory=len(data) - 1)
+
+        # the input fits, the sanitized font doesn't
+        output = pyots.sanitize_bytes(data).data
+        if data[:4] != b"wOFF" and len(output) > len(data):
+            with pytest.raises(pyots.MemoryLimitError):
+                pyots.sanitize_bytes(data, max_memory=len(data))
+
+        assert pyots.sanitize_bytes(data, max_memory=max(len(data), len(output))).data == output
+    assert issubclass(pyots.MemoryLimitError, MemoryError)
+
+
+def test_limits_max_memory_cache(tmp_path):
+    for f in _good_fonts():
+        cache = pyots.SanitizeCache()
+        size = f.stat().st_size
+        # a file too large is given up on before it is read and hashed
+        with pytest.raises(pyots.MemoryLimitError, match=f"more than {size - 1} bytes"):
+            pyots.sanitize(f, cache=cache, max_memory=size - 1)
+        assert (cache.hits, cache.misses) == (0, 0)
+
+        result = pyots.sanitize(f, cache=cache, max_memory=2**30)
+        assert result.modified == pyots.sanitize(f).modified
+
+    empty = tmp_path / "empty.ttf"
+    empty.write_bytes(b"")
+    assert not pyots.sanitize(empty, cache=pyots.SanitizeCache()).sanitized
+
+
+def test_limits_woff():
+    for f in _good_fonts():
+        data = f.read_bytes()
+        if data[:4] != b"wOFF":
+            continue
+        (num_tables,) = struct.unpack_from(">H", data, 12)
+        entries = [struct.unpack_from(">4sLLLL", data, 44 + 20 * i) for i in range(num_tables)]
+        decompressed = sum(orig for _, _, comp, orig, _ in entries if orig > comp)
+        if decompressed <= len(data):
+            continue
+        # the font it decompresses to is too large
+        with pytest.raises(pyots.MemoryLimitError):
+            pyots.sanitize_bytes(data, max_memory=decompressed - 1)
+
+
+def test_limits_collection():
+    for f in _good_fonts():
+        data = f.read_bytes()
+        if data[:4] != b"ttcf":
+            continue
+        for workers in (None, 2):
+            with pytest.raises(TimeoutError):
+                pyots.sanitize_bytes(data, workers=workers, timeout=TINY_TIMEOUT)
+            output = pyots.sanitize_bytes(data, workers=workers).data
+            with pytest.raises(pyots.MemoryLimitError):
+                pyots.sanitize_bytes(data, workers=workers, max_memory=len(output) - 1)
+
+
+def test_limits_many():
+    fonts = _good_fonts()
+    results = pyots.sanitize_many(fonts + [fonts[0].read_bytes()], timeout=TINY_TIMEOUT)
+    assert all(isinstance(r, TimeoutError) for r in results)
+
+    results = pyots.sanitize_many(fonts, max_memory=100)
+    assert all(isinstance(r, pyots.MemoryLimitError) for r in results)
+
+    results = asyncio.run(pyots.sanitize_many_async(fonts, max_memory=100))
+    assert all(isinstance(r, pyots.MemoryLimitError) for r in results)
+
+
+def test_limits_errors():
+    f = font_files("good")[0]
+    for kwargs in ({"timeout": 0}, {"timeout": -1}, {"timeout": float("nan")}, {"max_memory": 0}):
+        with pytest.raises(ValueError):
+            pyots.sanitize(f, **kwargs)
+        with pytest.raises(ValueError):
+            pyots.sanitize_many([f], **kwargs)
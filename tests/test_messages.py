@@ -0,0 +1,174 @@
+"""
+Tests for the structured messages in OTSResult.messages: each is an OTSMessage,
+a string holding the message as OTS prints it, with its level, table tag and
+text as attributes.
+"""
+
+import pickle
+import re
+import struct
+
+import pytest
+
+import pyots
+from pyots import OTSMessage
+from tests.conftest import KNOWN_EXTENSIONS, TEST_FONTS_DIR, font_files
+
+# how log ingestion used to recover the parts of a message
+MESSAGE_RE = re.compile(r"^(ERROR|WARNING): (?:([ -~]{4}): )?(.*)$", re.DOTALL)
+
+
+def _all_messages():
+    messages = []
+    for subdir in ("good", "bad", "fuzzing"):
+        for f in sorted((TEST_FONTS_DIR / subdir).iterdir()):
+            if f.suffix.lower() in KNOWN_EXTENSIONS:
+                messages.extend(m for m in pyots.sanitize(f).messages if m)
+    return messages
+
+
+def test_message_parts():
+    messages = _all_messages()
+    assert messages, "the test fonts should generate some messages"
+
+    for m in messages:
+        assert isinstance(m, OTSMessage)
+        level, tag, text = MESSAGE_RE.match(m).groups()
+        assert m.level == (OTSMessage.ERROR if level == "ERROR" else OTSMessage.WARNING)
+        assert m.tag == tag
+        assert m.text == text
+
+
+def test_message_str():
+    m = OTSMessage(OTSMessage.WARNING, "cmap", "some warning")
+    assert m == "WARNING: cmap: some warning"
+    assert str(m) == "WARNING: cmap: some warning"
+    assert m.startswith("WARNING: ")
+
+    m = OTSMessage(OTSMessage.ERROR, None, "file less than 4 bytes")
+    assert m == "ERROR: file less than 4 bytes"
+
+
+def test_no_messages():
+    good = font_files("good")
+    r = pyots.sanitize(good[0], quiet=True)
+    assert r.messages == ("",)
+    assert r.messages[0].level is None
+
+
+def test_messages_from_text():
+    text = "ERROR: hmtx: Failed to read side bearing 50\nERROR: hmtx: Failed to parse table\n"
+    r = pyots.OTSResult((False, False, text))
+    assert r.messages == tuple(text.strip().split("\n"))
+    assert [(m.level, m.tag, m.text) for m in r.messages] == [
+        (OTSMessage.ERROR, "hmtx", "Failed to read side bearing 50"),
+        (OTSMessage.ERROR, "hmtx", "Failed to parse table"),
+    ]
+
+
+def test_message_pickle():
+    for m in _all_messages() + [OTSMessage(None, None, "")]:
+        p = pickle.loads(pickle.dumps(m))
+        assert p == m
+        assert (p.level, p.tag, p.text) == (m.level, m.tag, m.text)
+
+
+def test_result_pickle():
+    for subdir in ("good", "bad"):
+        for f in sorted((TEST_FONTS_DIR / subdir).iterdir()):
+            if f.suffix.lower() not in KNOWN_EXTENSIONS:
+                continue
+            for r in (pyots.sanitize(f), pyots.sanitize_bytes(f.read_bytes())):
+                p = pickle.loads(pickle.dumps(r))
+                assert (p.sanitized, p.modified, p.data) == (r.sanitized, r.modified, r.data)
+                assert p.messages == r.messages
+                assert [(m.level, m.tag, m.text, m.count) for m in p.messages] == [
+                    (m.level, m.tag, m.text, m.count) for m in r.messages
+                ]
+                assert p.omitted_messages == r.omitted_messages
+
+
+def test_result_compact():
+    r = pyots.OTSResult((True, False, ()))
+    assert not hasattr(r, "__dict__")
+    assert r.messages == ("",)
+    assert r.messages is r.messages
+
+
+def _warning_collection(num_fonts):
+    """
+    Return a collection of 'num_fonts' copies of a good font whose table
+    directory has the wrong search parameters: each copy makes OTS emit the
+    same three warnings.
+    """
+    for f in sorted((TEST_FONTS_DIR / "good").iterdir()):
+        font = f.read_bytes()
+        if font[:4] in (b"\0\1\0\0", b"OTTO"):
+            break
+    font = font[:6] + b"\0\0\0\0\0\0" + font[12:]
+    (num_tables,) = struct.unpack_from(">H", font, 4)
+
+    header_length = 12 + 4 * num_fonts
+    data = b"ttcf" + struct.pack(">HHL", 1, 0, num_fonts)
+    data += struct.pack(f">{num_fonts}L", *(header_length + i * len(font) for i in range(num_fonts)))
+    for i in range(num_fonts):
+        copy = bytearray(font)
+        for j in range(num_tables):
+            (offset,) = struct.unpack_from(">L", font, 12 + 16 * j + 8)
+            struct.pack_into(">L", copy, 12 + 16 * j + 8, offset + header_length + i * len(font))
+        data += copy
+    return data
+
+
+def test_message_repeats():
+    data = _warning_collection(3)
+    for r in (pyots.sanitize_bytes(data), pyots.sanitize_bytes(data, workers=2)):
+        assert r.sanitized
+        assert len(r.messages) == 3
+        assert len(set(r.messages)) == 3
+        assert all(m.level == OTSMessage.WARNING and m.count == 3 for m in r.messages)
+        assert r.omitted_messages == 0
+
+    (r,) = pyots.sanitize_many([data])
+    assert [m.count for m in r.messages] == [3, 3, 3]
+
+
+def test_message_limits():
+    data = _warning_collection(2)
+    unlimited = pyots.sanitize_bytes(data, max_messages=None, max_message_bytes=None)
+    assert len(unlimited.messages) == 3
+
+    for kwargs in ({"max_messages": 1}, {"max_message_bytes": len(unlimited.messages[0].text)}):
+        for workers in (None, 2):
+            r = pyots.sanitize_bytes(data, workers=workers, **kwargs)
+            assert r.sanitized == unlimited.sanitized
+            assert r.messages == unlimited.messages[:1]
+            # repeats of a message that was kept don't count against the
+            # limits, repeats of one that wasn't are omitted too
+            assert r.messages[0].count == 2
+            assert r.omitted_messages == 4
+
+    r = pyots.sanitize_bytes(data, max_message_bytes=1)
+    assert r.messages == ("",)
+    assert r.omitted_messages == 6
+
+    for kwargs in (
+        {"max_messages": -1},
+        {"max_message_bytes": -1},
+        {"max_messages": 0},
+        {"max_message_bytes": 0},
+    ):
+        with pytest.raises(ValueError):
+            pyots.sanitize_bytes(data, **kwargs)
+
+
+def test_message_limits_cache():
+    data = _warning_collection(2)
+    cache = pyots.SanitizeCache()
+    r = pyots.sanitize_bytes(data, cache=cache, max_messages=1)
+    assert pyots.sanitize_bytes(data, cache=cache).messages == pyots.sanitize_bytes(data).messages
+    assert cache.hits == 0
+    hit = pyots.sanitize_bytes(data, cache=cache, max_messages=1)
+    assert cache.hits == 1
+    assert (hit.messages, hit.omitted_messages) == (r.messages, r.omitted_messages)
+    assert hit.messages[0].count == 2
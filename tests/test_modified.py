@@ -0,0 +1,134 @@
+"""
+Tests for telling whether sanitizing changed a font (OTSResult.modified and
+.changed_tables): fonts are compared table by table, so a font OTS has
+already sanitized comes out unmodified, however it is laid out.
+"""
+
+import pickle
+import struct
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+
+def _sanitized_sfnt():
+    for f in font_files("good"):
+        result = pyots.sanitize_bytes(f.read_bytes())
+        if result.sanitized and result.data[:4] in (b"\0\1\0\0", b"OTTO"):
+            return result.data
+    pytest.skip("no sfnt font to test with")
+
+
+def _relayout(font):
+    """
+    Return the sfnt font 'font' with its tables stored in reverse order,
+    with a new modification date and a wrong checkSumAdjustment.
+    """
+    (num_tables,) = struct.unpack_from(">H", font, 4)
+    records = [struct.unpack_from(">4sLLL", font, 12 + 16 * i) for i in range(num_tables)]
+    offset = 12 + 16 * num_tables
+    directory = b""
+    body = b""
+    for tag, checksum, table_offset, length in reversed(records):
+        table = font[table_offset : table_offset + length]
+        if tag == b"head":
+            table = table[:8] + b"\xde\xad\xbe\xef" + table[12:28] + struct.pack(">Q", 12345) + table[36:]
+        directory = struct.pack(">4sLLL", tag, checksum, offset + len(body), length) + directory
+        body += table + b"\0" * (-len(table) % 4)
+    return font[:12] + directory + body
+
+
+def test_modified_changed_tables():
+    for f in font_files("good", "bad", "fuzzing"):
+        result = pyots.sanitize_bytes(f.read_bytes())
+        if not result.sanitized:
+            assert not result.modified
+            assert result.changed_tables is None
+            continue
+        assert result.modified == bool(result.changed_tables)
+        assert list(result.changed_tables) == sorted(set(result.changed_tables))
+
+        # sanitizing a sanitized font changes nothing
+        again = pyots.sanitize_bytes(result.data)
+        assert again.sanitized
+        assert not again.modified
+        assert again.changed_tables == ()
+
+
+def test_modified_layout_ignored():
+    font = _relayout(_sanitized_sfnt())
+    assert font != _sanitized_sfnt()
+    result = pyots.sanitize_bytes(font)
+    assert result.sanitized
+    assert not result.modified
+    assert result.changed_tables == ()
+
+
+def test_modified_dropped_table():
+    font = _sanitized_sfnt()
+    (num_tables,) = struct.unpack_from(">H", font, 4)
+    tags = [font[12 + 16 * i : 16 + 16 * i].decode("latin-1") for i in range(num_tables)]
+    tag = next(t for t in tags if t not in ("head", "hhea", "hmtx", "maxp", "cmap", "name", "OS/2", "post"))
+
+    result = pyots.sanitize_bytes(font, table_actions={tag: "drop"})
+    if result.sanitized:
+        assert result.modified
+        assert tag in result.changed_tables
+
+
+def test_modified_validate():
+    result = pyots.sanitize_bytes(_sanitized_sfnt(), mode="validate")
+    assert result.sanitized
+    assert not result.modified
+    assert result.changed_tables is None
+
+
+def test_modified_collection_members():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] != b"ttcf":
+            continue
+        result = pyots.sanitize_bytes(data, workers=2)
+        if not result.sanitized:
+            continue
+        assert result.changed_tables == tuple(
+            sorted({tag for m in result.members for tag in m.changed_tables})
+        )
+        for i, member in enumerate(result.members):
+            assert member.changed_tables == pyots.sanitize_bytes(data, font_index=i).changed_tables
+
+
+def test_modified_without_output(tmp_path):
+    # without an output, tables are compared through the checksums and lengths
+    # OTS puts in the table directory, rather than through the sanitized font
+    fonts = [(f.name, f.read_bytes()) for f in font_files("good", "bad", "fuzzing")]
+    fonts.append(("relaid.ttf", _relayout(_sanitized_sfnt())))
+    for name, data in fonts:
+        path = tmp_path / name
+        path.write_bytes(data)
+        options = [{}]
+        if data[:4] == b"ttcf":
+            options += [{"workers": 1}, {"font_index": 0}]
+        for kwargs in options:
+            result = pyots.sanitize(path, **kwargs)
+            expected = pyots.sanitize_bytes(data, **kwargs)
+            assert (result.sanitized, result.modified, result.changed_tables) == (
+                expected.sanitized,
+                expected.modified,
+                expected.changed_tables,
+            ), (name, kwargs)
+
+
+def test_modified_pickle_and_cache(tmp_path):
+    f = font_files("good")[0]
+    result = pyots.sanitize(f)
+    assert pickle.loads(pickle.dumps(result)).changed_tables == result.changed_tables
+
+    cache = pyots.SanitizeCache(directory=tmp_path)
+    pyots.sanitize(f, cache=cache)
+    for c in (cache, pyots.SanitizeCache(directory=tmp_path)):
+        hit = pyots.sanitize(f, cache=c)
+        assert c.hits == 1
+        assert (hit.modified, hit.changed_tables) == (result.modified, result.changed_tables)
@@ -89,6 +89,54 @@ def test_write(tmp_path):
         assert out_file.exists()
 
 
+def test_write_same_result(tmp_path):
+    # without an output file the font is sanitized without being kept; that
+    # must not change the verdict or the messages
+    for subdir in ("good", "bad", "fuzzing"):
+        for f in (TEST_FONTS_DIR / subdir).iterdir():
+            ext = f.suffix
+            if ext.lower() not in KNOWN_EXTENSIONS:
+                continue
+
+            r = pyots.sanitize(f)
+            w = pyots.sanitize(f, output=tmp_path / f.name)
+            assert (r.sanitized, r.modified, r.messages) == (w.sanitized, w.modified, w.messages), (
+                f"[{subdir}] mismatched result for {f}"
+            )
+
+
+def test_sanitize_bytes():
+    for subdir in ("good", "bad"):
+        for f in (TEST_FONTS_DIR / subdir).iterdir():
+            ext = f.suffix
+            if ext.lower() not in KNOWN_EXTENSIONS:
+                continue
+
+            expected = pyots.sanitize(f)
+            data = f.read_bytes()
+
+            for buf in (data, bytearray(data), memoryview(data)):
+                r = pyots.sanitize_bytes(buf)
+                assert r.sanitized == expected.sanitized, f"[{subdir}] mismatched result for {f}"
+                assert r.messages == expected.messages, f"[{subdir}] mismatched messages for {f}"
+                assert (r.data is not None) == r.sanitized
+
+
+def test_sanitize_bytes_output(tmp_path):
+    tld = TEST_FONTS_DIR / "good"
+    for f in tld.iterdir():
+        ext = f.suffix
+        if ext.lower() not in KNOWN_EXTENSIONS:
+            continue
+
+        out_file = tmp_path / f.name
+        pyots.sanitize(f, output=out_file)
+
+        r = pyots.sanitize_bytes(f.read_bytes())
+
+        assert r.data == out_file.read_bytes()
+
+
 EXPECT_FAIL = {
     "fuzzing/0509e80afb379d16560e9e47bdd7d888bebdebc6.ttf",
     "fuzzing/05a7abc8e4c954ef105d056bd6249c6fda96d4a8.otf",
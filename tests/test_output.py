@@ -0,0 +1,134 @@
+"""
+Tests for the different kinds of 'output' pyots.sanitize() can write to: paths
+(written atomically), open file descriptors and file objects.
+"""
+
+import io
+import os
+
+import pytest
+
+import pyots
+from tests.conftest import TEST_FONTS_DIR, font_files
+
+
+def _expected(font):
+    return pyots.sanitize_bytes(font.read_bytes()).data
+
+
+def test_output_path_replaces(tmp_path):
+    for f in font_files("good"):
+        out = tmp_path / f.name
+        out.write_bytes(b"stale")
+        pyots.sanitize(f, output=out)
+        assert out.read_bytes() == _expected(f)
+
+    # the temporary files have all been renamed into place
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f.name for f in font_files("good"))
+
+
+def test_output_path_error(tmp_path):
+    f = font_files("good")[0]
+    out = tmp_path / "missing" / f.name
+    with pytest.raises(FileNotFoundError) as excinfo:
+        pyots.sanitize(f, output=out)
+    assert os.fsdecode(excinfo.value.filename) == str(out)
+
+
+@pytest.mark.parametrize("cache", [None, pyots.SanitizeCache()], ids=["no cache", "cache"])
+def test_output_not_sanitized(tmp_path, cache):
+    f = TEST_FONTS_DIR / "bad" / "badmaxp.ttf"
+    out = tmp_path / f.name
+    out.write_bytes(b"existing")
+    for _ in range(2):  # (a miss, then a hit)
+        assert not pyots.sanitize(f, output=out, cache=cache).sanitized
+        assert out.read_bytes() == b"existing"
+    assert [p.name for p in tmp_path.iterdir()] == [f.name]
+
+    buf = io.BytesIO()
+    with open(out, "ab") as fp:
+        assert not pyots.sanitize(f, output=fp.fileno(), cache=cache).sanitized
+        assert not pyots.sanitize(f, output=buf, cache=cache).sanitized
+    assert out.read_bytes() == b"existing"
+    assert buf.getvalue() == b""
+
+
+@pytest.mark.skipif(not os.path.exists(os.devnull) or os.name == "nt", reason="needs /dev/null")
+def test_output_device():
+    f = font_files("good")[0]
+    assert pyots.sanitize(f, output=os.devnull).sanitized
+
+
+def test_output_fd(tmp_path):
+    for f in font_files("good"):
+        out = tmp_path / f.name
+        with open(out, "wb") as fp:
+            r = pyots.sanitize(f, output=fp.fileno())
+        assert r.sanitized
+        assert r.data is None
+        assert out.read_bytes() == _expected(f)
+
+
+def test_output_file_object(tmp_path):
+    for f in font_files("good"):
+        buf = io.BytesIO()
+        r = pyots.sanitize(f, output=buf)
+        assert r.sanitized
+        assert r.data is None
+        assert buf.getvalue() == _expected(f)
+
+        out = tmp_path / f.name
+        with open(out, "wb") as fp:
+            pyots.sanitize(f, output=fp)
+        assert out.read_bytes() == _expected(f)
+
+        # unbuffered files may write less than asked for
+        with open(out, "wb", buffering=0) as fp:
+            pyots.sanitize(f, output=fp)
+        assert out.read_bytes() == _expected(f)
+
+
+class _ShortWriter:
+    """Writes at most 100 bytes per call, like a raw file or socket may."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        chunk = bytes(data[:100])
+        self.chunks.append(chunk)
+        return len(chunk)
+
+
+class _KeepingWriter:
+    """Holds on to (a slice of) the data it was given instead of copying it."""
+
+    def __init__(self):
+        self.views = []
+
+    def write(self, data):
+        self.views.append(memoryview(data)[:])
+
+
+def test_output_short_writes():
+    f = max(font_files("good"), key=lambda f: f.stat().st_size)
+    writer = _ShortWriter()
+    pyots.sanitize(f, output=writer)
+    assert b"".join(writer.chunks) == _expected(f)
+    assert len(writer.chunks) > 1
+
+
+def test_output_kept_views():
+    f = font_files("good")[0]
+    writer = _KeepingWriter()
+    pyots.sanitize(f, output=writer)
+    assert b"".join(writer.views) == _expected(f)
+
+
+def test_output_write_error():
+    class Failing:
+        def write(self, data):
+            raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        pyots.sanitize(font_files("good")[0], output=Failing())
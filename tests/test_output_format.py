@@ -0,0 +1,122 @@
+"""
+Tests for writing the sanitized font as WOFF or WOFF2 (sanitize(...,
+output_format=...)): the encoded font must decode to the tables the sfnt
+output has, and the result must otherwise be the same.
+"""
+
+import struct
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+SIGNATURES = {"woff": b"wOFF", "woff2": b"wOF2"}
+
+
+def _fonts():
+    """
+    The good fonts that aren't collections, with their sanitized sfnt.
+    """
+    fonts = []
+    for f in font_files("good"):
+        data = f.read_bytes()
+        result = pyots.sanitize_bytes(data)
+        if result.sanitized and result.data[:4] != b"ttcf":
+            fonts.append((data, result))
+    if not fonts:
+        pytest.skip("no font to test with")
+    return fonts
+
+
+def _collection():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] == b"ttcf" and pyots.sanitize_bytes(data).sanitized:
+            return data
+    pytest.skip("no collection to test with")
+
+
+@pytest.mark.parametrize("output_format", ["woff", "woff2"])
+def test_output_format(output_format):
+    for data, sfnt in _fonts():
+        result = pyots.sanitize_bytes(data, output_format=output_format)
+        assert result.sanitized
+        assert (result.modified, result.changed_tables, result.messages) == (
+            sfnt.modified,
+            sfnt.changed_tables,
+            sfnt.messages,
+        )
+        assert result.data[:4] == SIGNATURES[output_format]
+        # the length in the header is the length of the font
+        assert struct.unpack_from(">L", result.data, 8)[0] == len(result.data)
+
+        # decoding it gives back the sanitized font, table for table
+        decoded = pyots.sanitize_bytes(result.data)
+        assert decoded.sanitized
+        assert decoded.changed_tables == ()
+        assert pyots.sanitize_bytes(decoded.data).data == decoded.data
+
+
+def test_output_format_woff_tables():
+    data, sfnt = _fonts()[0]
+    woff = pyots.sanitize_bytes(data, output_format="woff").data
+    flavor, _, num_tables, _, total_sfnt_size = struct.unpack_from(">4xLLHHL", woff)
+    assert flavor == struct.unpack_from(">L", sfnt.data)[0]
+    assert num_tables == struct.unpack_from(">H", sfnt.data, 4)[0]
+    assert total_sfnt_size == len(sfnt.data)
+    tags = [woff[44 + 20 * i : 48 + 20 * i] for i in range(num_tables)]
+    assert tags == sorted(tags)
+
+
+def test_output_format_collection():
+    data = _collection()
+    result = pyots.sanitize_bytes(data, output_format="woff")
+    assert not result.sanitized
+    assert result.data is None
+    assert "collection can't be encoded as WOFF" in str(result.messages[-1])
+
+    result = pyots.sanitize_bytes(data, workers=2, output_format="woff2")
+    assert result.sanitized
+    assert result.data[:4] == b"wOF2"
+
+
+def test_output_format_paths(tmp_path):
+    f = font_files("good")[0]
+    expected = pyots.sanitize(f, output_format="woff")
+
+    out = tmp_path / "font.woff"
+    pyots.sanitize(f, output=out, output_format="woff")
+    assert out.read_bytes() == pyots.sanitize_bytes(f.read_bytes(), output_format="woff").data
+
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    (result,) = pyots.sanitize_many([f], output_dir=out_dir, output_format="woff")
+    assert result.sanitized == expected.sanitized
+    assert [p.name for p in out_dir.iterdir()] == [f.stem + ".woff"]
+
+    sanitizer = pyots.Sanitizer(output_format="woff")
+    assert sanitizer.sanitize(f.read_bytes()).data == out.read_bytes()
+
+
+def test_output_format_cache():
+    data, _ = _fonts()[0]
+    cache = pyots.SanitizeCache()
+    sfnt = pyots.sanitize_bytes(data, cache=cache).data
+    woff = pyots.sanitize_bytes(data, cache=cache, output_format="woff").data
+    assert cache.hits == 0
+    assert woff[:4] == b"wOFF"
+    assert pyots.sanitize_bytes(data, cache=cache).data == sfnt
+    assert pyots.sanitize_bytes(data, cache=cache, output_format="woff").data == woff
+    assert cache.hits == 2
+
+
+def test_output_format_errors():
+    data, _ = _fonts()[0]
+    with pytest.raises(ValueError):
+        pyots.sanitize_bytes(data, output_format="otf")
+    with pytest.raises(ValueError):
+        pyots.sanitize_bytes(data, output_format=None)
+    with pytest.raises(ValueError):
+        pyots.sanitize_bytes(data, mode="validate", output_format="woff")
+    assert pyots.sanitize_bytes(data, mode="validate", output_format="sfnt").sanitized
@@ -0,0 +1,138 @@
+"""
+Tests for profiling (sanitize(..., profile=True)): OTSResult.timings must
+account for each table of the sanitized font, without changing the result.
+"""
+
+import collections
+import pickle
+import struct
+from pathlib import Path
+
+import pytest
+
+import pyots
+from pyots import OTSTableTiming
+from tests.conftest import font_files
+
+
+def _output_tables(data):
+    """
+    Return {tag: total length} of the tables of a sanitized font (of all the
+    fonts of a collection, shared tables counted once).
+    """
+    if data[:4] == b"ttcf":
+        (num_fonts,) = struct.unpack_from(">L", data, 8)
+        offsets = struct.unpack_from(f">{num_fonts}L", data, 12)
+    else:
+        offsets = (0,)
+
+    lengths = collections.Counter()
+    seen = set()
+    for offset in offsets:
+        (num_tables,) = struct.unpack_from(">H", data, offset + 4)
+        for i in range(num_tables):
+            tag, _, table_offset, length = struct.unpack_from(">4sLLL", data, offset + 12 + 16 * i)
+            if table_offset not in seen:
+                seen.add(table_offset)
+                lengths[tag.decode("latin-1")] += length
+    return lengths
+
+
+def test_profile_timings():
+    for f in font_files("good", "bad", "fuzzing"):
+        data = f.read_bytes()
+        plain = pyots.sanitize_bytes(data)
+        profiled = pyots.sanitize_bytes(data, profile=True)
+
+        assert (profiled.sanitized, profiled.modified, profiled.messages, profiled.data) == (
+            plain.sanitized,
+            plain.modified,
+            plain.messages,
+            plain.data,
+        )
+        assert plain.timings is None
+
+        timings = profiled.timings
+        assert next(iter(timings)) == "header"
+        assert timings["header"].bytes_in == len(data)
+        for timing in timings.values():
+            assert isinstance(timing, OTSTableTiming)
+            assert timing.parse >= 0
+            assert timing.serialize >= 0
+
+        if profiled.sanitized:
+            assert timings["header"].bytes_out == len(profiled.data)
+            out_tables = _output_tables(profiled.data)
+            assert {tag: t.bytes_out for tag, t in timings.items() if tag != "header" and t.bytes_out} == (
+                out_tables
+            )
+        else:
+            assert all(t.bytes_out == 0 for t in timings.values())
+
+
+def test_profile_paths(tmp_path):
+    f = font_files("good")[0]
+    out = tmp_path / f.name
+
+    result = pyots.sanitize(f, output=out, profile=True)
+    assert result.timings["header"].bytes_in == f.stat().st_size
+    assert result.timings["header"].bytes_out == out.stat().st_size
+
+    # the sanitized font is kept for profiling, but not returned
+    result = pyots.sanitize_bytes(f.read_bytes(), mode="validate", profile=True)
+    assert result.sanitized
+    assert result.data is None
+    assert result.timings["header"].bytes_out > 0
+
+
+def test_profile_collection_members():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] != b"ttcf":
+            continue
+        result = pyots.sanitize_bytes(data, workers=2, profile=True)
+        for member in result.members:
+            assert member.timings is not None
+        for tag, timing in result.timings.items():
+            if tag != "header":
+                assert timing.bytes_in == sum(
+                    m.timings[tag].bytes_in for m in result.members if tag in m.timings
+                )
+
+
+def test_profile_pickle():
+    f = font_files("good")[0]
+    r = pyots.sanitize(f, profile=True)
+    p = pickle.loads(pickle.dumps(r))
+    assert p.timings == r.timings
+
+
+def test_profile_no_cache():
+    f = font_files("good")[0]
+    with pytest.raises(ValueError):
+        pyots.sanitize_bytes(f.read_bytes(), cache=pyots.SanitizeCache(), profile=True)
+
+
+def cmp_table_times(fonts=None, top=10):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Profiles the test corpus and prints the tables that take the longest to sanitize:
+        python -c "from tests.test_profile import cmp_table_times; cmp_table_times()"
+    """
+    fonts = [Path(f) for f in (fonts or font_files("good", "bad", "fuzzing"))]
+    totals = collections.defaultdict(lambda: [0.0, 0.0, 0, 0])
+    for f in fonts:
+        for tag, timing in pyots.sanitize(f, quiet=True, profile=True).timings.items():
+            total = totals[tag]
+            total[0] += timing.parse
+            total[1] += timing.serialize
+            total[2] += timing.bytes_in
+            total[3] += timing.bytes_out
+
+    ranked = sorted(totals.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+    for tag, (parse, serialize, bytes_in, bytes_out) in ranked[:top]:
+        rate = bytes_in / (parse + serialize) / 2**20 if parse + serialize else 0.0
+        print(
+            f"[timings] {tag}: parse: {parse}, serialize: {serialize}, "
+            f"{bytes_in} bytes in, {bytes_out} bytes out ({round(rate, 1)} MiB/s)"
+        )
@@ -0,0 +1,75 @@
+"""
+Tests for pyots.sanitize_many(), the batch entry point backed by a native
+thread pool.
+"""
+
+import timeit
+
+import pyots
+from tests.conftest import font_files, summary
+
+
+def test_sanitize_many_matches_sanitize():
+    files = font_files("good", "bad", "fuzzing")
+    expected = [summary(pyots.sanitize(f)) for f in files]
+
+    for workers in (1, 4):
+        results = pyots.sanitize_many(files, workers=workers)
+        assert [summary(r) for r in results] == expected
+
+
+def test_sanitize_many_buffers():
+    files = font_files("good", "bad")
+    results = pyots.sanitize_many([f.read_bytes() for f in files], workers=4)
+
+    for f, r in zip(files, results):
+        expected = pyots.sanitize_bytes(f.read_bytes())
+        assert summary(r) == summary(expected)
+        assert r.data == expected.data
+
+
+def test_sanitize_many_output_dir(tmp_path):
+    files = font_files("good")
+    pyots.sanitize_many(files, output_dir=tmp_path, workers=4)
+
+    for f in files:
+        out_file = tmp_path / f.name
+        assert out_file.exists()
+        assert out_file.read_bytes() == pyots.sanitize_bytes(f.read_bytes()).data
+
+
+def test_sanitize_many_failures_dont_abort(tmp_path):
+    good = font_files("good")
+    missing = tmp_path / "does-not-exist.ttf"
+
+    results = pyots.sanitize_many([good[0], missing, good[-1]], workers=2)
+
+    assert len(results) == 3
+    assert results[0].sanitized
+    assert isinstance(results[1], FileNotFoundError)
+    assert results[1].filename == missing
+    assert results[2].sanitized
+
+
+def test_sanitize_many_empty():
+    assert pyots.sanitize_many([]) == []
+
+
+def cmp_batch_times():
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Compares sanitize_many() against the README's "sanitize a folder" loop:
+        python -c "from tests.test_sanitize_many import cmp_batch_times; cmp_batch_times()"
+    """
+    files = font_files("good", "bad", "fuzzing")
+
+    start = timeit.default_timer()
+    for f in files:
+        _ = pyots.sanitize(f)
+    loop = timeit.default_timer() - start
+
+    start = timeit.default_timer()
+    _ = pyots.sanitize_many(files)
+    batch = timeit.default_timer() - start
+
+    print(f"[timings] loop: {loop}, sanitize_many: {batch} ({round(loop / batch, 1)}x)")
@@ -0,0 +1,85 @@
+"""
+Tests for the reusable sanitizer (pyots.Sanitizer): sanitizing font after font
+with it, from one thread or several, must give the results sanitize() and
+sanitize_bytes() give with the same options.
+"""
+
+import io
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pyots
+from tests.conftest import font_files, summary
+
+# what a Sanitizer's results must agree with sanitize()'s on
+FIELDS = ("changed_tables", "data")
+
+
+def test_sanitizer_matches_functions():
+    files = font_files("good", "bad", "fuzzing")
+    for options in ({}, {"quiet": True}, {"mode": "validate"}, {"table_actions": {"DSIG": "drop"}}):
+        sanitizer = pyots.Sanitizer(**options)
+        # twice over, and largest font first then smallest, so kept buffers
+        # are reused for fonts larger and smaller than the one they were for
+        order = sorted(files, key=lambda f: f.stat().st_size, reverse=True)
+        for f in itertools.chain(order, reversed(order)):
+            data = f.read_bytes()
+            assert summary(sanitizer.sanitize(data), *FIELDS) == summary(
+                pyots.sanitize_bytes(data, **options), *FIELDS
+            )
+            assert summary(sanitizer.sanitize(f), *FIELDS) == summary(pyots.sanitize(f, **options), *FIELDS)
+
+
+def test_sanitizer_output(tmp_path):
+    sanitizer = pyots.Sanitizer()
+    for f in font_files("good"):
+        expected = pyots.sanitize_bytes(f.read_bytes()).data
+        sanitizer.sanitize(f, output=tmp_path / f.name)
+        assert (tmp_path / f.name).read_bytes() == expected
+        fp = io.BytesIO()
+        sanitizer.sanitize(f, output=fp)
+        assert fp.getvalue() == expected
+
+    with pytest.raises(ValueError):
+        sanitizer.sanitize(b"font data", output=tmp_path / "out.ttf")
+    with pytest.raises(ValueError):
+        pyots.Sanitizer(mode="validate").sanitize(f, output=tmp_path / "out.ttf")
+    with pytest.raises(OSError):
+        sanitizer.sanitize(tmp_path / "missing.ttf")
+
+
+def test_sanitizer_threads():
+    files = font_files("good", "bad", "fuzzing") * 4
+    sanitizer = pyots.Sanitizer()
+    serial = [summary(pyots.sanitize_bytes(f.read_bytes()), *FIELDS) for f in files]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        threaded = list(pool.map(lambda f: summary(sanitizer.sanitize(f.read_bytes()), *FIELDS), files))
+    assert threaded == serial
+
+
+def test_sanitizer_cache_and_limits():
+    f = font_files("good")[0]
+    cache = pyots.SanitizeCache()
+    sanitizer = pyots.Sanitizer(cache=cache)
+    first = sanitizer.sanitize(f.read_bytes())
+    assert summary(sanitizer.sanitize(f.read_bytes()), *FIELDS) == summary(first, *FIELDS)
+    assert cache.hits == 1
+
+    with pytest.raises(pyots.MemoryLimitError):
+        pyots.Sanitizer(max_memory=10).sanitize(f)
+
+
+def test_sanitizer_errors():
+    for options in (
+        {"mode": "repair"},
+        {"workers": 0},
+        {"table_actions": {"head": "drop"}},
+        {"max_messages": -1},
+        {"timeout": 0},
+    ):
+        with pytest.raises(ValueError):
+            pyots.Sanitizer(**options)
+    with pytest.raises(ValueError):
+        pyots.Sanitizer(cache=pyots.SanitizeCache(), profile=True)
@@ -0,0 +1,149 @@
+"""
+Tests for choosing what happens to particular tables (sanitize(...,
+table_actions={tag: action})): dropped tables must be gone from the output,
+passed through ones must come out as they went in.
+"""
+
+import struct
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+REQUIRED = {"head", "hhea", "hmtx", "maxp", "cmap", "name", "OS/2", "post"}
+
+
+def _tables(data, offset=0):
+    """
+    Return {tag: table data} for the font whose offset table is at 'offset'
+    in 'data'.
+    """
+    (num_tables,) = struct.unpack_from(">H", data, offset + 4)
+    tables = {}
+    for i in range(num_tables):
+        tag, _, table_offset, length = struct.unpack_from(">4sLLL", data, offset + 12 + 16 * i)
+        tables[tag.decode("latin-1")] = data[table_offset : table_offset + length]
+    return tables
+
+
+def _add_table(font, tag, table):
+    """
+    Return the sfnt font 'font' with 'table' added to it as 'tag'.
+    """
+    tables = _tables(font)
+    tables[tag] = table
+    num_tables = len(tables)
+    offset = 12 + 16 * num_tables
+    directory = b""
+    body = b""
+    for t in sorted(tables):
+        data = tables[t]
+        checksum = sum(struct.unpack(f">{-(-len(data) // 4)}L", data + b"\0" * (-len(data) % 4))) & 0xFFFFFFFF
+        directory += struct.pack(">4sLLL", t.encode("latin-1"), checksum, offset + len(body), len(data))
+        body += data + b"\0" * (-len(data) % 4)
+    header = font[:4] + struct.pack(">H", num_tables) + font[6:12]
+    return header + directory + body
+
+
+def _sfnt_fonts():
+    fonts = []
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] in (b"\0\1\0\0", b"OTTO") and pyots.sanitize_bytes(data).sanitized:
+            fonts.append(data)
+    if not fonts:
+        pytest.skip("no sfnt font to test with")
+    return fonts
+
+
+def test_table_actions_drop():
+    for data in _sfnt_fonts():
+        tags = set(_tables(pyots.sanitize_bytes(data).data)) - REQUIRED
+        for tag in tags:
+            result = pyots.sanitize_bytes(data, table_actions={tag: "drop"})
+            if result.sanitized:
+                assert tag not in _tables(result.data)
+
+
+def test_table_actions_passthrough():
+    for data in _sfnt_fonts():
+        in_tables = _tables(data)
+        for tag in set(in_tables) - REQUIRED:
+            result = pyots.sanitize_bytes(data, table_actions={tag: "passthrough"})
+            if result.sanitized:
+                assert _tables(result.data)[tag] == in_tables[tag]
+
+
+def test_table_actions_defaults():
+    data = _add_table(_sfnt_fonts()[0], "CBDT", b"\0\3\0\0unchecked data")
+    # color bitmap tables are passed through unless asked otherwise
+    assert _tables(pyots.sanitize_bytes(data).data)["CBDT"] == b"\0\3\0\0unchecked data"
+    result = pyots.sanitize_bytes(data, table_actions={"CBDT": "sanitize"})
+    assert result.sanitized
+    assert "CBDT" not in _tables(result.data)
+
+    # unknown tables are dropped, unless they are passed through
+    data = _add_table(_sfnt_fonts()[0], "zzzz", b"1234")
+    assert "zzzz" not in _tables(pyots.sanitize_bytes(data).data)
+    result = pyots.sanitize_bytes(data, table_actions={"zzzz": "passthrough"})
+    assert _tables(result.data)["zzzz"] == b"1234"
+
+
+def test_table_actions_short_tags():
+    data = _add_table(_sfnt_fonts()[0], "zz  ", b"1234")
+    result = pyots.sanitize_bytes(data, table_actions={"zz": "passthrough"})
+    assert _tables(result.data)["zz  "] == b"1234"
+
+
+def test_table_actions_errors():
+    data = _sfnt_fonts()[0]
+    for table_actions in (
+        {"DSIG": "keep"},
+        {"toolong": "drop"},
+        {"": "drop"},
+        {"été": "drop"},
+        {1: "drop"},
+        {"head": "drop"},
+        {"name": "passthrough"},
+    ):
+        with pytest.raises(ValueError):
+            pyots.sanitize_bytes(data, table_actions=table_actions)
+    with pytest.raises(TypeError):
+        pyots.sanitize_bytes(data, table_actions=[("DSIG", "drop")])
+    # required tables can be asked to be sanitized, like any other table
+    assert pyots.sanitize_bytes(data, table_actions={"head": "sanitize"}).sanitized
+
+
+def test_table_actions_many_and_cache():
+    fonts = _sfnt_fonts()
+    tag = min(set(_tables(pyots.sanitize_bytes(fonts[0]).data)) - REQUIRED)
+    table_actions = {tag: "drop"}
+    expected = pyots.sanitize_bytes(fonts[0], table_actions=table_actions).data
+
+    (result,) = pyots.sanitize_many([fonts[0]], table_actions=table_actions)
+    assert result.data == expected
+
+    cache = pyots.SanitizeCache()
+    assert pyots.sanitize_bytes(fonts[0], cache=cache).data == pyots.sanitize_bytes(fonts[0]).data
+    assert pyots.sanitize_bytes(fonts[0], cache=cache, table_actions=table_actions).data == expected
+    assert cache.hits == 0
+
+
+def test_table_actions_collection():
+    for f in font_files("good"):
+        data = f.read_bytes()
+        if data[:4] != b"ttcf":
+            continue
+        # the fonts of a collection sanitized separately get the same actions
+        result = pyots.sanitize_bytes(data, workers=2, table_actions={"GSUB": "drop"})
+        (num_fonts,) = struct.unpack_from(">L", data, 8)
+        for i in range(num_fonts):
+            alone = pyots.sanitize_bytes(data, font_index=i, table_actions={"GSUB": "drop"})
+            assert result.members[i].sanitized == alone.sanitized
+            if alone.sanitized:
+                assert "GSUB" not in _tables(alone.data)
+        if result.sanitized:
+            faces = struct.unpack_from(f">{num_fonts}L", result.data, 12)
+            for face in faces:
+                assert "GSUB" not in _tables(result.data, face)
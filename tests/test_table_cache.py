@@ -0,0 +1,170 @@
+"""
+Tests for memoizing tables across the fonts a Sanitizer sanitizes
+(Sanitizer(table_cache_size=...)): tables that are passed through rather
+than sanitized again must give the font sanitizing it anew gives.
+"""
+
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pyots
+from tests.conftest import font_files
+
+# the tables that can be memoized
+MEMOIZED = {
+    "CFF ",
+    "CFF2",
+    "GSUB",
+    "GPOS",
+    "COLR",
+    "gvar",
+    "HVAR",
+    "VVAR",
+    "MVAR",
+    "avar",
+    "cvar",
+    "STAT",
+    "gasp",
+}
+
+
+def _font():
+    """
+    A sanitized sfnt font with tables that can be memoized.
+    """
+    for f in font_files("good"):
+        result = pyots.sanitize_bytes(f.read_bytes())
+        if not result.sanitized or result.data[:4] not in (b"\0\1\0\0", b"OTTO"):
+            continue
+        if MEMOIZED & set(pyots.inspect(result.data).faces[0].tables):
+            return result.data
+    pytest.skip("no font with tables to memoize")
+
+
+def _patch(font, tag, offset, data):
+    """
+    Return 'font' with 'data' written at 'offset' in its table 'tag'.
+    """
+    table = pyots.inspect(font).faces[0].tables[tag]
+    start = table.offset + offset
+    return font[:start] + data + font[start + len(data) :]
+
+
+def _change_maxp(font):
+    """
+    Return 'font' with a maxp table that differs, but not in a way that
+    changes how the other tables are sanitized.
+    """
+    table = pyots.inspect(font).faces[0].tables["maxp"]
+    if table.length >= 32:
+        return _patch(font, "maxp", 24, struct.pack(">H", 1234))  # maxStackElements
+    return _patch(font, "maxp", 0, struct.pack(">L", 0x00005000))
+
+
+def _same(result, expected):
+    return (result.sanitized, result.data, result.messages, result.changed_tables) == (
+        expected.sanitized,
+        expected.data,
+        expected.messages,
+        expected.changed_tables,
+    )
+
+
+def test_table_cache():
+    sanitizer = pyots.Sanitizer(table_cache_size=2**20)
+    for f in font_files("good", "bad", "fuzzing"):
+        data = f.read_bytes()
+        expected = pyots.sanitize_bytes(data)
+        for _ in range(2):
+            assert _same(sanitizer.sanitize(data), expected)
+
+    info = sanitizer.table_cache_info()
+    assert info.hits > 0
+    assert info.entries > 0
+    assert info.hits + info.misses >= info.entries
+
+
+def test_table_cache_metadata_change():
+    font = _font()
+    memoized = len(MEMOIZED & set(pyots.inspect(font).faces[0].tables))
+    sanitizer = pyots.Sanitizer(quiet=True, table_cache_size=2**20)
+    sanitizer.sanitize(font)
+    assert sanitizer.table_cache_info()[:2] == (0, memoized)
+
+    # a new fontRevision: only the head table differs
+    revised = _patch(font, "head", 4, struct.pack(">L", 0x00028000))
+    result = sanitizer.sanitize(revised)
+    assert _same(result, pyots.sanitize_bytes(revised, quiet=True))
+    assert sanitizer.table_cache_info()[:2] == (memoized, memoized)
+
+
+def test_table_cache_without_output(tmp_path):
+    # the sanitized font isn't kept: tables are memoized if OTS copied them
+    font = _font()
+    memoized = len(MEMOIZED & set(pyots.inspect(font).faces[0].tables) - {"STAT", "gasp"})
+    path = tmp_path / "font.otf"
+    path.write_bytes(font)
+    sanitizer = pyots.Sanitizer(quiet=True, table_cache_size=2**20)
+    for _ in range(2):
+        result = sanitizer.sanitize(path)
+        assert result.data is None
+        assert _same(result, pyots.sanitize(path, quiet=True))
+    assert sanitizer.table_cache_info().hits == memoized
+
+
+def test_table_cache_dependency_change():
+    font = _font()
+    tables = set(pyots.inspect(font).faces[0].tables)
+    sanitizer = pyots.Sanitizer(quiet=True, table_cache_size=2**20)
+    sanitizer.sanitize(font)
+
+    # the tables that depend on maxp are sanitized again when it changes
+    changed = _change_maxp(font)
+    result = sanitizer.sanitize(changed)
+    assert _same(result, pyots.sanitize_bytes(changed, quiet=True))
+    independent = {"MVAR", "avar", "cvar", "STAT", "gasp"} & tables
+    assert sanitizer.table_cache_info().hits == len(independent)
+
+
+def test_table_cache_size():
+    font = _font()
+    sanitizer = pyots.Sanitizer(table_cache_size=1)
+    for _ in range(2):
+        sanitizer.sanitize(font)
+    info = sanitizer.table_cache_info()
+    assert (info.hits, info.entries, info.bytes) == (0, 0, 0)
+
+    sanitizer = pyots.Sanitizer(table_cache_size=2**20)
+    sanitizer.sanitize(font)
+    full = sanitizer.table_cache_info()
+    assert 0 < full.bytes <= 2**20
+
+    # the least recently used tables make room for new ones
+    sanitizer = pyots.Sanitizer(table_cache_size=full.bytes)
+    sanitizer.sanitize(font)
+    sanitizer.sanitize(_change_maxp(font))
+    info = sanitizer.table_cache_info()
+    assert info.bytes <= full.bytes
+    assert info.entries == full.entries
+
+
+def test_table_cache_threads():
+    font = _font()
+    expected = pyots.sanitize_bytes(font)
+    sanitizer = pyots.Sanitizer(table_cache_size=2**20)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(sanitizer.sanitize, [font] * 32))
+    assert all(_same(result, expected) for result in results)
+    assert sanitizer.table_cache_info().hits > 0
+
+
+def test_table_cache_errors():
+    assert pyots.Sanitizer().table_cache_info() is None
+    with pytest.raises(ValueError):
+        pyots.Sanitizer(table_cache_size=0)
+    with pytest.raises(ValueError):
+        pyots.Sanitizer(table_cache_size=2**20, cache=pyots.SanitizeCache())
+    with pytest.raises(ValueError):
+        pyots.Sanitizer(table_cache_size=2**20, mode="validate")
@@ -0,0 +1,152 @@
+"""
+Tests for running pyots.sanitize() from multiple threads. The native
+sanitization releases the GIL, so results must be identical to the serial path
+and throughput should scale with the number of threads.
+"""
+
+import os
+import subprocess
+import sys
+import sysconfig
+import textwrap
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pyots
+from tests.conftest import font_files, summary
+
+
+def _run(files, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(pyots.sanitize, files))
+
+
+def test_threaded_matches_serial():
+    files = font_files("good", "bad", "fuzzing")
+    serial = [summary(pyots.sanitize(f)) for f in files]
+
+    for threads in (2, 4, 8):
+        threaded = [summary(r) for r in _run(files, threads)]
+        assert threaded == serial, f"threaded ({threads}) results differ from serial results"
+
+
+def test_threaded_write(tmp_path):
+    files = font_files("good")
+
+    serial_dir = tmp_path / "serial"
+    threaded_dir = tmp_path / "threaded"
+    serial_dir.mkdir()
+    threaded_dir.mkdir()
+
+    for f in files:
+        pyots.sanitize(f, output=serial_dir / f.name)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda f: pyots.sanitize(f, output=threaded_dir / f.name), files))
+
+    for f in files:
+        assert (threaded_dir / f.name).read_bytes() == (serial_dir / f.name).read_bytes()
+
+
+def test_threaded_cache_write(tmp_path):
+    # the threads write the same outputs and cache entries at the same time,
+    # each through a temporary file of its own
+    files = font_files("good")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    cache = pyots.SanitizeCache(tmp_path / "cache")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda f: pyots.sanitize(f, output=out_dir / f.name, cache=cache), files * 8))
+
+    for f in files:
+        assert (out_dir / f.name).read_bytes() == pyots.sanitize_bytes(f.read_bytes()).data
+    assert sorted(p.name for p in out_dir.iterdir()) == sorted(f.name for f in files)
+    assert not [p for p in (tmp_path / "cache").iterdir() if p.suffix == ".tmp"]
+
+
+@pytest.mark.skipif(not sysconfig.get_config_var("Py_GIL_DISABLED"), reason="needs a free-threaded build")
+def test_free_threaded_gil_stays_disabled():
+    # importing a module that doesn't declare Py_mod_gil re-enables the GIL
+    code = "import sys, pyots; sys.exit(sys._is_gil_enabled())"
+    proc = subprocess.run([sys.executable, "-c", code], check=False)
+    assert proc.returncode == 0
+
+
+def test_subinterpreter(tmp_path):
+    try:
+        import _interpreters as interpreters
+    except ImportError:
+        interpreters = pytest.importorskip("_xxsubinterpreters")
+
+    f = _largest_good_font()
+    out = tmp_path / "result.txt"
+    code = textwrap.dedent(
+        f"""
+        import sys
+        sys.path[:] = {sys.path!r}
+        import pyots
+        result = pyots.sanitize({str(f)!r})
+        try:
+            pyots.sanitize_bytes(b"font", max_memory=1)
+        except pyots.MemoryLimitError:
+            limited = True
+        with open({str(out)!r}, "w") as fp:
+            fp.write(repr((result.sanitized, len(result.messages), limited)))
+        """
+    )
+    interp = interpreters.create()
+    try:
+        interpreters.run_string(interp, code)
+    finally:
+        interpreters.destroy(interp)
+
+    # the module is initialized separately for each interpreter
+    result = pyots.sanitize(f)
+    assert out.read_text() == repr((result.sanitized, len(result.messages), True))
+
+
+def _largest_good_font():
+    good = font_files("good")
+    return max(good, key=lambda f: f.stat().st_size)
+
+
+def _time_threads(font, count, threads):
+    start = timeit.default_timer()
+    _run([font] * count, threads)
+    return timeit.default_timer() - start
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason="needs at least 4 CPUs to measure scaling")
+def test_threaded_scaling():
+    font = _largest_good_font()
+
+    # size the workload so the serial run takes long enough to measure reliably
+    count = 8
+    while _time_threads(font, count, 1) < 0.5 and count < 8192:
+        count *= 2
+
+    serial = min(_time_threads(font, count, 1) for _ in range(3))
+    threaded = min(_time_threads(font, count, 4) for _ in range(3))
+
+    assert serial / threaded > 1.5, f"4 threads: {threaded:.3f}s vs. serial: {serial:.3f}s"
+
+
+def cmp_thread_scaling(max_threads=None):
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Prints throughput of the whole test corpus for an increasing number of threads:
+        python -c "from tests.test_threads import cmp_thread_scaling; cmp_thread_scaling()"
+    """
+    files = font_files("good", "bad", "fuzzing")
+    max_threads = max_threads or os.cpu_count() or 1
+
+    threads = 1
+    while threads <= max_threads:
+        start = timeit.default_timer()
+        _run(files, threads)
+        elapsed = timeit.default_timer() - start
+        print(f"[threads] {threads}: {elapsed:.3f}s ({len(files) / elapsed:.1f} fonts/s)")
+        threads *= 2
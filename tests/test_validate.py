@@ -0,0 +1,81 @@
+"""
+Tests for mode="validate": OTS stops at the first error, and the verdict must
+agree with full sanitization for every font that doesn't need fixing.
+"""
+
+import timeit
+
+import pytest
+
+import pyots
+from pyots import OTSMessage
+from tests.conftest import font_files
+
+
+def _errors(result):
+    return [m for m in result.messages if m.level == OTSMessage.ERROR]
+
+
+def test_validate_verdicts():
+    for f in font_files("good", "bad", "fuzzing"):
+        full = pyots.sanitize(f)
+        v = pyots.sanitize(f, mode="validate")
+
+        if not full.sanitized:
+            assert not v.sanitized, f"{f} validated, but fails to sanitize"
+        elif not _errors(full):
+            assert v.sanitized, f"{f} sanitizes without errors, but didn't validate"
+        else:
+            # OTS recovered from an error (e.g. by dropping a table), which
+            # validating doesn't
+            assert not v.sanitized, f"{f} validated despite errors"
+
+        if not v.sanitized:
+            assert len(v.messages) >= 1
+            assert _errors(v) == _errors(full)[:1], f"{f} reported a different first error"
+            # (the warnings before it are reported too)
+            assert v.messages[-1] == _errors(v)[0]
+
+
+def test_validate_no_output(tmp_path):
+    f = font_files("good")[0]
+    assert pyots.sanitize_bytes(f.read_bytes(), mode="validate").data is None
+
+    with pytest.raises(ValueError):
+        pyots.sanitize(f, output=tmp_path / f.name, mode="validate")
+    with pytest.raises(ValueError):
+        pyots.sanitize_many([f], output_dir=tmp_path, mode="validate")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_validate_many():
+    files = font_files("good", "bad")
+    expected = [pyots.sanitize(f, mode="validate").sanitized for f in files]
+    assert [r.sanitized for r in pyots.sanitize_many(files, mode="validate")] == expected
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        pyots.sanitize(font_files("good")[0], mode="check")
+
+
+def cmp_validate_times():
+    """
+    This is intentionally not a test_ method and won't be run as part of the test suite.
+    Compares validating the test corpus against fully sanitizing it:
+        python -c "from tests.test_validate import cmp_validate_times; cmp_validate_times()"
+    """
+    for subdirs in (("good",), ("bad", "fuzzing")):
+        files = font_files(*subdirs)
+        rd = {}
+        for mode in ("sanitize", "validate"):
+            start = timeit.default_timer()
+            for f in files:
+                _ = pyots.sanitize(f, mode=mode)
+            rd[mode] = timeit.default_timer() - start
+
+        xtime = rd["sanitize"] / rd["validate"]
+        print(
+            f"[timings] {'+'.join(subdirs)}: sanitize: {rd['sanitize']}, "
+            f"validate: {rd['validate']} ({round(xtime, 1)}x)"
+        )